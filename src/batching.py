@@ -0,0 +1,112 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+from logs import LOGGER
+
+
+class BatchStats:
+    """
+    批处理统计: 批大小填充率与排队等待时间, 用于调整 BATCH_SIZE / BATCH_WAIT_MS
+    """
+
+    def __init__(self, max_batch_size):
+        self.max_batch_size = max_batch_size
+        self.lock = threading.Lock()
+        self.batches = 0
+        self.items = 0
+        self.full_batches = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.forward_total = 0.0
+
+    def record(self, size, waits, forward_seconds):
+        with self.lock:
+            self.batches += 1
+            self.items += size
+            if size >= self.max_batch_size:
+                self.full_batches += 1
+            self.wait_total += sum(waits)
+            self.wait_max = max(self.wait_max, max(waits))
+            self.forward_total += forward_seconds
+
+    def snapshot(self):
+        with self.lock:
+            batches = self.batches or 1
+            items = self.items or 1
+            return {
+                "batches": self.batches,
+                "items": self.items,
+                "max_batch_size": self.max_batch_size,
+                "avg_batch_size": self.items / batches,
+                "avg_batch_fill": self.items / batches / self.max_batch_size,
+                "full_batch_ratio": self.full_batches / batches,
+                "avg_queue_wait_ms": self.wait_total / items * 1000,
+                "max_queue_wait_ms": self.wait_max * 1000,
+                "avg_forward_ms": self.forward_total / batches * 1000,
+            }
+
+
+class BatchScheduler:
+    """
+    动态微批调度器: 所有请求放入同一个队列, 按最大批大小或最大等待时间分组,
+    每批只做一次前向计算, 再把结果逐个交还给调用方。
+
+    Args:
+        handler (`callable`):
+            接收一个输入列表, 返回等长的结果列表。
+        max_batch_size (`int`):
+            每批最多的输入数量。
+        max_wait_ms (`float`):
+            第一个输入到达后最多等待多久再发车。
+    """
+
+    def __init__(self, handler, max_batch_size=16, max_wait_ms=5.0, name="batcher"):
+        self.handler = handler
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max(0.0, float(max_wait_ms)) / 1000
+        self.stats = BatchStats(self.max_batch_size)
+        self.queue = queue.Queue()
+        self.thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self.thread.start()
+
+    def submit(self, item):
+        future = Future()
+        self.queue.put((item, future, time.perf_counter()))
+        return future
+
+    def __call__(self, item):
+        return self.submit(item).result()
+
+    def _collect(self):
+        batch = [self.queue.get()]
+        deadline = time.perf_counter() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self.queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            start = time.perf_counter()
+            waits = [start - enqueued for _, _, enqueued in batch]
+            items = [item for item, _, _ in batch]
+            try:
+                results = self.handler(items)
+                if len(results) != len(items):
+                    raise RuntimeError(f"batch handler returned {len(results)} results for {len(items)} inputs")
+            except Exception as e:
+                LOGGER.error(f"Failed to run batch of {len(items)}: {e}")
+                for _, future, _ in batch:
+                    future.set_exception(e)
+                continue
+            self.stats.record(len(items), waits, time.perf_counter() - start)
+            for (_, future, _), result in zip(batch, results):
+                future.set_result(result)
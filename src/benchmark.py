@@ -0,0 +1,808 @@
+"""
+性能基准测试, 使用临时的 Milvus Lite 数据库, 不影响 ./data 下的数据。
+
+    python benchmark.py dimension --rows 20000
+    python benchmark.py load --url http://127.0.0.1:5000 --image test.jpg --concurrency 32
+    python benchmark.py groups --groups 1,10,100,1000
+    python benchmark.py index --index HNSW:'{"M": 16, "efConstruction": 200}' --index IVF_FLAT --ef 16,64,256
+    python benchmark.py storage --mode float32:HNSW --mode float16:HNSW --mode float32:IVF_SQ8 --mode float16:FLAT+hash1024
+    python benchmark.py parity --images ./samples --backend onnx:int8
+    python benchmark.py inference --images ./samples --backend towhee --backend onnx --backend onnx:int8 --threads 4
+    python benchmark.py decode --megapixels 1,12,24,48
+    python benchmark.py fetch --image test.jpg --requests 500 --concurrency 32
+    python benchmark.py exact --rows 100000 --storage float32,float16 --groups 100
+    python benchmark.py phash --images ./samples --distance 4,6,8,10
+"""
+import argparse
+import asyncio
+import functools
+import http.client
+import json
+import mimetypes
+import os
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import quote, urlparse
+from urllib.request import urlopen
+
+import numpy as np
+
+from encode import EMBEDDING_MODEL
+from fetcher import UrlFetcher
+from index_config import index_settings
+from inference import load_backend
+from ingest import list_images
+from milvus_helpers import MilvusHelper
+from numpy_store import NumpyStore, exact_search
+from phash import BKTree, content_hash
+from preprocess import decode_image, load_image
+
+
+def random_vectors(rows, dimension, seed=0):
+    rng = np.random.default_rng(seed)
+    matrix = rng.standard_normal((rows, dimension)).astype(np.float32)
+    matrix /= np.linalg.norm(matrix, axis=1, keepdims=True)
+    return matrix
+
+
+def percentiles(samples):
+    samples = np.asarray(samples) * 1000
+    return {
+        "p50_ms": float(np.percentile(samples, 50)),
+        "p99_ms": float(np.percentile(samples, 99)),
+        "mean_ms": float(np.mean(samples)),
+    }
+
+
+def timed(fn, repeats):
+    samples = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def dir_size(path):
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            total += os.path.getsize(os.path.join(root, name))
+    return total
+
+
+def hnsw_memory(rows, dimension, m=16, bytes_per_value=4):
+    # HNSW 常驻内存估算: 原始向量 + 每层约 2*M 个邻居 id
+    return rows * (dimension * bytes_per_value + 2 * m * 8)
+
+
+def vector_memory(rows, dimension, storage="float32", index_type="FLAT", params=None, hash_bits=0):
+    """
+    向量常驻内存估算: 原始向量按存储精度计, SQ8 每分量 1 字节, PQ 每向量 m * nbits 位, 再加二值哈希
+    """
+    _, params = index_settings("", index_type, params)
+    value_bytes = 2 if storage == "float16" else 4
+    if index_type == "IVF_SQ8":
+        per_vector = dimension
+    elif index_type == "IVF_PQ":
+        per_vector = params["m"] * params["nbits"] / 8
+    elif index_type == "HNSW":
+        return hnsw_memory(rows, dimension, params["M"], value_bytes) + rows * hash_bits / 8
+    else:
+        per_vector = dimension * value_bytes
+    return rows * (per_vector + hash_bits / 8)
+
+
+class TempMilvus:
+    """
+    临时 Milvus 实例, 默认为临时目录下的 Milvus Lite;
+    Milvus Lite 只支持 FLAT 索引, 比较索引类型时通过 uri 指定 Milvus 服务端
+    """
+
+    def __init__(self, dimension, uri=None):
+        self.path = tempfile.mkdtemp(prefix="bench_milvus_")
+        self.remote = uri is not None
+        self.cli = MilvusHelper(uri=uri or os.path.join(self.path, "bench.db"), dimension=dimension)
+        self.collections = []
+
+    def close(self):
+        if self.remote:
+            for collection_name in self.collections:
+                self.cli.client.drop_collection(collection_name)
+        self.cli.client.close()
+        shutil.rmtree(self.path, ignore_errors=True)
+
+
+def fill(cli, collection_name, matrix, batch_size=2000, index_type=None, index_params=None, groups=None,
+         group_field=True, storage=None, hash_bits=None):
+    cli.create_collection(collection_name, index_type=index_type, index_params=index_params, group_field=group_field,
+                          storage=storage, hash_bits=hash_bits)
+    for start in range(0, len(matrix), batch_size):
+        rows = []
+        for i, vector in enumerate(matrix[start:start + batch_size]):
+            meta = {} if groups is None else {"group": f"g{(start + i) % groups}"}
+            rows.append({"uuid": str(start + i), "md5": "", "meta": meta, "embedding": vector})
+        cli.insert_rows(collection_name, rows)
+    if isinstance(cli, MilvusHelper):
+        cli.client.flush(collection_name)
+    cli.load(collection_name)
+
+
+def bench_dimension(args):
+    native = random_vectors(args.rows, args.native)
+    queries = random_vectors(args.queries, args.native, seed=1)
+    report = []
+    for label, dimension in (("padded", args.padded), ("native", args.native)):
+        matrix = native if dimension == args.native else np.pad(native, ((0, 0), (0, dimension - args.native)))
+        query_matrix = queries if dimension == args.native else np.pad(queries, ((0, 0), (0, dimension - args.native)))
+        db = TempMilvus(dimension)
+        try:
+            start = time.perf_counter()
+            fill(db.cli, "bench", matrix)
+            insert_seconds = time.perf_counter() - start
+            it = iter(query_matrix)
+            samples = timed(lambda: db.cli.client.search("bench", data=[next(it)], limit=args.topk,
+                                                         anns_field="embedding"), args.queries)
+            report.append({
+                "mode": label,
+                "dimension": dimension,
+                "insert_s": insert_seconds,
+                "disk_mb": dir_size(db.path) / 2 ** 20,
+                "est_index_mb": hnsw_memory(args.rows, dimension) / 2 ** 20,
+                **percentiles(samples),
+            })
+        finally:
+            db.close()
+    print_table(report)
+
+
+def bench_groups(args):
+    # 分组搜索延迟: meta JSON 路径过滤 vs group partition key, 分组数逐步增加
+    base = random_vectors(args.rows, args.dimension)
+    queries = random_vectors(args.queries, args.dimension, seed=1)
+    db = TempMilvus(args.dimension, uri=args.uri)
+    report = []
+    try:
+        for groups in [int(v) for v in args.groups.split(",")]:
+            for mode, group_field in (("json", False), ("partition_key", True)):
+                collection_name = f"bench_groups_{mode}_{groups}"
+                db.collections.append(collection_name)
+                fill(db.cli, collection_name, base, groups=groups, group_field=group_field)
+                it = iter(queries)
+                samples = timed(lambda: db.cli.search_vectors(collection_name, [next(it)], args.topk,
+                                                              f"g{args.queries % groups}"), args.queries)
+                report.append({"groups": groups, "mode": mode, **percentiles(samples)})
+                if not db.remote:
+                    db.cli.delete_collection(collection_name)
+    finally:
+        db.close()
+    print_table(report)
+
+
+def exact_topk(base, queries, k, block=8192):
+    # 暴力搜索真值: 归一化向量上 L2 与内积的排序一致
+    return exact_search(base, queries, k, "IP", block=block)[0]
+
+
+def recall_at_k(results, truth, k):
+    hits = 0
+    for found, expected in zip(results, truth):
+        hits += len(set(found[:k]) & set(expected[:k].tolist()))
+    return hits / (len(truth) * k)
+
+
+def parse_index_spec(spec):
+    # "HNSW" 或 "HNSW:{\"M\": 32}"
+    index_type, _, params = spec.partition(":")
+    return index_type.upper(), json.loads(params) if params else None
+
+
+def bench_index(args):
+    if args.npy:
+        data = np.load(args.npy, mmap_mode="r").astype(np.float32)
+        data /= np.linalg.norm(data, axis=1, keepdims=True)
+        base, queries = data[:-args.queries], data[-args.queries:]
+    else:
+        base = random_vectors(args.rows, args.dimension)
+        queries = random_vectors(args.queries, args.dimension, seed=1)
+    truth = exact_topk(base, queries, args.topk)
+    db = TempMilvus(base.shape[1], uri=args.uri)
+    report = []
+    try:
+        for n, spec in enumerate(args.index):
+            index_type, index_params = parse_index_spec(spec)
+            collection_name = f"bench_index_{n}"
+            db.collections.append(collection_name)
+            start = time.perf_counter()
+            fill(db.cli, collection_name, base, index_type=index_type, index_params=index_params)
+            build_seconds = time.perf_counter() - start
+            key = "ef" if index_type == "HNSW" else "nprobe"
+            values = [None] if index_type == "FLAT" else [int(v) for v in getattr(args, key).split(",")]
+            for value in values:
+                overrides = {key: value} if value is not None else None
+                results = []
+                samples = []
+                for query in queries:
+                    started = time.perf_counter()
+                    res = db.cli.search_vectors(collection_name, [query], args.topk, None, overrides)
+                    samples.append(time.perf_counter() - started)
+                    results.append([int(hit["entity"]["uuid"]) for hit in res[0]])
+                report.append({
+                    "index": index_type,
+                    "build": json.dumps(index_params or {}),
+                    "search": f"{key}={value}" if value is not None else "-",
+                    "build_s": build_seconds,
+                    f"recall@{args.topk}": recall_at_k(results, truth, args.topk),
+                    "qps": len(queries) / sum(samples),
+                    **percentiles(samples),
+                })
+    finally:
+        db.close()
+    print_table(report)
+
+
+def search_report(cli, collection_name, queries, truth, args):
+    # 单查询延迟与召回, 分组搜索延迟, 一次批量搜索全部查询的吞吐
+    results = []
+    samples = []
+    for query in queries:
+        started = time.perf_counter()
+        res = cli.search_vectors(collection_name, [query], args.topk, None)
+        samples.append(time.perf_counter() - started)
+        results.append([int(hit["entity"]["uuid"]) for hit in res[0]])
+    it = iter(queries)
+    group_samples = timed(lambda: cli.search_vectors(collection_name, [next(it)], args.topk, "g0"), len(queries))
+    started = time.perf_counter()
+    cli.search_vectors(collection_name, queries, args.topk, None)
+    batch_seconds = time.perf_counter() - started
+    return {
+        f"recall@{args.topk}": recall_at_k(results, truth, args.topk),
+        **percentiles(samples),
+        "group_p50_ms": float(np.percentile(group_samples, 50) * 1000),
+        "batch_qps": len(queries) / batch_seconds,
+    }
+
+
+def bench_exact(args):
+    # NumPy 精确搜索引擎: 写入耗时, 重新打开 (mmap + 回放行日志) 耗时, 搜索延迟; 可选与 Milvus 索引对比
+    base = random_vectors(args.rows, args.dimension)
+    queries = random_vectors(args.queries, args.dimension, seed=1)
+    truth = exact_topk(base, queries, args.topk)
+    path = tempfile.mkdtemp(prefix="bench_numpy_")
+    report = []
+    try:
+        for storage in args.storage.split(","):
+            collection_name = f"bench_exact_{storage}"
+            store = NumpyStore(path, args.dimension)
+            start = time.perf_counter()
+            fill(store, collection_name, base, groups=args.groups, storage=storage)
+            build_seconds = time.perf_counter() - start
+            store.collection(collection_name).close()
+            start = time.perf_counter()
+            store = NumpyStore(path, args.dimension)
+            store.count(collection_name)
+            open_ms = (time.perf_counter() - start) * 1000
+            report.append({"engine": f"numpy:{storage}", "build_s": build_seconds, "open_ms": open_ms,
+                           **search_report(store, collection_name, queries, truth, args)})
+            store.collection(collection_name).close()
+        if args.index:
+            index_type, index_params = parse_index_spec(args.index)
+            db = TempMilvus(args.dimension, uri=args.uri)
+            try:
+                db.collections.append("bench_exact")
+                start = time.perf_counter()
+                fill(db.cli, "bench_exact", base, index_type=index_type, index_params=index_params, groups=args.groups)
+                build_seconds = time.perf_counter() - start
+                report.append({"engine": f"milvus:{index_type}", "build_s": build_seconds, "open_ms": 0.0,
+                               **search_report(db.cli, "bench_exact", queries, truth, args)})
+            finally:
+                db.close()
+    finally:
+        shutil.rmtree(path, ignore_errors=True)
+    print_table(report)
+
+
+def parse_storage_spec(spec):
+    # "float16:HNSW" 或 "float32:FLAT+hash1024"
+    spec, _, hash_bits = spec.partition("+hash")
+    storage, _, index_type = spec.partition(":")
+    return storage.lower(), (index_type or "FLAT").upper(), int(hash_bits) if hash_bits else 0
+
+
+def bench_storage(args):
+    # 各存储模式的 recall@k / QPS 与估算常驻内存
+    if args.npy:
+        data = np.load(args.npy, mmap_mode="r").astype(np.float32)
+        data /= np.linalg.norm(data, axis=1, keepdims=True)
+        base, queries = data[:-args.queries], data[-args.queries:]
+    else:
+        base = random_vectors(args.rows, args.dimension)
+        queries = random_vectors(args.queries, args.dimension, seed=1)
+    truth = exact_topk(base, queries, args.topk)
+    db = TempMilvus(base.shape[1], uri=args.uri)
+    report = []
+    baseline = None
+    try:
+        for n, spec in enumerate(args.mode):
+            storage, index_type, hash_bits = parse_storage_spec(spec)
+            collection_name = f"bench_storage_{n}"
+            db.collections.append(collection_name)
+            start = time.perf_counter()
+            fill(db.cli, collection_name, base, index_type=index_type, storage=storage, hash_bits=hash_bits)
+            build_seconds = time.perf_counter() - start
+            results = []
+            samples = []
+            for query in queries:
+                started = time.perf_counter()
+                res = db.cli.search_vectors(collection_name, [query], args.topk, None)
+                samples.append(time.perf_counter() - started)
+                results.append([int(hit["entity"]["uuid"]) for hit in res[0]])
+            memory = vector_memory(len(base), base.shape[1], storage, index_type, hash_bits=hash_bits)
+            if baseline is None:
+                baseline = memory
+            report.append({
+                "mode": spec,
+                "build_s": build_seconds,
+                "est_mem_mb": memory / 2 ** 20,
+                "bytes_per_image": memory / len(base),
+                "mem_ratio": baseline / memory,
+                f"recall@{args.topk}": recall_at_k(results, truth, args.topk),
+                "qps": len(queries) / sum(samples),
+                **percentiles(samples),
+            })
+            if not db.remote:
+                db.cli.delete_collection(collection_name)
+    finally:
+        db.close()
+    print_table(report)
+
+
+def load_corpus(img_dir, limit):
+    # 解码后的 BGR 图片, 推理基准不计入解码时间
+    from towhee.types import Image
+    images = []
+    for path in list_images(img_dir, recursive=True):
+        _, _, image, error = load_image(path)
+        if error is None:
+            images.append(Image(image, 'BGR'))
+        if len(images) >= limit:
+            break
+    if not images:
+        raise SystemExit(f"no readable images under {img_dir}")
+    return images
+
+
+def parse_backend_spec(spec):
+    # "onnx" 或 "onnx:int8"
+    backend, _, option = spec.partition(":")
+    return backend.lower(), option.lower() == "int8"
+
+
+def embed_all(model, images, batch_size):
+    feats = []
+    for start in range(0, len(images), batch_size):
+        feats += [np.asarray(feat, dtype=np.float32).ravel() for feat in model(images[start:start + batch_size])]
+    return np.stack(feats)
+
+
+def bench_parity(args):
+    # 与当前 towhee eager 向量的余弦相似度, 低于阈值时以非零状态退出
+    images = load_corpus(args.images, args.limit)
+    reference = embed_all(load_backend(EMBEDDING_MODEL, "towhee"), images, args.batch)
+    reference /= np.linalg.norm(reference, axis=1, keepdims=True)
+    report = []
+    failed = False
+    for spec in args.backend:
+        backend, int8 = parse_backend_spec(spec)
+        feats = embed_all(load_backend(EMBEDDING_MODEL, backend, int8, threads=args.threads), images, args.batch)
+        feats /= np.linalg.norm(feats, axis=1, keepdims=True)
+        cosine = np.sum(reference * feats, axis=1)
+        # 以参考向量为库, 检查每张图片的最近邻是否仍是自己
+        top1 = np.mean(np.argmax(feats @ reference.T, axis=1) == np.arange(len(images)))
+        passed = bool(cosine.min() >= args.threshold)
+        failed = failed or not passed
+        report.append({
+            "backend": spec,
+            "images": len(images),
+            "min_cosine": float(cosine.min()),
+            "mean_cosine": float(cosine.mean()),
+            "p1_cosine": float(np.percentile(cosine, 1)),
+            "self_top1": float(top1),
+            "pass": passed,
+        })
+    print_table(report)
+    if failed:
+        raise SystemExit(1)
+
+
+def bench_inference(args):
+    # 各后端吞吐: 每秒图片数, 以及按 intra-op 线程数折算的每核吞吐
+    images = load_corpus(args.images, args.limit)
+    batches = [images[start:start + args.batch] for start in range(0, len(images), args.batch)]
+    report = []
+    for spec in args.backend:
+        backend, int8 = parse_backend_spec(spec)
+        model = load_backend(EMBEDDING_MODEL, backend, int8, threads=args.threads)
+        for batch in batches[:args.warmup]:
+            model(batch)
+        samples = []
+        for _ in range(args.repeats):
+            for batch in batches:
+                start = time.perf_counter()
+                model(batch)
+                samples.append(time.perf_counter() - start)
+        seconds = sum(samples)
+        throughput = len(images) * args.repeats / seconds
+        report.append({
+            "backend": spec,
+            "batch": args.batch,
+            "threads": args.threads,
+            "images_per_s": throughput,
+            "images_per_s_per_core": throughput / args.threads,
+            **percentiles(samples),
+        })
+    print_table(report)
+
+
+def synthetic_jpegs(megapixels, per_size, seed=0):
+    # 混合分辨率的 4:3 JPEG, 平滑渐变加噪声, 压缩率接近照片
+    import cv2
+    rng = np.random.default_rng(seed)
+    corpus = []
+    for mp in megapixels:
+        width = int((mp * 1e6 * 4 / 3) ** 0.5)
+        height = int(width * 3 / 4)
+        small = rng.integers(0, 256, (height // 32 + 1, width // 32 + 1, 3), dtype=np.uint8)
+        image = cv2.resize(small, (width, height), interpolation=cv2.INTER_CUBIC)
+        ok, encoded = cv2.imencode(".jpg", image, [cv2.IMWRITE_JPEG_QUALITY, 90])
+        corpus += [encoded.tobytes()] * per_size
+    return corpus
+
+
+def near_duplicate_variants(content):
+    # 缩小一半后重新压缩, 以及同尺寸低质量重新压缩 (同时去掉 EXIF 等元数据)
+    import cv2
+    image = decode_image(content, min_side=0)
+    half = cv2.resize(image, (image.shape[1] // 2, image.shape[0] // 2), interpolation=cv2.INTER_AREA)
+    return [cv2.imencode(".jpg", half, [cv2.IMWRITE_JPEG_QUALITY, 80])[1].tobytes(),
+            cv2.imencode(".jpg", image, [cv2.IMWRITE_JPEG_QUALITY, 60])[1].tobytes()]
+
+
+def bench_phash(args):
+    # 感知哈希近似去重: 计算耗时, 副本的检出率, 不同图片被误判的比例, BK 树查询耗时
+    originals = []
+    for path in list_images(args.images, recursive=True):
+        with open(path, "rb") as f:
+            originals.append(f.read())
+        if len(originals) >= args.limit:
+            break
+    if not originals:
+        raise SystemExit(f"no images under {args.images}")
+    variants = [(index, variant) for index, content in enumerate(originals)
+                for variant in near_duplicate_variants(content)]
+    report = []
+    for algorithm in args.algorithm.split(","):
+        started = time.perf_counter()
+        hashes = [content_hash(content, algorithm) for content in originals]
+        hash_ms = (time.perf_counter() - started) * 1000 / len(originals)
+        tree = BKTree()
+        for index, value in enumerate(hashes):
+            tree.add(value, index)
+        variant_hashes = [(index, content_hash(content, algorithm)) for index, content in variants]
+        for distance in [int(v) for v in args.distance.split(",")]:
+            found = 0
+            false_matches = 0
+            samples = []
+            for index, value in variant_hashes:
+                started = time.perf_counter()
+                matches = tree.search(value, distance)
+                samples.append(time.perf_counter() - started)
+                found += any(item == index for _, item in matches)
+                false_matches += any(item != index for _, item in matches)
+            report.append({
+                "algorithm": algorithm,
+                "distance": distance,
+                "hash_ms": hash_ms,
+                "detected": found / len(variant_hashes),
+                "false_match": false_matches / len(variant_hashes),
+                "lookup_us": float(np.mean(samples) * 1e6),
+            })
+    print_table(report)
+
+
+def decode_worker(corpus, min_side, conn):
+    # 在独立进程中解码, ru_maxrss 只反映该模式的峰值内存
+    import resource
+    before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    samples = []
+    pixels = 0
+    for content in corpus:
+        start = time.perf_counter()
+        image = decode_image(content, min_side)
+        samples.append(time.perf_counter() - start)
+        pixels += image.shape[0] * image.shape[1]
+        del image
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux 上 ru_maxrss 单位为 KB
+    conn.send((samples, pixels / len(corpus), before / 1024, peak / 1024))
+    conn.close()
+
+
+def bench_decode(args):
+    from multiprocessing import get_context
+    if args.images:
+        corpus = []
+        for path in list_images(args.images, recursive=True):
+            with open(path, "rb") as f:
+                corpus.append(f.read())
+            if len(corpus) >= args.limit:
+                break
+    else:
+        corpus = synthetic_jpegs([float(v) for v in args.megapixels.split(",")], args.per_size)
+    ctx = get_context("spawn")
+    report = []
+    for mode, min_side in (("full", 0), ("reduced", args.min_side)):
+        receiver, sender = ctx.Pipe(duplex=False)
+        worker = ctx.Process(target=decode_worker, args=(corpus, min_side, sender))
+        worker.start()
+        samples, avg_pixels, base_mb, peak_mb = receiver.recv()
+        worker.join()
+        report.append({
+            "mode": mode,
+            "images": len(corpus),
+            "avg_decoded_mp": avg_pixels / 1e6,
+            "images_per_s": len(samples) / sum(samples),
+            "peak_rss_mb": peak_mb,
+            "decode_rss_mb": peak_mb - base_mb,
+            **percentiles(samples),
+        })
+    print_table(report)
+
+
+class StaticHandler(SimpleHTTPRequestHandler):
+    # HTTP/1.1 才能复用连接
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+
+def bench_fetch(args):
+    # 本地 HTTP 服务代替外部图床: 逐个 urlopen (每次新建连接) vs 共享连接池的异步下载
+    directory, name = os.path.split(os.path.abspath(args.image))
+    server = ThreadingHTTPServer(("127.0.0.1", 0), functools.partial(StaticHandler, directory=directory))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_port}/{quote(name)}"
+    report = []
+    try:
+        def fetch_urllib(_):
+            start = time.perf_counter()
+            with urlopen(url, timeout=args.timeout) as response:
+                response.read()
+            return time.perf_counter() - start
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(args.concurrency) as pool:
+            samples = list(pool.map(fetch_urllib, range(args.requests)))
+        report.append({"client": "urllib", "requests": args.requests,
+                       "rps": args.requests / (time.perf_counter() - start), **percentiles(samples)})
+
+        async def fetch_pooled():
+            fetcher = UrlFetcher(timeout=args.timeout, concurrency=args.concurrency)
+
+            async def one():
+                started = time.perf_counter()
+                await fetcher.fetch(url)
+                return time.perf_counter() - started
+
+            try:
+                return await asyncio.gather(*(one() for _ in range(args.requests)))
+            finally:
+                await fetcher.close()
+
+        start = time.perf_counter()
+        samples = asyncio.run(fetch_pooled())
+        report.append({"client": "httpx_pool", "requests": args.requests,
+                       "rps": args.requests / (time.perf_counter() - start), **percentiles(samples)})
+    finally:
+        server.shutdown()
+    print_table(report)
+
+
+def multipart_body(fields, files):
+    # 手工构造 multipart/form-data, 压测客户端不依赖第三方库
+    boundary = uuid.uuid4().hex
+    parts = []
+    for name, value in fields.items():
+        parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode())
+    for name, path in files:
+        with open(path, "rb") as f:
+            content = f.read()
+        filename = os.path.basename(path)
+        content_type = mimetypes.guess_type(path)[0] or "application/octet-stream"
+        parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"; filename="{filename}"\r\n'
+                     f'Content-Type: {content_type}\r\n\r\n'.encode() + content + b"\r\n")
+    parts.append(f"--{boundary}--\r\n".encode())
+    return b"".join(parts), f"multipart/form-data; boundary={boundary}"
+
+
+def bench_load(args):
+    # 并发请求 /img/search, 统计延迟分位数、吞吐与状态码 (429/503 表示被背压拒绝)
+    target = urlparse(args.url)
+    fields = {"topk": args.topk}
+    if args.group:
+        fields["group"] = args.group
+    body, content_type = multipart_body(fields, [("image", args.image)])
+    local = threading.local()
+
+    def request(_):
+        if not hasattr(local, "conn"):
+            local.conn = http.client.HTTPConnection(target.hostname, target.port or 80, timeout=args.timeout)
+        start = time.perf_counter()
+        try:
+            local.conn.request("POST", args.path, body=body, headers={"Content-Type": content_type})
+            response = local.conn.getresponse()
+            response.read()
+            status = response.status
+        except Exception as e:
+            local.conn.close()
+            del local.conn
+            status = type(e).__name__
+        return status, time.perf_counter() - start
+
+    for _ in range(args.warmup):
+        request(None)
+    start = time.perf_counter()
+    with ThreadPoolExecutor(args.concurrency) as pool:
+        results = list(pool.map(request, range(args.requests)))
+    elapsed = time.perf_counter() - start
+    codes = Counter(status for status, _ in results)
+    ok = [seconds for status, seconds in results if status == 200]
+    report = {"concurrency": args.concurrency, "requests": args.requests, "rps": len(results) / elapsed,
+              "ok": len(ok)}
+    if ok:
+        report.update(percentiles(ok))
+    print_table([report])
+    print("status codes:", dict(codes))
+
+
+def print_table(report):
+    if not report:
+        return
+    keys = list(report[0].keys())
+    print(" | ".join(keys))
+    for row in report:
+        print(" | ".join(f"{row[key]:.2f}" if isinstance(row[key], float) else str(row[key]) for key in keys))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="reverse-image-search benchmarks")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    dim_parser = sub.add_parser("dimension", help="padded 8192-d vs native-d storage and search latency")
+    dim_parser.add_argument("--rows", type=int, default=20000)
+    dim_parser.add_argument("--queries", type=int, default=200)
+    dim_parser.add_argument("--topk", type=int, default=10)
+    dim_parser.add_argument("--native", type=int, default=1408)
+    dim_parser.add_argument("--padded", type=int, default=8192)
+    dim_parser.set_defaults(func=bench_dimension)
+
+    load_parser = sub.add_parser("load", help="concurrent /img/search latency against a running server")
+    load_parser.add_argument("--url", default="http://127.0.0.1:5000")
+    load_parser.add_argument("--path", default="/img/search")
+    load_parser.add_argument("--image", required=True)
+    load_parser.add_argument("--group", default=None)
+    load_parser.add_argument("--topk", type=int, default=10)
+    load_parser.add_argument("--concurrency", type=int, default=32)
+    load_parser.add_argument("--requests", type=int, default=500)
+    load_parser.add_argument("--warmup", type=int, default=5)
+    load_parser.add_argument("--timeout", type=float, default=60)
+    load_parser.set_defaults(func=bench_load)
+
+    groups_parser = sub.add_parser("groups", help="grouped search latency: JSON meta filter vs partition key")
+    groups_parser.add_argument("--groups", default="1,10,100,1000")
+    groups_parser.add_argument("--rows", type=int, default=50000)
+    groups_parser.add_argument("--dimension", type=int, default=1408)
+    groups_parser.add_argument("--queries", type=int, default=200)
+    groups_parser.add_argument("--topk", type=int, default=10)
+    groups_parser.add_argument("--uri", default=None, help="Milvus server uri")
+    groups_parser.set_defaults(func=bench_groups)
+
+    index_parser = sub.add_parser("index", help="recall@k vs QPS of index types and search params")
+    index_parser.add_argument("--index", action="append", default=None,
+                              help='index spec, e.g. HNSW or HNSW:\'{"M": 32}\' (repeatable)')
+    index_parser.add_argument("--ef", default="16,32,64,128,256")
+    index_parser.add_argument("--nprobe", default="1,4,16,64")
+    index_parser.add_argument("--rows", type=int, default=50000)
+    index_parser.add_argument("--dimension", type=int, default=1408)
+    index_parser.add_argument("--queries", type=int, default=200)
+    index_parser.add_argument("--topk", type=int, default=10)
+    index_parser.add_argument("--npy", default=None, help="real embeddings (.npy); the last --queries rows are queries")
+    index_parser.add_argument("--uri", default=None, help="Milvus server uri, Milvus Lite only builds FLAT")
+    index_parser.set_defaults(func=bench_index)
+
+    storage_parser = sub.add_parser("storage", help="recall vs memory of float32/float16/SQ8/PQ and hash rerank")
+    storage_parser.add_argument("--mode", action="append", default=None,
+                                help="storage:index[+hash<bits>], e.g. float16:HNSW or float32:FLAT+hash1024 "
+                                     "(repeatable, the first mode is the memory baseline)")
+    storage_parser.add_argument("--rows", type=int, default=50000)
+    storage_parser.add_argument("--dimension", type=int, default=1408)
+    storage_parser.add_argument("--queries", type=int, default=200)
+    storage_parser.add_argument("--topk", type=int, default=10)
+    storage_parser.add_argument("--npy", default=None, help="real embeddings (.npy); the last --queries rows are queries")
+    storage_parser.add_argument("--uri", default=None, help="Milvus server uri, Milvus Lite only builds FLAT")
+    storage_parser.set_defaults(func=bench_storage)
+
+    parity_parser = sub.add_parser("parity", help="cosine similarity of backend embeddings vs towhee eager")
+    parity_parser.add_argument("--images", required=True, help="image directory")
+    parity_parser.add_argument("--backend", action="append", default=None, help="onnx, onnx:int8 or torchscript")
+    parity_parser.add_argument("--limit", type=int, default=200)
+    parity_parser.add_argument("--batch", type=int, default=16)
+    parity_parser.add_argument("--threads", type=int, default=os.cpu_count() or 1)
+    parity_parser.add_argument("--threshold", type=float, default=0.99)
+    parity_parser.set_defaults(func=bench_parity)
+
+    inference_parser = sub.add_parser("inference", help="images/sec per core of the inference backends")
+    inference_parser.add_argument("--images", required=True, help="image directory")
+    inference_parser.add_argument("--backend", action="append", default=None,
+                                  help="towhee, onnx, onnx:int8 or torchscript (repeatable)")
+    inference_parser.add_argument("--limit", type=int, default=256)
+    inference_parser.add_argument("--batch", type=int, default=16)
+    inference_parser.add_argument("--threads", type=int, default=os.cpu_count() or 1)
+    inference_parser.add_argument("--warmup", type=int, default=2)
+    inference_parser.add_argument("--repeats", type=int, default=3)
+    inference_parser.set_defaults(func=bench_inference)
+
+    decode_parser = sub.add_parser("decode", help="full vs reduced-resolution JPEG decode time and peak RSS")
+    decode_parser.add_argument("--images", default=None, help="image directory, synthetic JPEGs if omitted")
+    decode_parser.add_argument("--limit", type=int, default=200)
+    decode_parser.add_argument("--megapixels", default="1,12,24,48", help="synthetic corpus resolutions")
+    decode_parser.add_argument("--per-size", type=int, default=5)
+    decode_parser.add_argument("--min-side", type=int, default=320)
+    decode_parser.set_defaults(func=bench_decode)
+
+    fetch_parser = sub.add_parser("fetch", help="urllib vs pooled async url fetching against a local HTTP server")
+    fetch_parser.add_argument("--image", required=True)
+    fetch_parser.add_argument("--requests", type=int, default=500)
+    fetch_parser.add_argument("--concurrency", type=int, default=32)
+    fetch_parser.add_argument("--timeout", type=float, default=15)
+    fetch_parser.set_defaults(func=bench_fetch)
+
+    exact_parser = sub.add_parser("exact", help="numpy exact-search store: reopen time, latency and recall vs milvus")
+    exact_parser.add_argument("--rows", type=int, default=100000)
+    exact_parser.add_argument("--dimension", type=int, default=1408)
+    exact_parser.add_argument("--queries", type=int, default=200)
+    exact_parser.add_argument("--topk", type=int, default=10)
+    exact_parser.add_argument("--groups", type=int, default=100)
+    exact_parser.add_argument("--storage", default="float32,float16")
+    exact_parser.add_argument("--index", default="FLAT", help="milvus index to compare against, empty to skip")
+    exact_parser.add_argument("--uri", help="milvus server uri; Milvus Lite only supports FLAT")
+    exact_parser.set_defaults(func=bench_exact)
+
+    phash_parser = sub.add_parser("phash", help="perceptual-hash near-duplicate detection rate and lookup time")
+    phash_parser.add_argument("--images", required=True, help="image directory")
+    phash_parser.add_argument("--limit", type=int, default=1000)
+    phash_parser.add_argument("--algorithm", default="phash,dhash")
+    phash_parser.add_argument("--distance", default="4,6,8,10")
+    phash_parser.set_defaults(func=bench_phash)
+
+    args = parser.parse_args()
+    if args.command == "parity" and not args.backend:
+        args.backend = ["onnx", "onnx:int8", "torchscript"]
+    if args.command == "inference" and not args.backend:
+        args.backend = ["towhee", "onnx", "onnx:int8", "torchscript"]
+    if args.command == "index" and not args.index:
+        args.index = ["FLAT", "HNSW", "IVF_FLAT"]
+    if args.command == "storage" and not args.mode:
+        args.mode = ["float32:HNSW", "float16:HNSW", "float32:IVF_SQ8", "float32:IVF_PQ", "float16:IVF_SQ8+hash1024"]
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+"""
+图片文件存储: 按内容 (md5) 寻址, 以哈希前缀分两级目录, 单个目录内的文件数保持在数千以内。
+
+    <BLOB_PATH>/ab/cd/abcd...ef.jpg        原图
+    <BLOB_PATH>/ab/cd/abcd...ef.thumb.jpg  缩略图
+
+相同内容只保存一次; 键不变则内容不变, 下载可以长期缓存。
+旧版本上传的 <UPLOAD_PATH>/<uuid>.<ext> 平铺文件仍可读取。
+"""
+import os
+import shutil
+import uuid
+
+from config import BLOB_PATH, UPLOAD_PATH
+from metrics import span
+
+
+class BlobStore:
+    """
+    图片文件存储接口, 键为 blob_key / thumbnail_key 生成的文件名
+    """
+
+    def path(self, key):
+        raise NotImplementedError
+
+    def put(self, key, content):
+        raise NotImplementedError
+
+    def put_file(self, key, source):
+        with open(source, "rb") as f:
+            return self.put(key, f.read())
+
+    def exists(self, key):
+        return os.path.exists(self.path(key))
+
+    def delete(self, key):
+        raise NotImplementedError
+
+    def bury(self, key):
+        raise NotImplementedError
+
+    def restore(self, key, tomb):
+        raise NotImplementedError
+
+
+class ShardedBlobStore(BlobStore):
+    """
+    本地文件系统实现, 写入临时文件后原子替换, 读者不会看到写了一半的文件。
+
+    Args:
+        root (`str`):
+            存储根目录。
+    """
+
+    def __init__(self, root=BLOB_PATH):
+        self.root = root
+
+    def path(self, key):
+        return os.path.join(self.root, key[0:2], key[2:4], key)
+
+    def put(self, key, content):
+        """
+        :return: 文件路径, 已存在相同键时不重复写入
+        """
+        path = self.path(key)
+        if os.path.exists(path):
+            return path
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{uuid.uuid4().hex}.tmp"
+        with span("file_write"):
+            with open(tmp, "wb") as f:
+                f.write(content)
+            os.replace(tmp, path)
+        return path
+
+    def put_file(self, key, source):
+        """
+        复制本地文件, 不把整个文件读入内存
+        :return: 文件路径, 已存在相同键时不重复写入
+        """
+        path = self.path(key)
+        if os.path.exists(path):
+            return path
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{uuid.uuid4().hex}.tmp"
+        with span("file_write"):
+            shutil.copyfile(source, tmp)
+            os.replace(tmp, path)
+        return path
+
+    def delete(self, key):
+        """
+        :return: 释放的字节数, 文件不存在时为 0
+        """
+        return remove_file(self.path(key))
+
+    def bury(self, key):
+        """
+        清理的第一步: 把文件原子改名为墓碑, 之后写入的同一内容会生成新文件而不是被跳过
+        :return: 墓碑路径, 文件不存在时为 None
+        """
+        path = self.path(key)
+        tomb = f"{path}.{uuid.uuid4().hex}.deleted"
+        try:
+            os.rename(path, tomb)
+        except FileNotFoundError:
+            return None
+        return tomb
+
+    def restore(self, key, tomb):
+        # 确认仍被引用时放回原处, 期间重新写入的文件内容相同, 直接覆盖
+        os.replace(tomb, self.path(key))
+
+
+BLOB_STORE = ShardedBlobStore()
+
+
+def blob_key(md5, ext):
+    return f"{md5}.{ext}"
+
+
+def thumbnail_key(md5):
+    return f"{md5}.thumb.jpg"
+
+
+def remove_file(path):
+    try:
+        size = os.path.getsize(path)
+        os.remove(path)
+        return size
+    except FileNotFoundError:
+        return 0
+
+
+def row_location(uuid, md5, meta, store=BLOB_STORE):
+    """
+    行 -> (ext, 原图路径, 缩略图路径), 没有 md5 的旧数据缩略图路径为 None
+    """
+    ext = meta["ext"]
+    thumbnail = store.path(thumbnail_key(md5)) if md5 else None
+    if meta.get("blob"):
+        return ext, store.path(meta["blob"]), thumbnail
+    # 旧的平铺文件
+    return ext, os.path.join(UPLOAD_PATH, f"{uuid}.{ext}"), thumbnail
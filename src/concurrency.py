@@ -0,0 +1,96 @@
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+from config import INFERENCE_WORKERS, MILVUS_WORKERS, IO_WORKERS
+from logs import LOGGER
+from metrics import IN_FLIGHT
+
+# 推理 (解码 + 等待微批结果) / Milvus 调用 / 文件与网络 I/O 各用一个有界线程池,
+# 请求处理函数只在事件循环上 await, 不再直接执行阻塞代码
+INFERENCE_POOL = ThreadPoolExecutor(INFERENCE_WORKERS, thread_name_prefix="inference")
+MILVUS_POOL = ThreadPoolExecutor(MILVUS_WORKERS, thread_name_prefix="milvus")
+IO_POOL = ThreadPoolExecutor(IO_WORKERS, thread_name_prefix="io")
+
+
+async def run_in_pool(pool, fn, *args, **kwargs):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(pool, functools.partial(fn, *args, **kwargs))
+
+
+async def run_inference(fn, *args, **kwargs):
+    return await run_in_pool(INFERENCE_POOL, fn, *args, **kwargs)
+
+
+async def run_milvus(fn, *args, **kwargs):
+    return await run_in_pool(MILVUS_POOL, fn, *args, **kwargs)
+
+
+async def run_io(fn, *args, **kwargs):
+    return await run_in_pool(IO_POOL, fn, *args, **kwargs)
+
+
+class Overloaded(Exception):
+    def __init__(self, status_code, msg):
+        super().__init__(msg)
+        self.status_code = status_code
+        self.msg = msg
+
+
+class AdmissionLimiter:
+    """
+    请求准入控制: 最多 max_active 个请求同时处理, 最多 max_waiting 个排队。
+    排队已满返回 429, 排队超过 wait_timeout 秒返回 503, 避免延迟无限增长。
+
+    作为 FastAPI 依赖使用: `Depends(SEARCH_LIMITER)`。
+    """
+
+    def __init__(self, name, max_active, max_waiting, wait_timeout):
+        self.name = name
+        self.max_active = max_active
+        self.max_waiting = max_waiting
+        self.wait_timeout = wait_timeout
+        self.semaphore = asyncio.Semaphore(max_active)
+        self.waiting = 0
+        self.active = 0
+        self.rejected = 0
+
+    async def acquire(self):
+        if self.semaphore.locked() and self.waiting >= self.max_waiting:
+            self.rejected += 1
+            LOGGER.warning(f"{self.name} queue is full, rejecting request")
+            raise Overloaded(429, "服务繁忙, 请稍后重试")
+        self.waiting += 1
+        IN_FLIGHT.labels(self.name, "waiting").inc()
+        try:
+            await asyncio.wait_for(self.semaphore.acquire(), self.wait_timeout)
+        except asyncio.TimeoutError:
+            self.rejected += 1
+            LOGGER.warning(f"{self.name} waited more than {self.wait_timeout}s, rejecting request")
+            raise Overloaded(503, "服务繁忙, 排队超时")
+        finally:
+            self.waiting -= 1
+            IN_FLIGHT.labels(self.name, "waiting").dec()
+        # 显式计数正在处理的请求, 不读取 Semaphore 的私有字段
+        self.active += 1
+        IN_FLIGHT.labels(self.name, "active").inc()
+
+    def release(self):
+        self.active -= 1
+        IN_FLIGHT.labels(self.name, "active").dec()
+        self.semaphore.release()
+
+    async def __call__(self):
+        await self.acquire()
+        try:
+            yield
+        finally:
+            self.release()
+
+    def snapshot(self):
+        return {
+            "max_active": self.max_active,
+            "active": self.active,
+            "waiting": self.waiting,
+            "rejected": self.rejected,
+        }
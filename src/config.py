@@ -1,12 +1,127 @@
 import os
 
-VECTOR_DIMENSION = int(os.getenv("VECTOR_DIMENSION", "8192"))
+# 向量维度, 0 表示使用模型的原生输出维度 (efficientnet_b2 为 1408), 不再补零
+VECTOR_DIMENSION = int(os.getenv("VECTOR_DIMENSION", "0"))
 INDEX_FILE_SIZE = int(os.getenv("INDEX_FILE_SIZE", "1024"))
 METRIC_TYPE = os.getenv("METRIC_TYPE", "L2")
+# 向量索引: HNSW / IVF_FLAT / IVF_PQ / IVF_SQ8 / FLAT, 构建参数与搜索参数为 JSON, 留空使用该类型的默认值
+INDEX_TYPE = os.getenv("INDEX_TYPE", "HNSW")
+INDEX_PARAMS = os.getenv("INDEX_PARAMS", "")
+SEARCH_PARAMS = os.getenv("SEARCH_PARAMS", "")
+# 向量存储精度: float32 / float16; 更小的内存占用还可以配合 IVF_SQ8 / IVF_PQ 索引
+VECTOR_STORAGE = os.getenv("VECTOR_STORAGE", "float32")
+# 二值签名哈希位数 (8 的倍数), 大于 0 时新集合增加 hash 字段, 搜索先按汉明距离粗筛再精确重排
+HASH_BITS = int(os.getenv("HASH_BITS", "0"))
+HASH_SEED = int(os.getenv("HASH_SEED", "0"))
+# 粗筛候选数 = top_k * HASH_RERANK
+HASH_RERANK = int(os.getenv("HASH_RERANK", "10"))
+HASH_INDEX_TYPE = os.getenv("HASH_INDEX_TYPE", "BIN_FLAT")
+# uuid / md5 标量索引类型: INVERTED 或 Trie
+SCALAR_INDEX_TYPE = os.getenv("SCALAR_INDEX_TYPE", "INVERTED")
+# 按集合覆盖, 例如 {"default": {"index_type": "IVF_FLAT", "params": {"nlist": 4096}, "search_params": {"nprobe": 32},
+#                               "storage": "float16", "hash_bits": 1024}}
+COLLECTION_INDEXES = os.getenv("COLLECTION_INDEXES", "")
 DEFAULT_TABLE = os.getenv("DEFAULT_TABLE", "default")
+# 分组 partition key 的分区数
+GROUP_PARTITIONS = int(os.getenv("GROUP_PARTITIONS", "64"))
 TOP_K = int(os.getenv("TOP_K", "10"))
+# 启用的模型能力 (逗号分隔): image / clip_image / clip_text / caption, HTTP 接口只需要 image
+MODELS = [name.strip() for name in os.getenv("MODELS", "image").split(",") if name.strip()]
+# 启动时在后台加载并预热启用的模型, 为 0 时首个请求触发加载
+WARMUP = os.getenv("WARMUP", "1") != "0"
+# 图片向量推理后端: towhee (eager PyTorch) / onnx / torchscript, 导出的模型缓存在 MODEL_CACHE_PATH
+INFERENCE_BACKEND = os.getenv("INFERENCE_BACKEND", "towhee")
+# 动态 int8 量化 (onnx 后端)
+INFERENCE_INT8 = os.getenv("INFERENCE_INT8", "0") == "1"
+# 单次前向的 intra-op / inter-op 线程数
+INFERENCE_THREADS = int(os.getenv("INFERENCE_THREADS", str(os.cpu_count() or 1)))
+INFERENCE_INTEROP_THREADS = int(os.getenv("INFERENCE_INTEROP_THREADS", "1"))
+MODEL_CACHE_PATH = os.getenv("MODEL_CACHE_PATH", os.path.join(os.getenv("DATA_PATH", "data"), "models"))
+# 解码: JPEG 缩小解码后短边的下限 (模型输入约 260px, 0 表示总是全分辨率), 以及图片字节数/像素数上限
+DECODE_MIN_SIDE = int(os.getenv("DECODE_MIN_SIDE", "320"))
+MAX_IMAGE_BYTES = int(os.getenv("MAX_IMAGE_BYTES", str(50 * 2 ** 20)))
+MAX_IMAGE_PIXELS = int(os.getenv("MAX_IMAGE_PIXELS", str(80_000_000)))
+# OpenCV 解码时的像素上限 (首次解码时读取), 文件头无法识别的图片也受限制
+os.environ.setdefault("OPENCV_IO_MAX_IMAGE_PIXELS", str(MAX_IMAGE_PIXELS))
+# 近似去重 (默认关闭): 感知哈希算法 (phash / dhash, 为空时不计算), 汉明距离不超过阈值视为重复 (负数表示只保存不比较)
+PHASH = os.getenv("PHASH", "")
+PHASH_DISTANCE = int(os.getenv("PHASH_DISTANCE", "6"))
+# URL 下载: 总耗时 / 连接超时秒数, 响应大小上限, 连接池大小与同时下载数; 批量 URL 导入每次最多的 URL 数
+FETCH_TIMEOUT = float(os.getenv("FETCH_TIMEOUT", "15"))
+FETCH_CONNECT_TIMEOUT = float(os.getenv("FETCH_CONNECT_TIMEOUT", "3"))
+FETCH_MAX_BYTES = int(os.getenv("FETCH_MAX_BYTES", str(MAX_IMAGE_BYTES)))
+FETCH_MAX_CONNECTIONS = int(os.getenv("FETCH_MAX_CONNECTIONS", "64"))
+FETCH_CONCURRENCY = int(os.getenv("FETCH_CONCURRENCY", "32"))
+UPLOAD_URLS_MAX = int(os.getenv("UPLOAD_URLS_MAX", "256"))
+# 动态微批: 每批最多图片数 / 首张图片到达后最长等待毫秒数
+BATCH_SIZE = int(os.getenv("BATCH_SIZE", "16"))
+BATCH_WAIT_MS = float(os.getenv("BATCH_WAIT_MS", "5"))
+# 遍历/导出集合时每批读取的行数 (Milvus 单次查询上限 16384)
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", "2000"))
+# 批量搜索接口每次最多的图片数
+BATCH_SEARCH_MAX = int(os.getenv("BATCH_SEARCH_MAX", "64"))
+# 查询缓存: 上传内容 MD5 -> 向量, 以及短期的 top-k 结果缓存 (TTL 为 0 时关闭)
+EMBEDDING_CACHE_MB = float(os.getenv("EMBEDDING_CACHE_MB", "64"))
+EMBEDDING_CACHE_TTL = float(os.getenv("EMBEDDING_CACHE_TTL", "3600"))
+RESULT_CACHE_MB = float(os.getenv("RESULT_CACHE_MB", "16"))
+RESULT_CACHE_TTL = float(os.getenv("RESULT_CACHE_TTL", "30"))
+# 下载接口 uuid -> (ext, path) 缓存
+DOWNLOAD_CACHE_MB = float(os.getenv("DOWNLOAD_CACHE_MB", "8"))
+DOWNLOAD_CACHE_TTL = float(os.getenv("DOWNLOAD_CACHE_TTL", "86400"))
 
 UPLOAD_PATH = os.getenv("UPLOAD_PATH", "data/upload")
 DATA_PATH = os.getenv("DATA_PATH", "data")
+# 按内容寻址的图片存储目录, 上传/导入时生成的缩略图长边像素 (0 表示不生成), 下载响应的缓存秒数
+BLOB_PATH = os.getenv("BLOB_PATH", os.path.join(DATA_PATH, "blobs"))
+THUMBNAIL_SIZE = int(os.getenv("THUMBNAIL_SIZE", "256"))
+DOWNLOAD_MAX_AGE = int(os.getenv("DOWNLOAD_MAX_AGE", str(365 * 86400)))
+MILVUS_URI = os.getenv("MILVUS_URI", "./data/milvus_data.db")
 
 LOGS_NUM = int(os.getenv("logs_num", "0"))
+
+# 批量导入: 解码进程数 / 推理批大小 / 每次写入 Milvus 的行数
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", str(os.cpu_count() or 1)))
+INGEST_BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", "32"))
+INGEST_INSERT_BATCH = int(os.getenv("INGEST_INSERT_BATCH", "2048"))
+# 服务内的导入任务队列: 任务数据目录, 所有进程合计同时运行的任务数, 每个任务的解码进程数 (默认一半 CPU),
+# 心跳间隔与判定任务中断的心跳超时秒数, 有搜索在处理时每批推理前最多让出的秒数
+JOBS_PATH = os.getenv("JOBS_PATH", os.path.join(os.getenv("DATA_PATH", "data"), "jobs"))
+JOB_CONCURRENCY = int(os.getenv("JOB_CONCURRENCY", "1"))
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", str(max(1, (os.cpu_count() or 1) // 2))))
+JOB_HEARTBEAT_S = float(os.getenv("JOB_HEARTBEAT_S", "5"))
+JOB_STALE_S = float(os.getenv("JOB_STALE_S", "60"))
+INGEST_YIELD_S = float(os.getenv("INGEST_YIELD_S", "0.2"))
+
+# 并发模型: 推理线程 (解码 + 等待微批) / Milvus 调用线程 / 文件与网络 I/O 线程
+INFERENCE_WORKERS = int(os.getenv("INFERENCE_WORKERS", str(BATCH_SIZE * 2)))
+MILVUS_WORKERS = int(os.getenv("MILVUS_WORKERS", "8"))
+IO_WORKERS = int(os.getenv("IO_WORKERS", "8"))
+# 背压: 同时处理的请求数 / 排队上限 / 排队超时秒数, 超出返回 429 / 503
+MAX_ACTIVE_REQUESTS = int(os.getenv("MAX_ACTIVE_REQUESTS", "64"))
+MAX_QUEUED_REQUESTS = int(os.getenv("MAX_QUEUED_REQUESTS", "256"))
+QUEUE_TIMEOUT = float(os.getenv("QUEUE_TIMEOUT", "10"))
+
+# 删除与压缩: 批量删除单次最多的 uuid 数 / 每次 `uuid in [...]` 删除的 uuid 数;
+# 已删除行占比不低于 COMPACT_DELETED_RATIO 且不少于 COMPACT_MIN_DELETED 行时后台自动压缩,
+# 以及检查间隔、等待压缩完成的超时秒数与压缩前后测量搜索延迟的查询数
+DELETE_MAX_UUIDS = int(os.getenv("DELETE_MAX_UUIDS", "100000"))
+DELETE_BATCH = int(os.getenv("DELETE_BATCH", "5000"))
+COMPACT_DELETED_RATIO = float(os.getenv("COMPACT_DELETED_RATIO", "0.2"))
+COMPACT_MIN_DELETED = int(os.getenv("COMPACT_MIN_DELETED", "1000"))
+COMPACT_CHECK_S = float(os.getenv("COMPACT_CHECK_S", "60"))
+COMPACT_TIMEOUT_S = float(os.getenv("COMPACT_TIMEOUT_S", "3600"))
+COMPACT_PROBES = int(os.getenv("COMPACT_PROBES", "20"))
+
+# 多进程部署 (serve.py): 索引进程地址 (unix socket 路径或 host:port) 与认证密钥, 为空时单进程运行
+INDEX_OWNER_ADDRESS = os.getenv("INDEX_OWNER_ADDRESS", "")
+INDEX_OWNER_AUTHKEY = os.getenv("INDEX_OWNER_AUTHKEY", "")
+SERVE_WORKERS = int(os.getenv("SERVE_WORKERS", str(os.cpu_count() or 1)))
+# worker 向索引进程传递向量的共享内存: 槽数 / 每槽大小, 以及查询缓存失效的轮询间隔
+SHM_SLOTS = int(os.getenv("SHM_SLOTS", "16"))
+SHM_SLOT_MB = float(os.getenv("SHM_SLOT_MB", "1"))
+CHANGE_POLL_S = float(os.getenv("CHANGE_POLL_S", "1"))
+
+# 向量存储后端: milvus (默认) 或 numpy (内存映射 .npy 精确搜索), 以及 numpy 的数据目录与每块行数
+VECTOR_STORE = os.getenv("VECTOR_STORE", "milvus")
+NUMPY_STORE_PATH = os.getenv("NUMPY_STORE_PATH", os.path.join(DATA_PATH, "numpy_store"))
+EXACT_SEARCH_BLOCK = int(os.getenv("EXACT_SEARCH_BLOCK", "65536"))
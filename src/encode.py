@@ -1,17 +1,28 @@
+import os
+import threading
+import time
+
 import numpy as np
 import towhee
+from towhee.types import Image
 
-from config import VECTOR_DIMENSION
+from batching import BatchScheduler
+from config import VECTOR_DIMENSION, BATCH_SIZE, BATCH_WAIT_MS, MODELS
+from inference import load_backend
+from logs import LOGGER
+from metrics import span
+from preprocess import decode_image
 
 
-def normalize_and_adjust(vector: np.ndarray) -> np.ndarray:
-    dimension = VECTOR_DIMENSION
+def normalize_and_adjust(vector: np.ndarray, dimension: int = VECTOR_DIMENSION) -> np.ndarray:
     # Step 1: 归一化向量 (L2 Norm)
     norm = np.linalg.norm(vector)
     if norm > 0:
         vector = vector / norm
 
-    # Step 2: 调整维度
+    # Step 2: 调整维度 (dimension <= 0 时保持模型原生维度)
+    if dimension <= 0:
+        return vector
     if len(vector) < dimension:
         # 如果向量长度不足，则补 0
         vector = np.pad(vector, (0, dimension - len(vector)), 'constant')
@@ -21,51 +32,180 @@ def normalize_and_adjust(vector: np.ndarray) -> np.ndarray:
 
     return vector
 
+# efficientnet_b2 的原生输出维度, 已知时不需要为读取维度而加载模型
+EMBEDDING_MODEL = 'efficientnet_b2'
+NATIVE_DIMENSIONS = {'efficientnet_b2': 1408}
+
+
+def build_embedder():
+    # 推理后端由 INFERENCE_BACKEND 选择, 调用方式与 towhee 算子相同
+    return load_backend(EMBEDDING_MODEL)
+
+
+def build_clip_image():
+    return (
+        towhee.pipe.input('url')
+        .map('url', 'img', towhee.ops.image_decode.cv2_rgb())
+        .map('img', 'vec', towhee.ops.image_text_embedding.clip(model_name='clip_vit_base_patch16', modality='image'))
+        .output('vec')
+    )
+
+
+def build_clip_text():
+    return (
+        towhee.pipe.input('text')
+        .map('text', 'vec', towhee.ops.image_text_embedding.clip(model_name='clip_vit_base_patch16', modality='text'))
+        .output('vec')
+    )
+
+
+def build_caption():
+    return (
+        towhee.pipe.input('url')
+        .map('url', 'img', towhee.ops.image_decode.cv2_rgb())
+        .map('img', 'text', towhee.ops.image_captioning.clip_caption_reward(model_name='clipRN50_clips_grammar'))
+        .output('text')
+    )
+
+
+# 能力 -> 构建函数, 每个模型首次使用时才加载
+MODEL_BUILDERS = {
+    'image': build_embedder,
+    'clip_image': build_clip_image,
+    'clip_text': build_clip_text,
+    'caption': build_caption,
+}
+
+
 class ImageModel:
-    def __init__(self):
-        self.pipe = (
-            towhee.pipe.input('url')
-            .map('url', 'img',
-                towhee.ops.image_decode.cv2())
-            .map('img', 'embedding', towhee.ops.image_embedding.timm(model_name='efficientnet_b2'))
-            .map('embedding', 'normalized_embedding', normalize_and_adjust)  # 向量归一化
-            .output("normalized_embedding")
-        )
-        self.imageTextPipe = (
-            towhee.pipe.input('url')
-            .map('url', 'img', towhee.ops.image_decode.cv2_rgb())
-            .map('img', 'vec', towhee.ops.image_text_embedding.clip(model_name='clip_vit_base_patch16', modality='image'))
-            .output('vec')
-        )
-        self.imageTextPipe = (
-            towhee.pipe.input('text')
-            .map('text', 'vec', towhee.ops.image_text_embedding.clip(model_name='clip_vit_base_patch16', modality='text'))
-            .output('vec')
-        )
-        self.image2TextPipe = (
-            towhee.pipe.input('url')
-            .map('url', 'img', towhee.ops.image_decode.cv2_rgb())
-            .map('img', 'text', towhee.ops.image_captioning.clip_caption_reward(model_name='clipRN50_clips_grammar'))
-            .output('text')
-        )
+    """
+    按能力懒加载的模型集合, 只有 MODELS 中启用的能力可以加载。
+
+    Args:
+        capabilities (`list[str]`):
+            启用的能力, 取值为 image / clip_image / clip_text / caption。
+    """
+
+    def __init__(self, capabilities=MODELS):
+        unknown = set(capabilities) - set(MODEL_BUILDERS)
+        if unknown:
+            raise ValueError(f"Unknown model capabilities: {sorted(unknown)}")
+        self.capabilities = list(capabilities)
+        self.lock = threading.Lock()
+        self.models = {}
+        self.load_seconds = {}
+        self._decoder = None
+        self._dimension = NATIVE_DIMENSIONS.get(EMBEDDING_MODEL)
+        # 解码在调用方线程完成, 前向计算交给微批调度器合批执行
+        self.batcher = BatchScheduler(self.embed_batch, max_batch_size=BATCH_SIZE, max_wait_ms=BATCH_WAIT_MS,
+                                      name="image-embedding")
+
+    def model(self, name):
+        model = self.models.get(name)
+        if model is not None:
+            return model
+        if name not in self.capabilities:
+            raise RuntimeError(f"Model {name} is not enabled, add it to MODELS")
+        with self.lock:
+            if name not in self.models:
+                start = time.perf_counter()
+                self.models[name] = MODEL_BUILDERS[name]()
+                self.load_seconds[name] = time.perf_counter() - start
+                LOGGER.info(f"Loaded model {name} in {self.load_seconds[name]:.2f}s")
+            return self.models[name]
+
+    @property
+    def embedder(self):
+        return self.model('image')
+
+    @property
+    def decoder(self):
+        if self._decoder is None:
+            self._decoder = towhee.ops.image_decode.cv2().get_op()
+        return self._decoder
+
+    @property
+    def dimension(self):
+        # 未知模型时用一张空白图片跑一次前向, 得到模型的原生输出维度
+        if self._dimension is None:
+            blank = Image(np.zeros((224, 224, 3), dtype=np.uint8), 'BGR')
+            self._dimension = len(self.embedder([blank])[0])
+        return self._dimension
+
+    def warmup(self):
+        """
+        加载所有启用的模型, 并对图片向量模型跑一次前向, 避免首个请求承担加载与初始化开销
+        """
+        for name in self.capabilities:
+            try:
+                self.model(name)
+                if name == 'image':
+                    self.embed_batch([Image(np.zeros((224, 224, 3), dtype=np.uint8), 'BGR')])
+                elif name == 'clip_text':
+                    self.text_extract_feat('warmup')
+            except Exception as e:
+                LOGGER.error(f"Failed to warm up model {name}: {e}")
+
+    def status(self):
+        # 就绪检查: 启用的模型全部加载后为 ready
+        models = {name: {"enabled": name in self.capabilities, "loaded": name in self.models,
+                         "load_seconds": self.load_seconds.get(name)} for name in MODEL_BUILDERS}
+        ready = all(name in self.models for name in self.capabilities)
+        return {"ready": ready, "models": models}
+
+    def embed_batch(self, imgs):
+        # timm 算子接收列表时会 stack 成一个 batch 做一次前向
+        with span("forward"):
+            feats = self.embedder(list(imgs))
+        return [normalize_and_adjust(feat) for feat in feats]
+
+    def embed_arrays(self, arrays):
+        # 已解码的 BGR ndarray 列表直接组成一个 batch, 供批量导入使用
+        return self.embed_batch([Image(array, 'BGR') for array in arrays])
+
+    def decode(self, image):
+        # 支持路径/URL、内存中的图片字节以及已解码的 BGR ndarray, 字节与数组不经过磁盘
+        if isinstance(image, Image):
+            return image
+        if isinstance(image, np.ndarray):
+            return Image(image, 'BGR')
+        if isinstance(image, (bytes, bytearray, memoryview)):
+            return Image(decode_image(bytes(image)), 'BGR')
+        if isinstance(image, str) and os.path.isfile(image):
+            # 本地文件走同样的缩小解码与尺寸检查, URL 仍交给 towhee 解码算子
+            with open(image, "rb") as f:
+                return Image(decode_image(f.read()), 'BGR')
+        return self.decoder(image)
 
     def image_extract_feat(self, img_path):
-        feat = self.pipe(img_path).get()[0]
-        return feat
+        with span("decode"):
+            img = self.decode(img_path)
+        # 包含微批排队等待与前向
+        with span("embed"):
+            return self.batcher(img)
+
+    def batch_stats(self):
+        return self.batcher.stats.snapshot()
 
     def image_to_text(self, img_path):
-        feat = self.image2TextPipe(img_path).get()[0]
+        feat = self.model('caption')(img_path).get()[0]
         return feat
 
     def image_text_extract_feat(self, img_path):
-        feat = self.imageTextPipe(img_path).get()[0]
+        # CLIP 图片向量, 与 text_extract_feat 在同一空间
+        feat = self.model('clip_image')(img_path).get()[0]
+        return feat
+
+    def text_extract_feat(self, text):
+        feat = self.model('clip_text')(text).get()[0]
         return feat
 
 if __name__ == "__main__":
     imagePath = 'https://cross-java-images.oss-cn-zhangjiakou.aliyuncs.com/lglv998/abe83fc4cc91c91538e803bbf37cc886.jpg'
-    res = ImageModel().image_extract_feat(img_path=imagePath)
+    model = ImageModel(list(MODEL_BUILDERS))
+    res = model.image_extract_feat(img_path=imagePath)
     print(res)
-    res = ImageModel().image_to_text(img_path=imagePath)
+    res = model.image_to_text(img_path=imagePath)
     print(res)
-    res = ImageModel().image_text_extract_feat(img_path=imagePath)
+    res = model.image_text_extract_feat(img_path=imagePath)
     print(res)
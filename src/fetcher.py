@@ -0,0 +1,101 @@
+import asyncio
+import hashlib
+import mimetypes
+import os
+from urllib.parse import urlparse
+
+import httpx
+
+from config import FETCH_TIMEOUT, FETCH_CONNECT_TIMEOUT, FETCH_MAX_BYTES, FETCH_MAX_CONNECTIONS, FETCH_CONCURRENCY
+from logs import LOGGER
+from metrics import span
+
+
+class FetchError(Exception):
+    pass
+
+
+class UrlFetcher:
+    """
+    异步图片下载: 共享一个 keep-alive 连接池, 限制总耗时、连接超时与响应大小,
+    边接收边计算 MD5 并缓存到内存, 不写临时文件。
+
+    Args:
+        max_bytes (`int`):
+            响应体上限, 超出后立即断开。
+        timeout (`float`):
+            单个 URL 的总耗时上限 (秒)。
+        concurrency (`int`):
+            同时进行的下载数。
+    """
+
+    def __init__(self, max_bytes=FETCH_MAX_BYTES, timeout=FETCH_TIMEOUT, connect_timeout=FETCH_CONNECT_TIMEOUT,
+                 max_connections=FETCH_MAX_CONNECTIONS, concurrency=FETCH_CONCURRENCY):
+        self.max_bytes = max_bytes
+        self.timeout = timeout
+        self.connect_timeout = connect_timeout
+        self.max_connections = max_connections
+        self.concurrency = concurrency
+        self.client = None
+        self.semaphore = None
+
+    def _client(self):
+        # 在事件循环中首次使用时创建, 连接池随进程复用
+        if self.client is None:
+            self.client = httpx.AsyncClient(
+                timeout=httpx.Timeout(self.timeout, connect=self.connect_timeout),
+                limits=httpx.Limits(max_connections=self.max_connections,
+                                    max_keepalive_connections=self.max_connections),
+                follow_redirects=True,
+            )
+            self.semaphore = asyncio.Semaphore(self.concurrency)
+        return self.client
+
+    async def fetch(self, url):
+        """
+        :return: (content, md5, ext)
+        """
+        if urlparse(url).scheme not in ("http", "https"):
+            raise FetchError(f"Unsupported url: {url}")
+        client = self._client()
+        async with self.semaphore:
+            try:
+                with span("url_fetch"):
+                    return await asyncio.wait_for(self._download(client, url), self.timeout)
+            except asyncio.TimeoutError:
+                raise FetchError(f"Timed out after {self.timeout}s: {url}")
+            except httpx.HTTPError as e:
+                raise FetchError(f"Failed to fetch {url}: {e}")
+
+    async def _download(self, client, url):
+        async with client.stream("GET", url) as response:
+            response.raise_for_status()
+            length = response.headers.get("content-length")
+            if length is not None and length.isdigit() and int(length) > self.max_bytes:
+                raise FetchError(f"Image is larger than {self.max_bytes} bytes: {url}")
+            md5 = hashlib.md5()
+            buffer = bytearray()
+            async for chunk in response.aiter_bytes():
+                if len(buffer) + len(chunk) > self.max_bytes:
+                    raise FetchError(f"Image is larger than {self.max_bytes} bytes: {url}")
+                md5.update(chunk)
+                buffer += chunk
+            return bytes(buffer), md5.hexdigest(), url_ext(url, response.headers.get("content-type"))
+
+    async def close(self):
+        if self.client is not None:
+            await self.client.aclose()
+            self.client = None
+            LOGGER.debug("Closed url fetcher connection pool")
+
+
+def url_ext(url, content_type=None):
+    # 优先使用 URL 路径中的扩展名, 没有时根据 Content-Type 推断
+    ext = os.path.splitext(urlparse(url).path)[1].lstrip(".").lower()
+    if ext:
+        return ext
+    if content_type:
+        guessed = mimetypes.guess_extension(content_type.split(";")[0].strip())
+        if guessed:
+            return guessed.lstrip(".")
+    return "jpg"
@@ -0,0 +1,81 @@
+import threading
+
+from diskcache import Cache
+
+from logs import LOGGER
+
+
+class GroupRegistry:
+    """
+    分组注册表: 每个集合保存 分组 -> 图片数, 持久化在 diskcache 中,
+    作为 MilvusHelper 的监听器随写入/删除更新, 列出分组只需 O(分组数)。
+
+    删除行未知 (removed 为 None) 或注册表缺失时标记为过期, 下次读取时一次大批量扫描重建。
+    """
+
+    def __init__(self, path):
+        self.lock = threading.Lock()
+        self.cache = Cache(path)
+        self.counts = {}
+        self.stale = set()
+
+    def _load(self, collection_name):
+        # 调用方持有锁
+        if collection_name not in self.counts:
+            counts = self.cache.get(collection_name)
+            if counts is None:
+                self.stale.add(collection_name)
+                counts = {}
+            self.counts[collection_name] = counts
+        return self.counts[collection_name]
+
+    def needs_rebuild(self, collection_name):
+        with self.lock:
+            self._load(collection_name)
+            return collection_name in self.stale
+
+    def on_change(self, collection_name, added, removed):
+        with self.lock:
+            counts = self._load(collection_name)
+            if removed is None:
+                self.stale.add(collection_name)
+                removed = ()
+            for row in added:
+                group = row["meta"].get("group")
+                counts[group] = counts.get(group, 0) + 1
+            for row in removed:
+                group = row["meta"].get("group")
+                counts[group] = counts.get(group, 0) - 1
+                if counts[group] <= 0:
+                    counts.pop(group)
+            self.cache[collection_name] = counts
+
+    def rebuild(self, milvus_client, collection_name, batch_size=8192):
+        iterator = milvus_client.query_iterator(collection_name=collection_name, filter="", batch_size=batch_size,
+                                                output_fields=["id", "meta"])
+        counts = {}
+        while True:
+            tmp = iterator.next()
+            if not tmp:
+                iterator.close()
+                break
+            for item in tmp:
+                group = item["meta"].get("group")
+                counts[group] = counts.get(group, 0) + 1
+        with self.lock:
+            self.counts[collection_name] = counts
+            self.cache[collection_name] = counts
+            self.stale.discard(collection_name)
+        LOGGER.info(f"Rebuilt group registry of {collection_name}: {len(counts)} groups")
+        return counts
+
+    def group_counts(self, collection_name):
+        # 不包含未分组的图片
+        with self.lock:
+            return {group: count for group, count in self._load(collection_name).items() if group is not None}
+
+    def drop(self, collection_name):
+        with self.lock:
+            self.counts.pop(collection_name, None)
+            self.cache.pop(collection_name, None)
+            self.stale.discard(collection_name)
@@ -0,0 +1,87 @@
+import json
+
+from config import INDEX_TYPE, INDEX_PARAMS, SEARCH_PARAMS, COLLECTION_INDEXES, VECTOR_STORAGE, HASH_BITS
+from vector_storage import STORAGE_DTYPES
+
+# 各索引类型的构建参数默认值
+DEFAULT_BUILD_PARAMS = {
+    "HNSW": {"M": 16, "efConstruction": 200},
+    "IVF_FLAT": {"nlist": 1024},
+    "IVF_SQ8": {"nlist": 1024},
+    "IVF_PQ": {"nlist": 1024, "m": 16, "nbits": 8},
+    "FLAT": {},
+}
+
+# 各索引类型的搜索参数默认值: HNSW 用 ef, IVF 系列用 nprobe
+DEFAULT_SEARCH_PARAMS = {
+    "HNSW": {"ef": 64},
+    "IVF_FLAT": {"nprobe": 16},
+    "IVF_SQ8": {"nprobe": 16},
+    "IVF_PQ": {"nprobe": 16},
+    "FLAT": {},
+}
+
+SEARCH_PARAM_KEYS = {
+    "HNSW": ("ef",),
+    "IVF_FLAT": ("nprobe",),
+    "IVF_SQ8": ("nprobe",),
+    "IVF_PQ": ("nprobe",),
+    "FLAT": (),
+}
+
+
+def _load_json(value):
+    return json.loads(value) if value else {}
+
+
+def index_settings(collection_name, index_type=None, params=None):
+    """
+    集合的索引类型与构建参数, 优先级: 调用参数 > COLLECTION_INDEXES > INDEX_TYPE / INDEX_PARAMS > 类型默认值
+    """
+    override = _load_json(COLLECTION_INDEXES).get(collection_name, {})
+    configured_type = override.get("index_type", INDEX_TYPE).upper()
+    configured_params = override["params"] if "params" in override else _load_json(INDEX_PARAMS)
+    index_type = (index_type or configured_type).upper()
+    if index_type not in DEFAULT_BUILD_PARAMS:
+        raise ValueError(f"Unsupported index type: {index_type}")
+    build_params = dict(DEFAULT_BUILD_PARAMS[index_type])
+    # 配置的参数只对配置的索引类型生效
+    if index_type == configured_type:
+        build_params.update(configured_params)
+    if params:
+        build_params.update(params)
+    return index_type, build_params
+
+
+def storage_settings(collection_name, storage=None, hash_bits=None):
+    """
+    新集合的向量存储精度与哈希位数, 优先级: 调用参数 > COLLECTION_INDEXES > VECTOR_STORAGE / HASH_BITS
+    """
+    override = _load_json(COLLECTION_INDEXES).get(collection_name, {})
+    storage = (storage or override.get("storage", VECTOR_STORAGE)).lower()
+    if storage not in STORAGE_DTYPES:
+        raise ValueError(f"Unsupported vector storage: {storage}")
+    if hash_bits is None:
+        hash_bits = override.get("hash_bits", HASH_BITS)
+    hash_bits = int(hash_bits)
+    if hash_bits < 0 or hash_bits % 8 != 0:
+        raise ValueError(f"hash bits must be a multiple of 8, got {hash_bits}")
+    return storage, hash_bits
+
+
+def search_settings(collection_name, index_type, top_k, overrides=None):
+    """
+    搜索参数, 只保留对该索引类型有效的键, 请求级参数覆盖集合与全局配置
+    """
+    index_type = (index_type or "FLAT").upper()
+    params = dict(DEFAULT_SEARCH_PARAMS.get(index_type, {}))
+    collection_override = _load_json(COLLECTION_INDEXES).get(collection_name, {})
+    params.update(collection_override.get("search_params", _load_json(SEARCH_PARAMS)))
+    if overrides:
+        params.update({key: value for key, value in overrides.items() if value is not None})
+    allowed = SEARCH_PARAM_KEYS.get(index_type, ())
+    params = {key: value for key, value in params.items() if key in allowed}
+    # HNSW 要求 ef >= top_k
+    if "ef" in params:
+        params["ef"] = max(int(params["ef"]), top_k)
+    return params
@@ -0,0 +1,312 @@
+"""
+多进程部署中的索引进程: 只有它打开向量存储 (Milvus Lite 数据库或 NumPy 文件) 并写入, 推理 worker 通过本地 IPC 调用。
+
+    owner:  IndexService(VectorStore) 通过 BaseManager 在 unix socket / 本地端口上提供服务
+    worker: RemoteMilvus 与 VectorStore 的接口相同, 向量经共享内存传递, 只把句柄发给 owner
+
+worker 的查询缓存通过 owner 的变更序列失效 (changes_since 轮询)。
+"""
+import collections
+import itertools
+import queue
+import threading
+import time
+from multiprocessing import shared_memory
+from multiprocessing.managers import BaseManager
+
+import numpy as np
+
+from config import SHM_SLOTS, SHM_SLOT_MB, CHANGE_POLL_S
+from logs import LOGGER
+from vector_storage import as_vector
+
+# owner 保留的最近变更条数, worker 落后更多时整体失效缓存
+CHANGE_LOG_SIZE = 10000
+# 遍历器闲置超过该秒数视为 worker 已断开 (如导出中途断开连接), 关闭并释放
+ITERATOR_IDLE_S = 600
+
+
+def parse_address(address):
+    # "host:port" 为 TCP, 其他视为 unix socket 路径
+    host, sep, port = address.rpartition(":")
+    if sep and port.isdigit():
+        return host or "127.0.0.1", int(port)
+    return address
+
+
+class IndexManager(BaseManager):
+    pass
+
+
+class SharedVectors:
+    """
+    worker 侧的共享内存向量区: 一块共享内存切成 SHM_SLOTS 个槽, 每次调用占用一个槽,
+    owner 按 (名称, 偏移, 形状) 读取; 超过槽大小的矩阵退回普通序列化。
+    """
+
+    def __init__(self, slots=SHM_SLOTS, slot_bytes=int(SHM_SLOT_MB * 2 ** 20)):
+        self.slot_bytes = slot_bytes
+        self.shm = shared_memory.SharedMemory(create=True, size=max(1, slots * slot_bytes))
+        self.free = queue.Queue()
+        for slot in range(slots):
+            self.free.put(slot)
+
+    def put(self, vectors):
+        """
+        :return: (handle, slot); 放不下时 handle 为矩阵本身, slot 为 None
+        """
+        if len(vectors) == 0:
+            return np.empty((0, 0), dtype=np.float32), None
+        matrix = np.ascontiguousarray(np.stack([as_vector(vector) for vector in vectors]), dtype=np.float32)
+        if matrix.nbytes > self.slot_bytes:
+            return matrix, None
+        slot = self.free.get()
+        offset = slot * self.slot_bytes
+        np.ndarray(matrix.shape, dtype=np.float32, buffer=self.shm.buf, offset=offset)[:] = matrix
+        return (self.shm.name, offset, matrix.shape), slot
+
+    def release(self, slot):
+        if slot is not None:
+            self.free.put(slot)
+
+    def close(self):
+        self.shm.close()
+        self.shm.unlink()
+
+
+class IndexService:
+    """
+    owner 侧: 包装 MilvusHelper, 供 worker 远程调用, 并记录变更序列
+
+    Args:
+        milvus_cli (`MilvusHelper`):
+            owner 进程中唯一的 Milvus 客户端。
+    """
+
+    def __init__(self, milvus_cli):
+        self.milvus_cli = milvus_cli
+        self.lock = threading.Lock()
+        self.seq = 0
+        self.changes = collections.deque(maxlen=CHANGE_LOG_SIZE)
+        self.segments = {}
+        self.iterators = {}
+        self.tokens = itertools.count(1)
+        milvus_cli.add_listener(self.on_change)
+
+    def on_change(self, collection_name, added, removed):
+        # 变更只保留 uuid 与分组, worker 的缓存失效只需要这些
+        def brief(rows):
+            return [{"uuid": row.get("uuid"), "meta": {"group": row["meta"].get("group")}} for row in rows]
+
+        with self.lock:
+            self.seq += 1
+            self.changes.append((self.seq, collection_name, brief(added), None if removed is None else brief(removed)))
+
+    def changes_since(self, seq):
+        """
+        :return: 序号大于 seq 的变更; worker 落后超过保留条数时, 每个集合返回一条 "删除行未知" 的变更
+        """
+        with self.lock:
+            if self.changes and seq < self.changes[0][0] - 1:
+                return [(self.seq, collection_name, [], None)
+                        for collection_name in {change[1] for change in self.changes}]
+            return [change for change in self.changes if change[0] > seq]
+
+    def last_seq(self):
+        with self.lock:
+            return self.seq
+
+    def vectors(self, handle):
+        # 从 worker 的共享内存读取向量, 在返回前复制, worker 随后即可复用该槽
+        if isinstance(handle, np.ndarray):
+            return list(handle)
+        name, offset, shape = handle
+        shm = self.segments.get(name)
+        if shm is None:
+            shm = shared_memory.SharedMemory(name=name)
+            self.segments[name] = shm
+        matrix = np.ndarray(shape, dtype=np.float32, buffer=shm.buf, offset=offset).copy()
+        return list(matrix)
+
+    def search_vectors(self, collection_name, handle, top_k, group, search_params=None):
+        res = self.milvus_cli.search_vectors(collection_name, self.vectors(handle), top_k, group, search_params)
+        # SearchResult 转为普通列表, 便于序列化
+        return [[dict(hit) for hit in hits] for hits in res]
+
+    def insert(self, collection_name, path, handle, group, extra, md5s=None, uuids=None):
+        return self.milvus_cli.insert(collection_name, path, self.vectors(handle), group, extra, md5s, uuids)
+
+    def insert_rows(self, collection_name, rows, handle):
+        for row, vector in zip(rows, self.vectors(handle)):
+            row["embedding"] = vector
+        return self.milvus_cli.insert_rows(collection_name, rows)
+
+    def open_iterator(self, collection_name, output_fields, group=None, after_id=None, limit=None, batch_size=None):
+        self._prune_iterators()
+        kwargs = {"batch_size": batch_size} if batch_size else {}
+        token = next(self.tokens)
+        iterator = self.milvus_cli.iterate(collection_name, output_fields, group, after_id, limit, **kwargs)
+        with self.lock:
+            # token -> [遍历器, 最近一次使用的时间]
+            self.iterators[token] = [iterator, time.monotonic()]
+        return token
+
+    def next_batch(self, token):
+        with self.lock:
+            entry = self.iterators.get(token)
+            if entry is not None:
+                entry[1] = time.monotonic()
+        if entry is None:
+            return []
+        batch = next(entry[0], [])
+        if not batch:
+            with self.lock:
+                self.iterators.pop(token, None)
+        return batch
+
+    def close_iterator(self, token):
+        with self.lock:
+            entry = self.iterators.pop(token, None)
+        if entry is not None:
+            entry[0].close()
+
+    def _prune_iterators(self):
+        # worker 中途断开时不会调用 close_iterator, 闲置过久的遍历器在这里关闭
+        deadline = time.monotonic() - ITERATOR_IDLE_S
+        with self.lock:
+            stale = [token for token, entry in self.iterators.items() if entry[1] < deadline]
+            entries = [self.iterators.pop(token) for token in stale]
+        for iterator, _ in entries:
+            try:
+                iterator.close()
+            except Exception as e:
+                LOGGER.warning(f"Failed to close a stale iterator: {e}")
+        if entries:
+            LOGGER.info(f"Closed {len(entries)} stale iterators")
+
+    def call(self, method, *args, **kwargs):
+        # 其余只读/管理接口直接转发给 MilvusHelper
+        if method.startswith("_") or method in ("client", "listeners"):
+            raise AttributeError(method)
+        return getattr(self.milvus_cli, method)(*args, **kwargs)
+
+
+
+class RemoteMilvus:
+    """
+    worker 侧的 MilvusHelper 代理: 接口与 MilvusHelper 相同, 写入与搜索由 owner 执行。
+
+    Args:
+        address (`str`):
+            owner 的 unix socket 路径或 host:port。
+        authkey (`bytes`):
+            与 owner 相同的认证密钥。
+    """
+
+    # 直接转发给 owner 的 MilvusHelper 方法
+    FORWARDED = ("find_md5", "existing_md5s", "drop_uuid", "image_location", "get", "get_by_uuids", "group_counts",
+                 "has_group_field", "group_filter", "has_collection", "count", "delete_collection",
+                 "create_collection", "collection_dimension", "index_type", "load", "find_similar", "drop_uuids",
+                 "drop_group", "maintenance_report", "schedule_compaction")
+
+    def __init__(self, address, authkey, poll_seconds=CHANGE_POLL_S):
+        IndexManager.register("index")
+        self.manager = IndexManager(address=parse_address(address), authkey=authkey)
+        self.manager.connect()
+        # 代理对象按线程建立连接, 多个线程可以并发调用
+        self.index = self.manager.index()
+        self.shared = SharedVectors()
+        self.listeners = []
+        self.lock = threading.Lock()
+        self.seq = self.index.last_seq()
+        self.poll_seconds = poll_seconds
+        threading.Thread(target=self._poll, name="index-changes", daemon=True).start()
+
+    def __getattr__(self, method):
+        if method in self.FORWARDED:
+            return lambda *args, **kwargs: self._forward(method, *args, **kwargs)
+        raise AttributeError(method)
+
+    def _forward(self, method, *args, **kwargs):
+        result = self.index.call(method, *args, **kwargs)
+        if method in ("drop_uuid", "drop_uuids", "drop_group", "delete_collection", "create_collection"):
+            self.sync()
+        return result
+
+    def init_default(self):
+        # 集合由 owner 初始化
+        pass
+
+    def add_listener(self, listener):
+        self.listeners.append(listener)
+
+    def sync(self):
+        # 拉取 owner 的变更并通知本进程的监听器 (查询缓存)
+        with self.lock:
+            for change_seq, collection_name, added, removed in self.index.changes_since(self.seq):
+                for listener in self.listeners:
+                    try:
+                        listener(collection_name, added, removed)
+                    except Exception as e:
+                        LOGGER.error(f"Collection listener failed: {e}")
+                self.seq = max(self.seq, change_seq)
+
+    def _poll(self):
+        while True:
+            time.sleep(self.poll_seconds)
+            try:
+                self.sync()
+            except Exception as e:
+                LOGGER.error(f"Failed to poll index changes: {e}")
+
+    def _with_vectors(self, vectors, fn):
+        handle, slot = self.shared.put(vectors)
+        try:
+            return fn(handle)
+        finally:
+            self.shared.release(slot)
+
+    def search_vectors(self, collection_name, vectors, top_k, group, search_params=None):
+        return self._with_vectors(vectors, lambda handle: self.index.search_vectors(
+            collection_name, handle, top_k, group, search_params))
+
+    def insert(self, collection_name, path, vectors, group, extra, md5s=None, uuids=None):
+        rows = self._with_vectors(vectors, lambda handle: self.index.insert(
+            collection_name, path, handle, group, extra, md5s, uuids))
+        self.sync()
+        return rows
+
+    def insert_rows(self, collection_name, rows):
+        if len(rows) == 0:
+            return 0
+        vectors = [row["embedding"] for row in rows]
+        stripped = [{key: value for key, value in row.items() if key != "embedding"} for row in rows]
+        count = self._with_vectors(vectors, lambda handle: self.index.insert_rows(collection_name, stripped, handle))
+        self.sync()
+        return count
+
+    def iterate(self, collection_name, output_fields, group=None, after_id=None, limit=None, batch_size=None):
+        token = self.index.open_iterator(collection_name, list(output_fields), group, after_id, limit, batch_size)
+        try:
+            while True:
+                batch = self.index.next_batch(token)
+                if not batch:
+                    break
+                yield batch
+        finally:
+            self.index.close_iterator(token)
+
+    def close(self):
+        self.shared.close()
+
+
+def serve_index(milvus_cli, address, authkey):
+    """
+    在当前进程中运行 owner, 阻塞直到进程退出; 每个 worker 连接由一个线程处理
+    """
+    service = IndexService(milvus_cli)
+    IndexManager.register("index", callable=lambda: service)
+    manager = IndexManager(address=parse_address(address), authkey=authkey)
+    server = manager.get_server()
+    LOGGER.info(f"Index owner listening on {address}")
+    server.serve_forever()
@@ -0,0 +1,176 @@
+"""
+图片向量模型的推理后端: towhee (eager PyTorch) / ONNX Runtime / TorchScript。
+
+ONNX 与 TorchScript 后端从 towhee timm 算子中的同一份权重导出一次, 缓存在 MODEL_CACHE_PATH,
+预处理沿用算子的 timm transforms, 输出为全局平均池化后的特征, 与 towhee 算子一致。
+"""
+import os
+
+import numpy as np
+import towhee
+
+from config import INFERENCE_BACKEND, INFERENCE_INT8, INFERENCE_THREADS, INFERENCE_INTEROP_THREADS, MODEL_CACHE_PATH
+from logs import LOGGER
+
+BACKENDS = ("towhee", "onnx", "torchscript")
+
+
+def load_timm_op(model_name):
+    return towhee.ops.image_embedding.timm(model_name=model_name).get_op()
+
+
+def to_pil(img):
+    # towhee Image / BGR ndarray -> RGB PIL.Image
+    from PIL import Image as PILImage
+    array = np.asarray(img)
+    if getattr(img, "mode", "BGR") == "BGR":
+        array = array[:, :, ::-1]
+    return PILImage.fromarray(np.ascontiguousarray(array))
+
+
+def pooled_features(model):
+    # forward_features + 全局平均池化, 与 towhee timm 算子的后处理相同
+    import torch
+
+    class PooledFeatures(torch.nn.Module):
+        def __init__(self):
+            super().__init__()
+            self.model = model
+
+        def forward(self, x):
+            features = self.model.forward_features(x)
+            if features.dim() == 4:
+                features = torch.nn.functional.adaptive_avg_pool2d(features, 1)
+            return torch.flatten(features, 1)
+
+    return PooledFeatures().eval()
+
+
+class ExportedBackend:
+    """
+    导出后端的公共部分: 预处理、导出缓存路径与线程设置。
+
+    Args:
+        model_name (`str`):
+            timm 模型名。
+        int8 (`bool`):
+            是否使用动态 int8 量化。
+        threads (`int`):
+            单次前向的算子内线程数 (intra-op)。
+        interop_threads (`int`):
+            算子间并行线程数 (inter-op)。
+    """
+
+    suffix = ""
+
+    def __init__(self, model_name, int8=False, threads=INFERENCE_THREADS, interop_threads=INFERENCE_INTEROP_THREADS,
+                 cache_path=MODEL_CACHE_PATH):
+        self.model_name = model_name
+        self.int8 = int8
+        self.threads = threads
+        self.interop_threads = interop_threads
+        op = load_timm_op(model_name)
+        self.transform = op.tfms
+        self.input_size = tuple(op.config["input_size"])
+        os.makedirs(cache_path, exist_ok=True)
+        self.path = os.path.join(cache_path, f"{model_name}{self.suffix}")
+        if not os.path.exists(self.path):
+            LOGGER.info(f"Exporting {model_name} to {self.path}")
+            self.export(pooled_features(op.model), self.path)
+        # 导出后不再需要 eager 模型
+        del op
+
+    def preprocess(self, imgs):
+        return np.stack([self.transform(to_pil(img)).numpy() for img in imgs]).astype(np.float32)
+
+    def export(self, module, path):
+        raise NotImplementedError
+
+    def forward(self, batch):
+        raise NotImplementedError
+
+    def __call__(self, imgs):
+        return list(self.forward(self.preprocess(imgs)))
+
+
+class OnnxBackend(ExportedBackend):
+    suffix = ".onnx"
+
+    def __init__(self, model_name, int8=False, **kwargs):
+        super().__init__(model_name, int8, **kwargs)
+        import onnxruntime as ort
+        path = self.path
+        if int8:
+            path = self.quantize(self.path)
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = self.threads
+        options.inter_op_num_threads = self.interop_threads
+        options.execution_mode = ort.ExecutionMode.ORT_PARALLEL if self.interop_threads > 1 \
+            else ort.ExecutionMode.ORT_SEQUENTIAL
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = ort.InferenceSession(path, options, providers=["CPUExecutionProvider"])
+        self.input_name = self.session.get_inputs()[0].name
+
+    def export(self, module, path):
+        import torch
+        dummy = torch.zeros((1,) + self.input_size)
+        torch.onnx.export(module, dummy, path, input_names=["input"], output_names=["features"],
+                          dynamic_axes={"input": {0: "batch"}, "features": {0: "batch"}}, opset_version=17)
+
+    @staticmethod
+    def quantize(path):
+        # 权重动态量化为 int8, 激活在运行时量化
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+        quantized = path.replace(".onnx", ".int8.onnx")
+        if not os.path.exists(quantized):
+            LOGGER.info(f"Quantizing {path} to int8")
+            quantize_dynamic(path, quantized, weight_type=QuantType.QInt8)
+        return quantized
+
+    def forward(self, batch):
+        return self.session.run(None, {self.input_name: batch})[0]
+
+
+class TorchScriptBackend(ExportedBackend):
+    suffix = ".pt"
+
+    def __init__(self, model_name, int8=False, **kwargs):
+        import torch
+        super().__init__(model_name, int8, **kwargs)
+        torch.set_num_threads(self.threads)
+        try:
+            torch.set_num_interop_threads(self.interop_threads)
+        except RuntimeError:
+            # inter-op 线程数只能在首次并行计算前设置一次
+            LOGGER.warning("torch inter-op threads already initialized, keeping the current setting")
+        self.module = torch.jit.load(self.path)
+        if int8:
+            # PyTorch 动态量化只覆盖 Linear / LSTM, 卷积网络基本不受益, 需要 int8 时使用 onnx 后端
+            LOGGER.warning("TorchScript backend ignores INFERENCE_INT8, use the onnx backend for int8")
+        self.module = torch.jit.optimize_for_inference(self.module)
+
+    def export(self, module, path):
+        import torch
+        dummy = torch.zeros((1,) + self.input_size)
+        with torch.no_grad():
+            traced = torch.jit.freeze(torch.jit.trace(module, dummy))
+        traced.save(path)
+
+    def forward(self, batch):
+        import torch
+        with torch.inference_mode():
+            return self.module(torch.from_numpy(batch)).numpy()
+
+
+def load_backend(model_name, backend=INFERENCE_BACKEND, int8=INFERENCE_INT8, **kwargs):
+    """
+    加载图片向量模型, 返回与 towhee 算子相同的调用方式: 输入图片列表, 输出特征列表
+    """
+    backend = backend.lower()
+    if backend == "towhee":
+        return load_timm_op(model_name)
+    if backend == "onnx":
+        return OnnxBackend(model_name, int8, **kwargs)
+    if backend == "torchscript":
+        return TorchScriptBackend(model_name, int8, **kwargs)
+    raise ValueError(f"Unknown inference backend: {backend}, expected one of {BACKENDS}")
@@ -0,0 +1,376 @@
+"""
+批量目录导入: 进程池并行读取/哈希/解码/生成缩略图, 批量推理, 批量写入 Milvus, 最后只 load 一次。
+新写入的行与上传一样把原图与缩略图保存到图片存储 (meta["blob"]), 去重跳过的图片不保存缩略图;
+集合中已有相同 md5 但原图文件缺失时 (上次写入行后保存失败或进程崩溃), 用这次的文件补写原图。
+
+    python ingest.py /path/to/images --group catalog --recursive
+
+Milvus Lite 同一时间只能被一个进程打开, 服务运行时请使用 POST /ingest/jobs (jobs.py, 可断点续传)。
+"""
+import argparse
+import multiprocessing
+import os
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from blob_store import BLOB_STORE, blob_key, thumbnail_key
+from config import DEFAULT_TABLE, INGEST_WORKERS, INGEST_BATCH_SIZE, INGEST_INSERT_BATCH, PHASH, PHASH_DISTANCE, \
+    THUMBNAIL_SIZE, INGEST_YIELD_S
+from logs import LOGGER
+from metrics import DUPLICATES
+from milvus_helpers import make_row
+from operators import generate_uuids
+from phash import PhashIndex, format_hash, image_hash
+from preprocess import load_image, make_thumbnail
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg')
+
+
+def list_images(img_dir, recursive=False):
+    # 按目录流式遍历, 避免对百万级目录做多次 glob
+    for root, dirs, files in os.walk(img_dir):
+        for name in sorted(files):
+            if name.lower().endswith(IMAGE_EXTENSIONS):
+                yield os.path.join(root, name)
+        if not recursive:
+            break
+        dirs.sort()
+
+
+def load_for_ingest(path):
+    """
+    在导入进程池中读取、计算 MD5 并解码, 同时用解码结果生成缩略图; 缩略图在行写入后才保存
+    :return: (path, md5, image, thumbnail, error), 不需要缩略图时 thumbnail 为 None
+    """
+    path, md5, image, error = load_image(path)
+    thumbnail = None
+    if image is not None and THUMBNAIL_SIZE > 0 and not BLOB_STORE.exists(thumbnail_key(md5)):
+        try:
+            thumbnail = make_thumbnail(image)
+        except Exception as e:
+            LOGGER.warning(f"Failed to generate thumbnail for {path}: {e}")
+    return path, md5, image, thumbnail, error
+
+
+class IngestStats:
+    # 随检查点保存的计数, 任务恢复时从这些值继续
+    COUNTS = ("processed", "inserted", "duplicates", "near_duplicates", "failed")
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.status = "pending"
+        self.error = None
+        self.total = 0
+        self.processed = 0
+        self.inserted = 0
+        self.duplicates = 0
+        self.near_duplicates = 0
+        self.failed = 0
+        # 从检查点恢复时已处理的数量, 不计入本次运行的速度
+        self.resumed = 0
+        self.started = None
+        self.finished = None
+
+    def add(self, **counts):
+        with self.lock:
+            for key, value in counts.items():
+                setattr(self, key, getattr(self, key) + value)
+
+    def counts(self):
+        with self.lock:
+            return {key: getattr(self, key) for key in self.COUNTS}
+
+    def restore(self, counts):
+        with self.lock:
+            for key in self.COUNTS:
+                setattr(self, key, counts.get(key, 0))
+            self.resumed = self.processed
+
+    def snapshot(self):
+        with self.lock:
+            end = self.finished or time.time()
+            elapsed = end - self.started if self.started else 0.0
+            rate = (self.processed - self.resumed) / elapsed if elapsed > 0 else 0.0
+            return {
+                "status": self.status,
+                "error": self.error,
+                "total": self.total,
+                "processed": self.processed,
+                "inserted": self.inserted,
+                "duplicates": self.duplicates,
+                "near_duplicates": self.near_duplicates,
+                "failed": self.failed,
+                "elapsed_s": elapsed,
+                "images_per_sec": rate,
+                "eta_s": (self.total - self.processed) / rate if rate > 0 and self.status == "running" else None,
+            }
+
+
+class IngestPipeline:
+    """
+    流式导入流水线, 三个阶段相互重叠:
+    进程池读取+MD5+解码 -> 主线程批量推理 -> 写入线程批量 insert。
+
+    Args:
+        model (`ImageModel`):
+            提供 embed_arrays 的图片模型。
+        milvus_cli (`VectorStore`):
+            向量存储 (MilvusHelper / NumpyStore)。
+        workers (`int`):
+            解码进程数。
+        batch_size (`int`):
+            每次前向计算的图片数。
+        insert_batch (`int`):
+            每次写入 Milvus 的行数。
+        on_checkpoint (`callable`):
+            on_checkpoint(position, counts), 前 position 个文件的结果都已写入后调用, 用于断点续传。
+        busy (`callable`):
+            返回 True 时 (有交互搜索在处理) 每批推理前最多让出 INGEST_YIELD_S 秒。
+    """
+
+    def __init__(self, model, milvus_cli, table_name=None, group=None, extra=None, workers=INGEST_WORKERS,
+                 batch_size=INGEST_BATCH_SIZE, insert_batch=INGEST_INSERT_BATCH, on_checkpoint=None, busy=None):
+        self.model = model
+        self.milvus_cli = milvus_cli
+        self.table_name = table_name or DEFAULT_TABLE
+        self.group = group
+        self.extra = extra
+        self.workers = max(1, workers)
+        self.batch_size = max(1, batch_size)
+        self.insert_batch = max(1, insert_batch)
+        self.stats = IngestStats()
+        self.seen_md5s = set()
+        # 本次导入内已写入图片的感知哈希
+        self.seen_hashes = PhashIndex()
+        self.insert_error = None
+        self.on_checkpoint = on_checkpoint
+        self.busy = busy
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+    def run(self, img_dir, recursive=False, start=0, counts=None):
+        """
+        :param start: 从第 start 个文件继续 (检查点), 文件按固定顺序遍历
+        :param counts: 检查点保存的计数
+        """
+        stats = self.stats
+        stats.status = "running"
+        stats.started = time.time()
+        try:
+            self.milvus_cli.create_collection(self.table_name)
+            paths = list(list_images(img_dir, recursive))
+            stats.total = len(paths)
+            if stats.total == 0:
+                raise FileNotFoundError(f"There is no image file in {img_dir} and endswith {IMAGE_EXTENSIONS}")
+            if counts:
+                stats.restore(counts)
+            if start > 0:
+                LOGGER.info(f"Resuming ingest of {img_dir} at {start}/{stats.total}")
+
+            insert_queue = queue.Queue(maxsize=4)
+            inserter = threading.Thread(target=self._insert_loop, args=(insert_queue,), daemon=True)
+            inserter.start()
+            try:
+                pending = []
+                # spawn 避免在已有推理线程的进程中 fork
+                context = multiprocessing.get_context("spawn")
+                position = start
+                with ProcessPoolExecutor(self.workers, mp_context=context) as pool:
+                    for position, (path, md5, image, thumbnail, error) in enumerate(
+                            self._decoded(pool, paths[start:]), start + 1):
+                        if error is not None:
+                            LOGGER.error(f"Error with decoding image:{path}, error: {error}")
+                            stats.add(processed=1, failed=1)
+                            continue
+                        pending.append((path, md5, image, thumbnail))
+                        if len(pending) >= self.batch_size:
+                            self._embed(pending, insert_queue, position)
+                            pending = []
+                    # 末尾解码失败的文件也要推进检查点
+                    self._embed(pending, insert_queue, position)
+            finally:
+                insert_queue.put(None)
+                inserter.join()
+            if self.insert_error is not None:
+                raise self.insert_error
+
+            self.milvus_cli.load(self.table_name)
+            stats.status = "cancelled" if self.cancelled else "finished"
+            LOGGER.info(f"Ingested {img_dir}: {stats.snapshot()}")
+        except Exception as e:
+            stats.status = "failed"
+            stats.error = str(e)
+            LOGGER.error(f"Error with ingesting {img_dir}: {e}")
+        finally:
+            stats.finished = time.time()
+        return stats.snapshot()
+
+    def _decoded(self, pool, paths):
+        # 限制在途任务数量, 解码结果按提交顺序返回
+        window = self.workers * self.batch_size * 2
+        futures = deque()
+        for path in paths:
+            if self.insert_error is not None or self.cancelled:
+                break
+            futures.append(pool.submit(load_for_ingest, path))
+            if len(futures) >= window:
+                yield futures.popleft().result()
+        while futures:
+            yield futures.popleft().result()
+
+    def _embed(self, items, insert_queue, position):
+        # 先按 md5 去重 (本次导入内 + 集合中已有), 只对新图片做推理
+        if len(items) == 0:
+            insert_queue.put(([], [], position, self.stats.counts()))
+            return
+        existing = self.milvus_cli.existing_md5s(self.table_name, [item[1] for item in items])
+        self._repair_files(items, existing)
+        fresh = []
+        for item in items:
+            md5 = item[1]
+            if md5 in existing or md5 in self.seen_md5s:
+                continue
+            self.seen_md5s.add(md5)
+            fresh.append(item)
+        self.stats.add(processed=len(items), duplicates=len(items) - len(fresh))
+        hashes = [None] * len(fresh)
+        if PHASH:
+            fresh, hashes = self._near_duplicates(fresh)
+        if len(fresh) == 0:
+            insert_queue.put(([], [], position, self.stats.counts()))
+            return
+        self._yield_to_search()
+        feats = self.model.embed_arrays([image for _, _, image, _ in fresh])
+        uuids = generate_uuids(len(fresh))
+        rows = []
+        # 行写入后要保存的文件: (原图键, 源文件路径, md5, 缩略图)
+        files = []
+        for index, ((path, md5, _, thumbnail), feat) in enumerate(zip(fresh, feats)):
+            row = make_row(path, feat, uuids[index], md5, self.group, self.extra)
+            if hashes[index] is not None:
+                row["meta"][PHASH] = format_hash(hashes[index])
+            # 与上传相同, 按内容寻址保存原图, 下载接口通过 meta["blob"] 定位
+            key = blob_key(md5, row["meta"]["ext"])
+            row["meta"]["blob"] = key
+            rows.append(row)
+            files.append((key, path, md5, thumbnail))
+        insert_queue.put((rows, files, position, self.stats.counts()))
+
+    def _repair_files(self, items, existing):
+        # 已有行的原图缺失时补写, 行已存在所以顺序与上传一致; 否则这些行会被当作重复永远跳过
+        for path, md5, _, _ in items:
+            if md5 not in existing or md5 in self.seen_md5s:
+                continue
+            key = blob_key(md5, path.split(".")[-1])
+            try:
+                if not BLOB_STORE.exists(key):
+                    BLOB_STORE.put_file(key, path)
+                    LOGGER.info(f"Restored missing file {key} from {path}")
+            except Exception as e:
+                LOGGER.warning(f"Failed to restore {key} from {path}: {e}")
+
+    def _yield_to_search(self):
+        # 交互搜索与导入共用 CPU, 有搜索在处理时稍等, 但每批最多等待 INGEST_YIELD_S 秒, 导入不会饿死
+        if self.busy is None:
+            return
+        deadline = time.monotonic() + INGEST_YIELD_S
+        while self.busy() and time.monotonic() < deadline:
+            time.sleep(0.005)
+
+    def _near_duplicates(self, items):
+        # 感知哈希在已解码的图片上计算, 与集合及本次导入中已有的图片比较, 近似重复的不做推理
+        fresh = []
+        hashes = []
+        for item in items:
+            _, md5, image, _ = item
+            value = image_hash(image)
+            if PHASH_DISTANCE >= 0 and (self.milvus_cli.find_similar(self.table_name, value, self.group)
+                                        or self.seen_hashes.lookup(value, self.group)):
+                continue
+            self.seen_hashes.add({"uuid": md5, "md5": md5, "meta": {"group": self.group, PHASH: format_hash(value)}})
+            fresh.append(item)
+            hashes.append(value)
+        self.stats.add(near_duplicates=len(items) - len(fresh))
+        DUPLICATES.labels(PHASH).inc(len(items) - len(fresh))
+        return fresh, hashes
+
+    def _insert_loop(self, insert_queue):
+        # 队列元素为 (rows, files, position, counts); 缓冲的行写入后保存文件, 检查点推进到最后一批的 position
+        buffer = []
+        files = []
+        mark = None
+        while True:
+            item = insert_queue.get()
+            if item is not None:
+                rows, row_files, position, counts = item
+                buffer.extend(rows)
+                files.extend(row_files)
+                mark = (position, counts)
+            if item is None or len(buffer) >= self.insert_batch or not buffer:
+                if buffer and self.insert_error is None:
+                    try:
+                        count = self.milvus_cli.insert_rows(self.table_name, buffer)
+                        self.stats.add(inserted=count)
+                    except Exception as e:
+                        LOGGER.error(f"Failed to bulk insert {len(buffer)} rows: {e}")
+                        self.insert_error = e
+                    else:
+                        try:
+                            self._save_files(files)
+                        except Exception as e:
+                            LOGGER.error(f"Failed to store files of {len(buffer)} inserted rows: {e}")
+                            self.insert_error = e
+                buffer = []
+                files = []
+                if mark is not None and self.insert_error is None and self.on_checkpoint is not None:
+                    try:
+                        self.on_checkpoint(mark[0], {**mark[1], "inserted": self.stats.inserted})
+                    except Exception as e:
+                        LOGGER.error(f"Failed to save ingest checkpoint: {e}")
+                    mark = None
+            if item is None:
+                break
+
+    def _save_files(self, files):
+        # 先写入行再保存文件 (与上传相同的顺序), 文件清理据此判断文件是否仍被引用
+        # 原图保存失败时抛出, 这一批不推进检查点, 恢复或重新导入时由 _repair_files 补写
+        for key, path, md5, thumbnail in files:
+            BLOB_STORE.put_file(key, path)
+            if thumbnail is not None:
+                # 缩略图失败不影响导入结果, 下载缩略图时会再生成
+                try:
+                    BLOB_STORE.put(thumbnail_key(md5), thumbnail)
+                except Exception as e:
+                    LOGGER.warning(f"Failed to store thumbnail of {path}: {e}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk ingest a directory of images")
+    parser.add_argument("path", help="image directory")
+    parser.add_argument("--table", default=DEFAULT_TABLE)
+    parser.add_argument("--group", default=None)
+    parser.add_argument("--extra", default=None, help="JSON object merged into every row's meta")
+    parser.add_argument("--recursive", action="store_true")
+    parser.add_argument("--workers", type=int, default=INGEST_WORKERS)
+    parser.add_argument("--batch-size", type=int, default=INGEST_BATCH_SIZE)
+    parser.add_argument("--insert-batch", type=int, default=INGEST_INSERT_BATCH)
+    args = parser.parse_args()
+
+    from config import VECTOR_DIMENSION
+    from encode import ImageModel
+    from vector_store import open_store
+
+    model = ImageModel()
+    milvus_cli = open_store(dimension=VECTOR_DIMENSION or model.dimension)
+    pipeline = IngestPipeline(model, milvus_cli, args.table, args.group, args.extra, args.workers,
+                              args.batch_size, args.insert_batch)
+    print(pipeline.run(args.path, args.recursive))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,282 @@
+"""
+持久化的导入任务队列: 任务、进度与检查点保存在 diskcache (JOBS_PATH) 中,
+服务重启后继续执行, 多进程部署 (serve.py) 时所有 worker 共享同一份任务状态。
+
+    queued -> running -> finished / failed / cancelled
+
+运行中的任务定期写入心跳与进度; 前 N 个文件的结果写入后保存检查点 (N 与各项计数)。
+进程崩溃或重启后, 心跳超时 (或所属进程已不存在) 的任务由任一 worker 从检查点继续, 已处理的文件不再推理。
+每次认领生成新的 run_id, 心跳、检查点与结束状态只在 run_id 未变时写入; 被接管的旧运行停止而不会覆盖新运行的状态。
+"""
+import os
+import socket
+import threading
+import time
+import uuid
+
+from diskcache import Cache
+
+from config import JOBS_PATH, JOB_CONCURRENCY, JOB_WORKERS, JOB_HEARTBEAT_S, JOB_STALE_S
+from ingest import IngestPipeline
+from logs import LOGGER
+
+# 当前进程的标识, 用于判断任务所属进程是否还活着
+OWNER = f"{socket.gethostname()}:{os.getpid()}"
+
+
+def owner_alive(owner):
+    # 同一台机器上的进程可以直接判断, 其他机器上的只能等心跳超时
+    host, _, pid = (owner or "").rpartition(":")
+    if host != socket.gethostname() or not pid.isdigit():
+        return True
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class JobQueue:
+    """
+    导入任务队列, 每个 worker 进程一个实例, 通过 start() 启动调度线程。
+
+    Args:
+        model (`ImageModel`):
+            推理模型。
+        milvus_cli (`VectorStore`):
+            向量存储, 多进程部署时为 RemoteMilvus。
+        concurrency (`int`):
+            所有进程合计同时运行的任务数。
+        workers (`int`):
+            每个任务的解码进程数, 服务内默认只用一半 CPU, 给交互请求留出余量。
+        busy (`callable`):
+            有交互搜索在处理时返回 True, 导入每批推理前让出 CPU。
+    """
+
+    def __init__(self, model, milvus_cli, path=JOBS_PATH, concurrency=JOB_CONCURRENCY, workers=JOB_WORKERS,
+                 busy=None):
+        self.model = model
+        self.milvus_cli = milvus_cli
+        self.cache = Cache(path)
+        self.concurrency = max(1, concurrency)
+        self.workers = workers
+        self.busy = busy
+        self.lock = threading.Lock()
+        # 本进程正在运行的任务: job_id -> IngestPipeline, 以及对应的 run_id
+        self.pipelines = {}
+        self.run_ids = {}
+        self.wakeup = threading.Event()
+        self.started = False
+
+    def start(self):
+        if self.started:
+            return
+        self.started = True
+        threading.Thread(target=self._schedule, name="ingest-scheduler", daemon=True).start()
+
+    def submit(self, img_dir, table_name=None, group=None, extra=None, recursive=False):
+        """提交一个导入任务, 返回任务 id"""
+        job_id = str(uuid.uuid4())
+        self.cache.set(self._key(job_id), {
+            "id": job_id,
+            "img_dir": img_dir,
+            "table_name": table_name,
+            "group": group,
+            "extra": extra,
+            "recursive": recursive,
+            "status": "queued",
+            "error": None,
+            "created": time.time(),
+            "started": None,
+            "finished": None,
+            "owner": None,
+            "heartbeat": None,
+            "runs": 0,
+            # 前 position 个文件已处理完成
+            "checkpoint": {"position": 0, "counts": {}},
+            "progress": {},
+        })
+        self.wakeup.set()
+        return job_id
+
+    def cancel(self, job_id):
+        """
+        :return: 任务不存在时返回 None, 否则返回取消后的状态
+        """
+        job = self._update(job_id, lambda job: job.update(status="cancelled", finished=time.time())
+                           if job["status"] in ("queued", "running") else None)
+        if job is None:
+            return None
+        with self.lock:
+            pipeline = self.pipelines.get(job_id)
+        if pipeline is not None:
+            pipeline.cancel()
+        return job["status"]
+
+    def retry(self, job_id):
+        """
+        失败或已取消的任务重新排队, 从检查点继续
+        :return: 任务不存在时返回 None, 否则返回任务状态
+        """
+        job = self._update(job_id, lambda job: job.update(status="queued", error=None, finished=None)
+                           if job["status"] in ("failed", "cancelled") else None)
+        self.wakeup.set()
+        return job["status"] if job is not None else None
+
+    def get(self, job_id):
+        job = self.cache.get(self._key(job_id))
+        return self._view(job) if job is not None else None
+
+    def list(self, status=None):
+        jobs = [self._view(job) for job in self._jobs() if status is None or job["status"] == status]
+        return sorted(jobs, key=lambda job: job["created"], reverse=True)
+
+    def progress(self):
+        # 所有运行中任务的合计进度, 对应旧的 /progress (current / total)
+        running = self.list("running")
+        return {
+            "current": sum(job["processed"] for job in running),
+            "total": sum(job["total"] for job in running),
+            "jobs": running,
+        }
+
+    @staticmethod
+    def _key(job_id):
+        return f"job:{job_id}"
+
+    def _jobs(self):
+        jobs = []
+        for key in list(self.cache.iterkeys()):
+            if isinstance(key, str) and key.startswith("job:"):
+                job = self.cache.get(key)
+                if job is not None:
+                    jobs.append(job)
+        return jobs
+
+    def _update(self, job_id, change):
+        # 进程间的读-改-写, 在 diskcache 事务中进行
+        with self.cache.transact():
+            job = self.cache.get(self._key(job_id))
+            if job is None:
+                return None
+            change(job)
+            self.cache.set(self._key(job_id), job)
+        return job
+
+    def _update_run(self, job_id, run_id, change):
+        """
+        只修改仍由本次运行持有的任务
+        :return: 任务已被删除或被其他运行接管时返回 False, 不做修改
+        """
+        with self.cache.transact():
+            job = self.cache.get(self._key(job_id))
+            if job is None or job.get("run_id") != run_id:
+                return False
+            change(job)
+            self.cache.set(self._key(job_id), job)
+        return True
+
+    def _view(self, job):
+        # 本进程运行的任务读实时计数, 其他进程的读最近一次心跳写入的进度
+        with self.lock:
+            pipeline = self.pipelines.get(job["id"])
+        progress = pipeline.stats.snapshot() if pipeline is not None else job["progress"]
+        view = {key: job[key] for key in ("id", "img_dir", "table_name", "group", "status", "error", "created",
+                                          "started", "finished", "runs")}
+        for key in ("total", "processed", "inserted", "duplicates", "near_duplicates", "failed"):
+            view[key] = progress.get(key, job["checkpoint"]["counts"].get(key, 0))
+        view["checkpoint"] = job["checkpoint"]["position"]
+        running = job["status"] == "running"
+        view["images_per_sec"] = progress.get("images_per_sec", 0.0) if running else 0.0
+        view["eta_s"] = progress.get("eta_s") if running else None
+        return view
+
+    def _stale(self, job, now):
+        return now - (job["heartbeat"] or 0) > JOB_STALE_S or not owner_alive(job["owner"])
+
+    def _claim(self):
+        # 所有进程合计最多 concurrency 个运行中的任务; 心跳超时的任务视为中断, 优先恢复
+        now = time.time()
+        with self.cache.transact():
+            jobs = self._jobs()
+            active = [job for job in jobs if job["status"] == "running" and not self._stale(job, now)]
+            if len(active) >= self.concurrency:
+                return None
+            candidates = [job for job in jobs if job["status"] == "queued"
+                          or (job["status"] == "running" and self._stale(job, now))]
+            if not candidates:
+                return None
+            job = min(candidates, key=lambda job: (job["status"] != "running", job["created"]))
+            if job["status"] == "running":
+                LOGGER.info(f"Resuming interrupted ingest job {job['id']} of {job['owner']} "
+                            f"at {job['checkpoint']['position']}")
+            job.update(status="running", owner=OWNER, run_id=uuid.uuid4().hex, heartbeat=now,
+                       started=job["started"] or now, runs=job["runs"] + 1)
+            self.cache.set(self._key(job["id"]), job)
+        return job
+
+    def _schedule(self):
+        while True:
+            try:
+                self._heartbeat()
+                with self.lock:
+                    local = len(self.pipelines)
+                job = self._claim() if local < self.concurrency else None
+                if job is not None:
+                    threading.Thread(target=self._run, args=(job,), name=f"ingest-{job['id']}",
+                                     daemon=True).start()
+                    continue
+            except Exception as e:
+                LOGGER.error(f"Ingest scheduler failed: {e}")
+            self.wakeup.wait(JOB_HEARTBEAT_S)
+            self.wakeup.clear()
+
+    def _heartbeat(self):
+        # 写入本进程任务的心跳与进度, 并响应其他进程发起的取消
+        with self.lock:
+            pipelines = {job_id: (pipeline, self.run_ids[job_id]) for job_id, pipeline in self.pipelines.items()}
+        for job_id, (pipeline, run_id) in pipelines.items():
+            owned = self._update_run(job_id, run_id, lambda job: job.update(
+                heartbeat=time.time(), progress=pipeline.stats.snapshot()) if job["status"] == "running" else None)
+            if not owned:
+                LOGGER.warning(f"Ingest job {job_id} was taken over by another run, stopping")
+                pipeline.cancel()
+            elif (self.cache.get(self._key(job_id)) or {}).get("status") == "cancelled":
+                pipeline.cancel()
+
+    def _run(self, job):
+        job_id = job["id"]
+        run_id = job["run_id"]
+
+        def checkpoint(position, counts):
+            if not self._update_run(job_id, run_id, lambda job: job.update(
+                    checkpoint={"position": position, "counts": counts}, heartbeat=time.time())):
+                LOGGER.warning(f"Ingest job {job_id} was taken over by another run, stopping")
+                pipeline.cancel()
+
+        pipeline = IngestPipeline(self.model, self.milvus_cli, job["table_name"], job["group"], job["extra"],
+                                  workers=self.workers, on_checkpoint=checkpoint, busy=self.busy)
+        with self.lock:
+            self.pipelines[job_id] = pipeline
+            self.run_ids[job_id] = run_id
+        try:
+            result = pipeline.run(job["img_dir"], job["recursive"], job["checkpoint"]["position"],
+                                  job["checkpoint"]["counts"])
+            if self._update_run(job_id, run_id, lambda job: job.update(
+                    status=job["status"] if job["status"] == "cancelled" else result["status"],
+                    error=result["error"], finished=time.time(), heartbeat=time.time(), progress=result)):
+                LOGGER.info(f"Ingest job {job_id} {result['status']}")
+            else:
+                LOGGER.warning(f"Ingest job {job_id} is owned by another run, discarding this run's result")
+        except Exception as e:
+            # 正常情况下 run 不会抛出异常, 这里保证任务状态不会停留在 running
+            LOGGER.error(f"Ingest job {job_id} failed: {e}")
+            self._update_run(job_id, run_id, lambda job: job.update(status="failed", error=str(e),
+                                                                    finished=time.time()))
+        finally:
+            with self.lock:
+                self.pipelines.pop(job_id, None)
+                self.run_ids.pop(job_id, None)
+            self.wakeup.set()
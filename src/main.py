@@ -1,20 +1,34 @@
-import uuid
+import asyncio
+import hashlib
+import json
+import threading
+import time
 
 import uvicorn
 import os
-from diskcache import Cache
-from fastapi import FastAPI, File, UploadFile
+from fastapi import Depends, FastAPI, File, Request, UploadFile
 from fastapi.param_functions import Form
 from starlette.middleware.cors import CORSMiddleware
-from starlette.responses import FileResponse, JSONResponse
-from milvus_helpers import MilvusHelper
-from config import TOP_K, UPLOAD_PATH, DEFAULT_TABLE, DATA_PATH
+from starlette.responses import FileResponse, JSONResponse, Response, StreamingResponse
+from config import TOP_K, UPLOAD_PATH, DEFAULT_TABLE, DATA_PATH, VECTOR_DIMENSION, DOWNLOAD_MAX_AGE
+from blob_store import BLOB_STORE
 from encode import ImageModel
-from operators import do_load, do_upload, do_search, do_count, do_drop, drop_image
+from operators import do_load, do_upload, do_search, do_batch_search, do_count, do_drop, drop_image, drop_images
+from jobs import JobQueue
+from concurrency import AdmissionLimiter, Overloaded, run_milvus
+from config import MAX_ACTIVE_REQUESTS, MAX_QUEUED_REQUESTS, QUEUE_TIMEOUT, BATCH_SEARCH_MAX, WARMUP
+from config import INDEX_OWNER_ADDRESS, INDEX_OWNER_AUTHKEY, UPLOAD_URLS_MAX, DELETE_MAX_UUIDS
+from fetcher import UrlFetcher
+from index_owner import RemoteMilvus
+from maintenance import Maintenance
+from vector_store import open_store
+from metrics import observe_request, render, span
+from preprocess import make_thumbnail
+from profiler import SamplingProfiler
+from query_cache import QueryCache
 from logs import LOGGER
 from pydantic import BaseModel
 from typing import Optional
-from urllib.request import urlretrieve
 
 app = FastAPI()
 origins = ["*"]
@@ -26,9 +40,62 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# 搜索与上传分别限流, 超出时快速失败而不是让延迟无限增长
+SEARCH_LIMITER = AdmissionLimiter("search", MAX_ACTIVE_REQUESTS, MAX_QUEUED_REQUESTS, QUEUE_TIMEOUT)
+UPLOAD_LIMITER = AdmissionLimiter("upload", MAX_ACTIVE_REQUESTS, MAX_QUEUED_REQUESTS, QUEUE_TIMEOUT)
+
+
+# URL 图片下载共享一个连接池
+FETCHER = UrlFetcher()
+
+
+@app.on_event("shutdown")
+async def close_fetcher():
+    await FETCHER.close()
+
+
+# 运行时通过 /profiler/start 与 /profiler/stop 开关
+PROFILER = SamplingProfiler()
+
+
+@app.middleware("http")
+async def record_metrics(request: Request, call_next):
+    # 按路由模板统计, 避免路径参数导致指标基数膨胀
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        route = request.scope.get("route")
+        endpoint = route.path if route is not None else "unmatched"
+        observe_request(request.method, endpoint, status, time.perf_counter() - start)
+
+
+@app.exception_handler(Overloaded)
+async def overloaded_handler(request, exc: Overloaded):
+    return JSONResponse(status_code=exc.status_code, content={'status': False, 'msg': exc.msg})
+
+# 模型按需加载; WARMUP 时在后台线程预热, 服务先启动, /ready 在加载完成后返回 200
 MODEL = ImageModel()
-MILVUS_CLI = MilvusHelper()
-MILVUS_CLI.init_default()
+if WARMUP:
+    threading.Thread(target=MODEL.warmup, name="model-warmup", daemon=True).start()
+if INDEX_OWNER_ADDRESS:
+    # 多进程部署 (serve.py): Milvus 由索引进程独占, 本进程只做推理, 向量经共享内存传递
+    MILVUS_CLI = RemoteMilvus(INDEX_OWNER_ADDRESS, INDEX_OWNER_AUTHKEY.encode())
+else:
+    # 新集合使用模型原生维度, 除非显式配置 VECTOR_DIMENSION
+    MILVUS_CLI = open_store(dimension=VECTOR_DIMENSION or MODEL.dimension)
+    MILVUS_CLI.init_default()
+    # 删除后的文件清理与自动压缩
+    Maintenance(MILVUS_CLI)
+# 搜索缓存, 集合变更时按分组失效
+QUERY_CACHE = QueryCache()
+MILVUS_CLI.add_listener(QUERY_CACHE.on_change)
+# 持久化导入任务队列, 有搜索在处理时导入让出 CPU
+JOB_QUEUE = JobQueue(MODEL, MILVUS_CLI, busy=lambda: SEARCH_LIMITER.active > 0)
+JOB_QUEUE.start()
 
 if not os.path.exists(DATA_PATH):
     os.makedirs(DATA_PATH)
@@ -40,43 +107,112 @@ if not os.path.exists(UPLOAD_PATH):
     LOGGER.info(f"mkdir the path:{UPLOAD_PATH}")
 
 
-@app.get('/img/download')
-def get_img(uuid: str):
-    # 查询是否存在
-    resList = MILVUS_CLI.client.query(filter=f"uuid == \"{uuid}\"", collection_name=DEFAULT_TABLE,
-                                      output_fields=["uuid", "meta", "md5"])
-    if len(resList) == 0:
-        return JSONResponse(status_code=404, content={
-            "status": False,
-            "msg": "图片不存在"
-        })
-    imageItem = resList[0]
-    print(imageItem)
-    uuid = imageItem["uuid"]
-    meta = imageItem["meta"]
-    if "ext" not in meta:
-        return JSONResponse(status_code=404, content={
-            "status": False,
-            "msg": "图片不存在"
-        })
-    ext = meta["ext"]
-    if not os.path.exists(os.path.join(UPLOAD_PATH, f"{uuid}.{ext}")):
-        return JSONResponse(status_code=404, content={
-            "status": False,
-            "msg": "图片不存在" + os.path.join(UPLOAD_PATH, f"{uuid}.{ext}")
-        })
-    return FileResponse(path=os.path.join(UPLOAD_PATH, f"{uuid}.{ext}"), status_code=200)
+def file_response(request, path):
+    """
+    文件按内容寻址 (md5 / uuid 命名), 内容不变: 文件名作为 ETag, If-None-Match 命中返回 304,
+    Range 请求由 FileResponse 返回 206, 并允许客户端与 CDN 长期缓存
+    :return: 文件不存在时返回 None
+    """
+    try:
+        stat_result = os.stat(path)
+    except FileNotFoundError:
+        return None
+    etag = f'"{os.path.basename(path)}"'
+    headers = {"ETag": etag, "Cache-Control": f"public, max-age={DOWNLOAD_MAX_AGE}, immutable"}
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and (if_none_match.strip() == "*" or etag in [tag.strip() for tag in if_none_match.split(",")]):
+        return Response(status_code=304, headers=headers)
+    return FileResponse(path=path, headers=headers, stat_result=stat_result)
 
 
-# @app.get('/progress')
-# def get_progress():
-#     # Get the progress of dealing with images
-#     try:
-#         cache = Cache('./tmp')
-#         return f"current: {cache['current']}, total: {cache['total']}"
-#     except Exception as e:
-#         LOGGER.error(f"upload image error: {e}")
-#         return {'status': False, 'msg': e}
+def image_not_found():
+    return JSONResponse(status_code=404, content={
+        "status": False,
+        "msg": "图片不存在"
+    })
+
+
+@app.get('/img/download')
+def get_img(uuid: str, request: Request):
+    # uuid -> (ext, path, thumbnail_path) 有缓存, 命中时不访问 Milvus
+    location = MILVUS_CLI.image_location(DEFAULT_TABLE, uuid)
+    if location is None:
+        return image_not_found()
+    response = file_response(request, location[1])
+    return response if response is not None else image_not_found()
+
+
+@app.get('/img/thumbnail')
+def get_thumbnail(uuid: str, request: Request):
+    # 缩略图在上传/导入时生成, 旧数据在第一次请求时由原图生成
+    location = MILVUS_CLI.image_location(DEFAULT_TABLE, uuid)
+    if location is None:
+        return image_not_found()
+    _, path, thumbnail = location
+    if thumbnail is None:
+        thumbnail = path
+    elif not os.path.exists(thumbnail):
+        try:
+            with open(path, "rb") as f:
+                BLOB_STORE.put(os.path.basename(thumbnail), make_thumbnail(f.read()))
+        except Exception as e:
+            LOGGER.warning(f"Failed to generate thumbnail for {uuid}: {e}")
+            thumbnail = path
+    response = file_response(request, thumbnail)
+    return response if response is not None else image_not_found()
+
+
+@app.get('/progress')
+def get_progress():
+    # 运行中导入任务的合计进度, 各任务的速度与预计剩余时间
+    return {'status': True, 'data': JOB_QUEUE.progress()}
+
+
+class IngestForm(BaseModel):
+    path: str
+    table_name: Optional[str] = None
+    group: Optional[str] = None
+    extra: Optional[str] = None
+    recursive: bool = False
+
+
+@app.post('/ingest/jobs')
+def create_ingest_job(form: IngestForm):
+    # 后台批量导入服务器上的图片目录, 任务持久化, 服务重启后从检查点继续
+    if not os.path.isdir(form.path):
+        return {'status': False, 'msg': '目录不存在'}
+    job_id = JOB_QUEUE.submit(form.path, form.table_name, form.group, form.extra, form.recursive)
+    return {'status': True, 'data': {'job_id': job_id}}
+
+
+@app.get('/ingest/jobs')
+def list_ingest_jobs(status: str = None):
+    return {'status': True, 'data': JOB_QUEUE.list(status)}
+
+
+@app.get('/ingest/jobs/{job_id}')
+def get_ingest_job(job_id: str):
+    job = JOB_QUEUE.get(job_id)
+    if job is None:
+        return JSONResponse(status_code=404, content={'status': False, 'msg': '任务不存在'})
+    return {'status': True, 'data': job}
+
+
+@app.delete('/ingest/jobs/{job_id}')
+def cancel_ingest_job(job_id: str):
+    status = JOB_QUEUE.cancel(job_id)
+    if status is None:
+        return JSONResponse(status_code=404, content={'status': False, 'msg': '任务不存在'})
+    return {'status': status == 'cancelled', 'data': {'job_id': job_id, 'status': status}}
+
+
+@app.post('/ingest/jobs/{job_id}/retry')
+def retry_ingest_job(job_id: str):
+    # 失败或已取消的任务从检查点继续
+    status = JOB_QUEUE.retry(job_id)
+    if status is None:
+        return JSONResponse(status_code=404, content={'status': False, 'msg': '任务不存在'})
+    return {'status': status == 'queued', 'data': {'job_id': job_id, 'status': status}}
 
 
 class Item(BaseModel):
@@ -84,62 +220,87 @@ class Item(BaseModel):
     File: str
 
 
-@app.post('/img/upload')
+@app.post('/img/upload', dependencies=[Depends(UPLOAD_LIMITER)])
 async def upload_images(image: UploadFile = File(None), url: str = None, table_name: str = None, group: str = None):
     # Insert the upload image to Milvus/MySQL
     try:
-        # Save the upload image to server.
+        # 图片内容只保存在内存中, 入库后直接写入最终文件
         if image is not None:
-            content = await image.read()
+            with span("upload_read"):
+                content = await image.read()
             ext = image.filename.split(".")[-1]
-            tempFileName = f"tmp_{uuid.uuid4()}.{ext}"
-            img_path = os.path.join(UPLOAD_PATH, tempFileName)
-            with open(img_path, "wb+") as f:
-                f.write(content)
         elif url is not None:
-            img_path = os.path.join(UPLOAD_PATH, os.path.basename(url))
-            urlretrieve(url, img_path)
+            # 异步下载, 边接收边计算 md5
+            content, md5, ext = await FETCHER.fetch(url)
         else:
             return {'status': False, 'msg': 'Image and url are required'}
-        resData = do_upload(table_name, img_path, MODEL, MILVUS_CLI, group)
+        if image is not None:
+            with span("md5"):
+                md5 = hashlib.md5(content).hexdigest()
+        resData = await do_upload(table_name, content, ext, MODEL, MILVUS_CLI, group, None, md5)
         return {'status': True, 'data': resData}
     except Exception as e:
         LOGGER.error(e)
         return {'status': False, 'msg': e}
 
 
-@app.post('/train/image/upload')  #上传训练单张图片
+class UploadUrlsForm(BaseModel):
+    urls: list[str]
+    table_name: Optional[str] = None
+    group: Optional[str] = None
+    extra: Optional[str] = None
+    save: bool = True
+
+
+@app.post('/img/upload/urls', dependencies=[Depends(UPLOAD_LIMITER)])
+async def upload_urls(form: UploadUrlsForm):
+    """
+    批量 URL 导入: 并发下载, 下载完成的图片立即进入推理, 由微批调度器合批; 单个 URL 失败只影响该条结果
+    """
+    if len(form.urls) == 0:
+        return {'status': False, 'msg': 'Urls are required'}
+    if len(form.urls) > UPLOAD_URLS_MAX:
+        return {'status': False, 'msg': f'At most {UPLOAD_URLS_MAX} urls per request'}
+
+    async def upload(url):
+        content, md5, ext = await FETCHER.fetch(url)
+        return await do_upload(form.table_name, content, ext, MODEL, MILVUS_CLI, form.group, form.extra, md5,
+                               save=form.save)
+
+    results = await asyncio.gather(*(upload(url) for url in form.urls), return_exceptions=True)
+    data = []
+    for url, res in zip(form.urls, results):
+        if isinstance(res, BaseException):
+            LOGGER.error(f"Url upload failed for {url}: {res}")
+            data.append({'url': url, 'status': False, 'msg': str(res)})
+        else:
+            data.append({'url': url, 'status': True, 'data': res})
+    LOGGER.info(f"Uploaded {sum(item['status'] for item in data)} of {len(data)} urls")
+    return jsonable({'status': True, 'data': data})
+
+
+@app.post('/train/image/upload', dependencies=[Depends(UPLOAD_LIMITER)])  #上传训练单张图片
 async def train_image_upload(image: UploadFile = File(None), delete: bool = Form(False), group: str = Form(None),
                              extra: str = Form(None)):
-    print(f"/train/image/upload group {group}, extra {extra}")
+    LOGGER.debug(f"/train/image/upload group {group}, extra {extra}")
     try:
         if image is None:
             return {'status': False, 'msg': 'Image is required'}
 
-        content = await image.read()
+        with span("upload_read"):
+            content = await image.read()
+        with span("md5"):
+            md5 = hashlib.md5(content).hexdigest()
         ext = image.filename.split(".")[-1]
-        tempFileName = f"tmp_{uuid.uuid4()}.{ext}"
-        img_path = os.path.join(UPLOAD_PATH, tempFileName)
-        with open(img_path, "wb+") as f:
-            f.write(content)
-        f.close()
-        trainData = do_upload(DEFAULT_TABLE, img_path, MODEL, MILVUS_CLI, group, extra)
+        # delete 为 True 时只入库不保存图片
+        trainData = await do_upload(DEFAULT_TABLE, content, ext, MODEL, MILVUS_CLI, group, extra, md5, save=not delete)
         if len(trainData) < 1:
             return {'status': False, 'msg': '训练失败'}
-        print("trainData", trainData)
         resData = {
             "uuid": trainData[0]["uuid"],
             "md5": trainData[0]["md5"],
             "meta": trainData[0]["meta"]
         }
-        if delete:
-            os.unlink(img_path)  # 删除上传的图片
-            print(f"img_path {img_path}")
-        else:
-            ext = image.filename.split(".")[-1]
-            new_img_path = os.path.join(UPLOAD_PATH, trainData[0]["uuid"] + "." + ext)
-            os.rename(img_path, new_img_path)
-            print(f"rename {img_path} -> {new_img_path}")
         return {'status': True, 'data': resData}
     except Exception as e:
         LOGGER.error(e)
@@ -153,42 +314,119 @@ async def train_image_delete(uuid: str, group: str):
         if uuid is None:
             return {'status': False, 'msg': 'UUID is required'}
 
-        resData = drop_image(DEFAULT_TABLE, uuid=uuid, milvus_cli=MILVUS_CLI, group=group)
+        resData = await run_milvus(drop_image, DEFAULT_TABLE, uuid=uuid, milvus_cli=MILVUS_CLI, group=group)
         return {'status': True, 'data': resData}
     except Exception as e:
         LOGGER.error(e)
         return {'status': False, 'msg': "删除异常"}
 
 
+class DeleteImagesForm(BaseModel):
+    uuids: Optional[list[str]] = None
+    group: Optional[str] = None
+    table_name: Optional[str] = None
+
+
+@app.post('/images/delete')
+async def delete_images(form: DeleteImagesForm):
+    # 批量删除: 给出 uuids 时删除这些图片 (group 限定分组), 只给出 group 时删除整个分组;
+    # 图片文件在后台清理, 已删除行占比达到阈值后自动压缩
+    if not form.uuids and not form.group:
+        return {'status': False, 'msg': '缺少参数'}
+    if form.uuids and len(form.uuids) > DELETE_MAX_UUIDS:
+        return {'status': False, 'msg': f'单次最多删除 {DELETE_MAX_UUIDS} 张图片'}
+    try:
+        deleted = await run_milvus(drop_images, form.table_name, MILVUS_CLI, form.uuids, form.group)
+        return {'status': True, 'data': {'deleted': deleted}}
+    except Exception as e:
+        LOGGER.error(e)
+        return {'status': False, 'msg': "删除异常"}
+
+
+@app.get('/maintenance')
+def maintenance_report():
+    # 文件清理统计与最近的压缩报告: 回收的空间, 压缩前后的搜索延迟
+    return {'status': True, 'data': MILVUS_CLI.maintenance_report()}
+
+
+@app.post('/maintenance/compact')
+def compact_collection(table_name: str = None):
+    # 不论删除比例, 立即在后台压缩一次, 结果见 /maintenance
+    scheduled = MILVUS_CLI.schedule_compaction(table_name or DEFAULT_TABLE)
+    return {'status': scheduled, 'data': {'table_name': table_name or DEFAULT_TABLE}}
+
+
+def search_overrides(ef, nprobe):
+    # 请求级搜索参数, 未传时使用集合配置
+    params = {key: value for key, value in (("ef", ef), ("nprobe", nprobe)) if value is not None}
+    return params or None
+
+
 #搜索某张图片
-@app.post('/img/search')
-async def search_images(image: UploadFile = File(...), topk: int = Form(TOP_K), group: str = Form(None)):
+@app.post('/img/search', dependencies=[Depends(SEARCH_LIMITER)])
+async def search_images(image: UploadFile = File(...), topk: int = Form(TOP_K), group: str = Form(None),
+                        ef: int = Form(None), nprobe: int = Form(None)):
     # Search the upload image in Milvus/MySQL
     try:
-        # Save the upload image to server.
-        content = await image.read()
-        ext = image.filename.split(".")[-1]
-        tempFileName = f"tmp_{uuid.uuid4()}.{ext}"
-        img_path = os.path.join(UPLOAD_PATH, tempFileName)
-        with open(img_path, "wb+") as f:
-            f.write(content)
-        f.close()
-        res = do_search(DEFAULT_TABLE, img_path, topk, MODEL, MILVUS_CLI, group)
+        # 直接在内存中解码搜索, 不写临时文件
+        with span("upload_read"):
+            content = await image.read()
+        res = await do_search(DEFAULT_TABLE, content, topk, MODEL, MILVUS_CLI, group, cache=QUERY_CACHE,
+                              search_params=search_overrides(ef, nprobe))
         if len(res) > 0:
             res = res[0]
         LOGGER.info("Successfully searched similar images!")
-        os.unlink(img_path)  # 删除上传文件
         return {'status': True, 'data': res}
     except Exception as e:
         LOGGER.error(e)
         return {'status': False, 'msg': e}
 
+#批量搜索多张图片
+@app.post('/img/search/batch', dependencies=[Depends(SEARCH_LIMITER)])
+async def batch_search_images(images: list[UploadFile] = File(None), urls: list[str] = Form(None),
+                              topk: int = Form(TOP_K), group: str = Form(None), ef: int = Form(None),
+                              nprobe: int = Form(None)):
+    try:
+        images = images or []
+        urls = urls or []
+        total = len(images) + len(urls)
+        if total == 0:
+            return {'status': False, 'msg': 'Images or urls are required'}
+        if total > BATCH_SEARCH_MAX:
+            return {'status': False, 'msg': f'At most {BATCH_SEARCH_MAX} images per request'}
+        sources = [image.filename for image in images] + urls
+        with span("upload_read"):
+            contents = [await image.read() for image in images]
+        # 并发下载全部 url, 单个失败只影响该条结果
+        fetched = await asyncio.gather(*(FETCHER.fetch(url) for url in urls), return_exceptions=True)
+        contents += [res if isinstance(res, BaseException) else res[0] for res in fetched]
+        loaded = [i for i, content in enumerate(contents) if not isinstance(content, BaseException)]
+        searched = await do_batch_search(DEFAULT_TABLE, [contents[i] for i in loaded], topk, MODEL, MILVUS_CLI,
+                                         group, cache=QUERY_CACHE, search_params=search_overrides(ef, nprobe))
+        for i, res in zip(loaded, searched):
+            contents[i] = res
+        data = []
+        for i, res in enumerate(contents):
+            if isinstance(res, BaseException):
+                LOGGER.error(f"Batch search failed for {sources[i]}: {res}")
+                data.append({'index': i, 'source': sources[i], 'status': False, 'msg': str(res)})
+            else:
+                data.append({'index': i, 'source': sources[i], 'status': True, 'data': res})
+        LOGGER.info(f"Successfully searched {len(loaded)} images in one batch!")
+        return {'status': True, 'data': data}
+    except Exception as e:
+        LOGGER.error(e)
+        return {'status': False, 'msg': e}
+
+
 class InnerSearchFrom(BaseModel):
     ids: list[str]
     group: str | None = None,
     topk: int = 10
+    ef: int | None = None
+    nprobe: int | None = None
 
-@app.post('/img/inner/search')
+@app.post('/img/inner/search', dependencies=[Depends(SEARCH_LIMITER)])
 async def inner_search(form: InnerSearchFrom):
     group = ""
     if form.group is not None:
@@ -202,16 +440,13 @@ async def inner_search(form: InnerSearchFrom):
     ids = []
     for rawId in rawIds:
         ids.append(int(rawId))
-    targetList = MILVUS_CLI.client.get(collection_name=DEFAULT_TABLE,ids=ids,output_fields=["id","embedding"])
+    targetList = await run_milvus(MILVUS_CLI.get, collection_name=DEFAULT_TABLE, ids=ids,
+                                  output_fields=["id", "embedding"])
     embeddingList = []
     for item in targetList:
         embeddingList.append(item["embedding"])
-    resList = MILVUS_CLI.search_vectors(collection_name=DEFAULT_TABLE,vectors=embeddingList,top_k=form.topk,group=group)
-    rows = []
-
-    print(resList)
-
-
+    resList = await run_milvus(MILVUS_CLI.search_vectors, collection_name=DEFAULT_TABLE, vectors=embeddingList,
+                               top_k=form.topk, group=group, search_params=search_overrides(form.ef, form.nprobe))
     return {
         'status': True,
         'data': resList,
@@ -222,7 +457,7 @@ async def inner_search(form: InnerSearchFrom):
 async def count_images():
     # Returns the total number of images in the system
     try:
-        num = do_count(DEFAULT_TABLE, MILVUS_CLI)
+        num = await run_milvus(do_count, DEFAULT_TABLE, MILVUS_CLI)
         LOGGER.info("Successfully count the number of images!")
         return {'status': True, 'data': num}
     except Exception as e:
@@ -230,48 +465,148 @@ async def count_images():
         return {'status': False, 'msg': e}
 
 
+@app.get('/model/stats')
+async def model_stats():
+    # 微批调度统计: 批填充率与排队等待时间
+    return {'status': True, 'data': {
+        'batching': MODEL.batch_stats(),
+        'search_limiter': SEARCH_LIMITER.snapshot(),
+        'upload_limiter': UPLOAD_LIMITER.snapshot(),
+    }}
+
+
+@app.get('/ready')
+async def ready():
+    # 就绪检查: 启用的模型是否已加载
+    status = MODEL.status()
+    return JSONResponse(status_code=200 if status['ready'] else 503,
+                        content={'status': status['ready'], 'data': status})
+
+
+@app.get('/metrics')
+def metrics():
+    # Prometheus 抓取接口
+    body, content_type = render()
+    return Response(content=body, media_type=content_type)
+
+
+@app.post('/profiler/start')
+async def start_profiler(interval_ms: float = 10):
+    # 开始采样, 已在运行时不重置已有样本
+    started = PROFILER.start(interval_ms)
+    return {'status': started, 'data': PROFILER.snapshot(top=0)}
+
+
+@app.post('/profiler/stop')
+async def stop_profiler(top: int = 50):
+    PROFILER.stop()
+    return {'status': True, 'data': PROFILER.snapshot(top)}
+
+
+@app.get('/profiler')
+async def get_profiler(top: int = 50, collapsed: bool = False):
+    # collapsed=true 时返回折叠栈文本, 可直接生成火焰图
+    if collapsed:
+        return Response(content=PROFILER.collapsed(), media_type="text/plain")
+    return {'status': True, 'data': PROFILER.snapshot(top)}
+
+
+@app.get('/cache/stats')
+async def cache_stats():
+    # 查询缓存命中/未命中/淘汰计数
+    return {'status': True, 'data': QUERY_CACHE.stats()}
+
+
+# 以下仅做 Milvus 查询的接口使用普通函数, 由 FastAPI 放到线程池执行, 不阻塞事件循环
 @app.get('/group/all')
-async def all_group():
-    iterator = MILVUS_CLI.client.query_iterator(collection_name=DEFAULT_TABLE, filter="", batch_size=20,
-                                                output_fields=["id", "meta"])
-    groups = []
-    while True:
-        tmp = iterator.next()
-        if not tmp:
-            iterator.close()
-            break
-        for item in tmp:
-            if "group" in item["meta"]:
-                group = item["meta"]["group"]
-                if group not in groups:
-                    groups.append(group)
+def all_group():
+    # 分组注册表维护了每个分组的图片数, 不再扫描整个集合
+    groups = list(MILVUS_CLI.group_counts(DEFAULT_TABLE).keys())
     return {
         "status": True,
         "data": groups
     }
 
 
+@app.get('/group/counts')
+def group_counts():
+    return {
+        "status": True,
+        "data": MILVUS_CLI.group_counts(DEFAULT_TABLE)
+    }
+
+
+@app.post('/group/rebuild')
+def rebuild_groups():
+    # 从集合重建分组注册表
+    return {
+        "status": True,
+        "data": MILVUS_CLI.group_counts(DEFAULT_TABLE, rebuild=True)
+    }
+
+
+# 导出接口可选的字段, id 与 uuid 总是返回
+EXPORT_FIELDS = {"meta", "md5", "group", "embedding"}
+
+
+def export_fields(fields):
+    selected = [field.strip() for field in (fields or "").split(",") if field.strip()]
+    unknown = set(selected) - EXPORT_FIELDS
+    if unknown:
+        raise ValueError(f"Unknown fields: {sorted(unknown)}")
+    if "group" in selected and not MILVUS_CLI.has_group_field(DEFAULT_TABLE):
+        selected.remove("group")
+    return ["id", "uuid"] + selected
+
+
 @app.get('/images/all')
-async def all_images(group: str):
-    targetFilter = ""
-    if group is not None and group != "":
-        targetFilter = f'meta["group"] == "{group}"'
-    iterator = MILVUS_CLI.client.query_iterator(collection_name=DEFAULT_TABLE, filter=targetFilter, batch_size=20,
-                                                output_fields=["id", "uuid"])
+def all_images(group: str, after_id: int = None, limit: int = None, fields: str = None):
+    # 游标分页: 传入上一页的 next_after_id 继续, limit 为空时返回该分组全部图片
+    try:
+        outputFields = export_fields(fields)
+    except ValueError as e:
+        return {'status': False, 'msg': str(e)}
     results = []
-    while True:
-        tmp = iterator.next()
-        if not tmp:
-            iterator.close()
-            break
+    for tmp in MILVUS_CLI.iterate(DEFAULT_TABLE, outputFields, group, after_id, limit):
         results += tmp
-    return {'status': True, 'data': results}
+    nextAfterId = results[-1]["id"] if limit is not None and len(results) == limit else None
+    return jsonable({'status': True, 'data': results, 'next_after_id': nextAfterId})
+
+
+@app.get('/images/export')
+def export_images(group: str = None, after_id: int = None, limit: int = None, fields: str = None):
+    """
+    以 NDJSON 流式导出, 每行一张图片, 不在进程中缓存整个集合;
+    中断后用最后一行的 id 作为 after_id 继续
+    """
+    try:
+        outputFields = export_fields(fields)
+    except ValueError as e:
+        return JSONResponse(status_code=400, content={'status': False, 'msg': str(e)})
+
+    def rows():
+        for tmp in MILVUS_CLI.iterate(DEFAULT_TABLE, outputFields, group, after_id, limit):
+            yield "".join(json.dumps(item, default=to_json, ensure_ascii=False) + "\n" for item in tmp)
+
+    return StreamingResponse(rows(), media_type="application/x-ndjson")
+
+
+def to_json(value):
+    # numpy 数组/标量 (如导出的向量) 转为 JSON 可序列化的值
+    if hasattr(value, "tolist"):
+        return value.tolist()
+    return str(value)
+
+
+def jsonable(data):
+    return json.loads(json.dumps(data, default=to_json, ensure_ascii=False))
+
 
 class InfoIDForm(BaseModel):
     ids: list[str]
 
 @app.post('/images/info/ids')
-async def query_images_ids(item: InfoIDForm):
+def query_images_ids(item: InfoIDForm):
     if len(item.ids) < 1:
         return {
             'status': False,
@@ -281,8 +616,7 @@ async def query_images_ids(item: InfoIDForm):
     ids = []
     for idStr in rawIds:
         ids.append(int(idStr))
-    print(ids)
-    resList = MILVUS_CLI.client.get(collection_name=DEFAULT_TABLE, ids=ids, output_fields=["id", "uuid", "md5", "meta"])
+    resList = MILVUS_CLI.get(collection_name=DEFAULT_TABLE, ids=ids, output_fields=["id", "uuid", "md5", "meta"])
     return {
         "status": True,
         "data": resList
@@ -294,7 +628,7 @@ class InfoUUIDForm(BaseModel):
 
 
 @app.post('/images/info/uuids')
-async def query_image_uuids(item: InfoUUIDForm):
+def query_image_uuids(item: InfoUUIDForm):
     uuids = item.uuids
     # print(uuids)
     if len(uuids) < 1:
@@ -302,11 +636,8 @@ async def query_image_uuids(item: InfoUUIDForm):
             'status': False,
             "error": "缺少参数"
         }
-    resList = []
-    for uuidStr in uuids:
-        tmp = MILVUS_CLI.client.query(collection_name=DEFAULT_TABLE, filter=f"uuid == \"{uuidStr}\" ", output_fields=["id", "uuid", "md5", "meta"])
-        if len(tmp) > 0:
-            resList.append(tmp[0])
+    # 一次 `uuid in [...]` 查询取回全部
+    resList = MILVUS_CLI.get_by_uuids(DEFAULT_TABLE, uuids)
     return {
         "status": True,
         "data": resList
@@ -0,0 +1,251 @@
+"""
+删除后的后台维护: 清理不再被引用的图片文件, 已删除行占比达到阈值时自动压缩集合。
+
+    删除 -> notify(removed=rows) -> BlobCollector: 删除原图 / 缩略图 / 旧的平铺文件
+                                 -> Compactor: 比例达到阈值后 compact(), 记录回收的空间与压缩前后的搜索延迟
+
+只在持有向量存储的进程中启动 (单进程的 main.py 或 serve.py 的索引进程), worker 经 RemoteMilvus 读取报告。
+"""
+import collections
+import os
+import queue
+import statistics
+import threading
+import time
+
+from blob_store import BLOB_STORE, remove_file, thumbnail_key
+from config import DEFAULT_TABLE, TOP_K, UPLOAD_PATH, COMPACT_DELETED_RATIO, COMPACT_MIN_DELETED, COMPACT_CHECK_S, \
+    COMPACT_PROBES
+from logs import LOGGER
+
+# 保留最近的压缩报告条数
+REPORTS_SIZE = 20
+
+
+class BlobCollector:
+    """
+    删除行的图片文件清理, 在后台线程中进行, 不阻塞删除请求。
+    按内容寻址的文件在所有集合间共用, 任一集合仍引用相同 md5 时保留。
+
+    上传与导入总是先写入行再保存文件 (已存在时跳过), 清理时先把文件改名为墓碑, 再确认一次引用:
+    确认前插入的行会被看到, 文件放回原处; 确认后插入的行保存文件时原路径已不存在, 会重新写入。
+
+    Args:
+        store (`VectorStore`):
+            向量存储, 用于判断文件是否仍被引用。
+        blobs (`BlobStore`):
+            图片文件存储。
+    """
+
+    def __init__(self, store, blobs=BLOB_STORE):
+        self.store = store
+        self.blobs = blobs
+        self.queue = queue.Queue()
+        self.lock = threading.Lock()
+        self.stats = {"rows": 0, "files": 0, "reclaimed_bytes": 0, "restored": 0, "failed": 0}
+        threading.Thread(target=self._run, name="blob-gc", daemon=True).start()
+
+    def on_change(self, collection_name, added, removed):
+        # removed 为 None (删除了整个集合或行未知) 时无法确定文件, 不做清理
+        if removed:
+            self.queue.put((collection_name, list(removed)))
+
+    def snapshot(self):
+        with self.lock:
+            return dict(self.stats, pending=self.queue.qsize())
+
+    def _run(self):
+        while True:
+            collection_name, rows = self.queue.get()
+            try:
+                self.collect(collection_name, rows)
+            except Exception as e:
+                LOGGER.error(f"Failed to collect files of {collection_name}: {e}")
+                with self.lock:
+                    self.stats["failed"] += len(rows)
+
+    def collect(self, collection_name, rows):
+        # 同一 uuid 在其他分组仍有行时保留其文件
+        alive = {row["uuid"] for row in self.store.get_by_uuids(collection_name, [row["uuid"] for row in rows],
+                                                                ("uuid",))}
+        sizes = []
+        keys = {}
+        for row in rows:
+            meta = row.get("meta") or {}
+            if row["uuid"] in alive or "ext" not in meta:
+                continue
+            md5 = row.get("md5")
+            if meta.get("blob"):
+                if md5:
+                    keys.setdefault(md5, set()).add(meta["blob"])
+            else:
+                # 旧的平铺文件按 uuid 命名, 只属于这一行
+                sizes.append(remove_file(os.path.join(UPLOAD_PATH, f"{row['uuid']}.{meta['ext']}")))
+            if md5:
+                keys.setdefault(md5, set()).add(thumbnail_key(md5))
+        referenced = self.store.referenced_md5s(keys) if keys else set()
+        buried = []
+        for md5, md5_keys in keys.items():
+            if md5 in referenced:
+                continue
+            for key in sorted(md5_keys):
+                tomb = self.blobs.bury(key)
+                if tomb is not None:
+                    buried.append((md5, key, tomb))
+        # 改名后再确认一次, 期间插入了相同内容的行时放回原处
+        referenced = self.store.referenced_md5s({md5 for md5, _, _ in buried}) if buried else set()
+        restored = 0
+        for md5, key, tomb in buried:
+            if md5 in referenced:
+                self.blobs.restore(key, tomb)
+                restored += 1
+            else:
+                sizes.append(remove_file(tomb))
+        files = sum(1 for size in sizes if size)
+        reclaimed = sum(sizes)
+        with self.lock:
+            self.stats["rows"] += len(rows)
+            self.stats["files"] += files
+            self.stats["reclaimed_bytes"] += reclaimed
+            self.stats["restored"] += restored
+        LOGGER.info(f"Removed {files} files ({reclaimed} bytes) of {len(rows)} deleted rows in {collection_name}")
+
+
+class Compactor:
+    """
+    删除后定期检查已删除行占比, 达到阈值时压缩集合, 每次压缩记录回收的空间与压缩前后的搜索延迟。
+
+    Args:
+        store (`VectorStore`):
+            提供 deleted_rows / count / compact 的向量存储。
+        ratio (`float`):
+            触发压缩的已删除行占比。
+        min_deleted (`int`):
+            触发压缩的最少已删除行数, 避免小集合频繁压缩。
+        probes (`int`):
+            测量搜索延迟使用的查询数, 取集合中已有的向量。
+    """
+
+    def __init__(self, store, ratio=COMPACT_DELETED_RATIO, min_deleted=COMPACT_MIN_DELETED, interval=COMPACT_CHECK_S,
+                 probes=COMPACT_PROBES):
+        self.store = store
+        self.ratio = ratio
+        self.min_deleted = min_deleted
+        self.interval = interval
+        self.probes = probes
+        self.lock = threading.Lock()
+        # 待检查的集合 -> 是否强制压缩; 启动后检查一次默认集合, NumPy 存储的删除计数在重启后仍保留
+        self.pending = {DEFAULT_TABLE: False}
+        self.running = None
+        self.reports = collections.deque(maxlen=REPORTS_SIZE)
+        self.wakeup = threading.Event()
+        threading.Thread(target=self._run, name="compactor", daemon=True).start()
+
+    def on_change(self, collection_name, added, removed):
+        if removed:
+            self.schedule(collection_name)
+
+    def schedule(self, collection_name, force=False):
+        # 删除只登记集合, 下一次定期检查时统一判断; 强制压缩立即唤醒
+        with self.lock:
+            self.pending[collection_name] = self.pending.get(collection_name, False) or force
+        if force:
+            self.wakeup.set()
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                "pending": sorted(self.pending),
+                "running": self.running,
+                "reports": list(self.reports),
+            }
+
+    def _run(self):
+        while True:
+            self.wakeup.wait(self.interval)
+            self.wakeup.clear()
+            with self.lock:
+                pending, self.pending = self.pending, {}
+            for collection_name, force in pending.items():
+                try:
+                    if force or self.due(collection_name):
+                        self.compact(collection_name)
+                except Exception as e:
+                    LOGGER.error(f"Failed to compact {collection_name}: {e}")
+                    with self.lock:
+                        self.reports.append({"collection": collection_name, "error": str(e), "finished": time.time()})
+
+    def due(self, collection_name):
+        if not self.store.has_collection(collection_name):
+            return False
+        deleted = self.store.deleted_rows(collection_name)
+        total = deleted + self.store.count(collection_name)
+        return deleted >= self.min_deleted and deleted >= self.ratio * total
+
+    def compact(self, collection_name):
+        deleted = self.store.deleted_rows(collection_name)
+        total = deleted + self.store.count(collection_name)
+        probes = self.probe_vectors(collection_name)
+        before = self.latency(collection_name, probes)
+        LOGGER.info(f"Compacting {collection_name}: {deleted} of {total} rows deleted")
+        with self.lock:
+            self.running = collection_name
+        started = time.time()
+        try:
+            result = self.store.compact(collection_name)
+        finally:
+            with self.lock:
+                self.running = None
+        report = {
+            "collection": collection_name,
+            "deleted_rows": deleted,
+            "deleted_ratio": round(deleted / total, 4) if total else 0.0,
+            "reclaimed_bytes": result["reclaimed_bytes"],
+            "duration_s": round(time.time() - started, 3),
+            "search_p50_ms_before": before,
+            "search_p50_ms_after": self.latency(collection_name, probes),
+            "finished": time.time(),
+        }
+        with self.lock:
+            self.reports.append(report)
+        LOGGER.info(f"Compacted {collection_name}: {report}")
+        return report
+
+    def probe_vectors(self, collection_name):
+        # 集合中最前面的几条向量作为延迟探测查询
+        batches = self.store.iterate(collection_name, ["embedding"], limit=self.probes)
+        try:
+            rows = next(batches, [])
+        finally:
+            batches.close()
+        return [row["embedding"] for row in rows]
+
+    def latency(self, collection_name, probes):
+        # 逐条搜索的延迟中位数 (毫秒), 与交互搜索的调用方式一致
+        if not probes:
+            return None
+        timings = []
+        for vector in probes:
+            start = time.perf_counter()
+            self.store.search_vectors(collection_name, [vector], TOP_K, None)
+            timings.append((time.perf_counter() - start) * 1000)
+        return round(statistics.median(timings), 3)
+
+
+class Maintenance:
+    """
+    在向量存储上注册文件清理与自动压缩, 报告经 VectorStore.maintenance_report 读取
+    """
+
+    def __init__(self, store):
+        self.collector = BlobCollector(store)
+        self.compactor = Compactor(store)
+        store.add_listener(self.collector.on_change)
+        store.add_listener(self.compactor.on_change)
+        store.maintenance = self
+
+    def report(self):
+        return {
+            "files": self.collector.snapshot(),
+            "compaction": self.compactor.snapshot(),
+        }
@@ -0,0 +1,82 @@
+import threading
+
+from logs import LOGGER
+
+
+class Md5Index:
+    """
+    MD5 -> (id, uuid, meta) 的内存索引, 启动时从集合加载一次, 写入/删除时同步更新,
+    去重判断不再需要查询 Milvus。
+
+    同一个 md5 在不同分组下可能对应多行, 因此每个 md5 保存一个元组列表。
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.by_md5 = {}
+        self.by_uuid = {}
+
+    def __len__(self):
+        return len(self.by_uuid)
+
+    def load(self, milvus_client, collection_name, batch_size=4096):
+        # 一次大批量扫描重建索引
+        iterator = milvus_client.query_iterator(collection_name=collection_name, filter="", batch_size=batch_size,
+                                                output_fields=["id", "uuid", "md5", "meta"])
+        count = 0
+        with self.lock:
+            self.by_md5.clear()
+            self.by_uuid.clear()
+            while True:
+                tmp = iterator.next()
+                if not tmp:
+                    iterator.close()
+                    break
+                for item in tmp:
+                    self._add(item)
+                count += len(tmp)
+        LOGGER.info(f"Loaded md5 index of {collection_name} with {count} rows")
+
+    def add(self, row):
+        with self.lock:
+            self._add(row)
+
+    def _add(self, row):
+        md5 = row.get("md5")
+        if not md5:
+            return
+        entry = (row.get("id"), row["uuid"], row["meta"])
+        self.by_md5.setdefault(md5, []).append(entry)
+        self.by_uuid.setdefault(row["uuid"], []).append(md5)
+
+    def lookup(self, md5, group=None):
+        """
+        查找 md5 对应的行, group 为 None 时不限分组
+        :return: 与 query(output_fields=["uuid", "meta", "md5"]) 结构一致的列表
+        """
+        with self.lock:
+            entries = list(self.by_md5.get(md5, ()))
+        return [{"id": id, "uuid": uuid, "md5": md5, "meta": meta} for id, uuid, meta in entries
+                if group is None or meta.get("group") == group]
+
+    def contains(self, md5):
+        return md5 in self.by_md5
+
+    def remove_uuid(self, uuid, group=None):
+        # 与 drop_uuid 的过滤条件保持一致: group 为空时删除该 uuid 的所有行
+        removed = []
+        with self.lock:
+            for md5 in set(self.by_uuid.pop(uuid, [])):
+                keep = []
+                for entry in self.by_md5.get(md5, []):
+                    if entry[1] == uuid and (not group or entry[2].get("group") == group):
+                        removed.append({"id": entry[0], "uuid": uuid, "md5": md5, "meta": entry[2]})
+                    else:
+                        keep.append(entry)
+                if keep:
+                    self.by_md5[md5] = keep
+                else:
+                    self.by_md5.pop(md5, None)
+                if any(entry[1] == uuid for entry in keep):
+                    self.by_uuid.setdefault(uuid, []).append(md5)
+        return removed
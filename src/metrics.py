@@ -0,0 +1,55 @@
+"""
+Prometheus 指标: 各处理阶段耗时直方图, 以及每个接口的请求计数与延迟。
+
+多进程部署 (serve.py) 时设置 PROMETHEUS_MULTIPROC_DIR, /metrics 汇总所有 worker 的指标。
+"""
+import os
+import time
+from contextlib import contextmanager
+
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Gauge, \
+    Histogram, generate_latest
+
+# 覆盖 0.5ms ~ 30s, 解码/前向/Milvus 调用都落在这个范围
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+STAGE_SECONDS = Histogram("image_search_stage_seconds", "Time spent in each processing stage", ["stage"],
+                          buckets=BUCKETS)
+REQUESTS = Counter("image_search_requests_total", "HTTP requests by endpoint and status",
+                   ["method", "endpoint", "status"])
+REQUEST_SECONDS = Histogram("image_search_request_seconds", "HTTP request latency by endpoint",
+                            ["method", "endpoint"], buckets=BUCKETS)
+# 准入控制中正在处理 (active) 与排队 (waiting) 的请求数, 多进程时为各 worker 之和
+IN_FLIGHT = Gauge("image_search_in_flight_requests", "Requests admitted or queued by each limiter",
+                  ["limiter", "state"], multiprocess_mode="livesum")
+DUPLICATES = Counter("image_search_duplicates_total", "Images skipped before inference as duplicates", ["kind"])
+
+
+@contextmanager
+def span(stage):
+    """
+    记录一个阶段的耗时: `with span("decode"): ...`
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        STAGE_SECONDS.labels(stage).observe(time.perf_counter() - start)
+
+
+def observe_request(method, endpoint, status, seconds):
+    REQUESTS.labels(method, endpoint, str(status)).inc()
+    REQUEST_SECONDS.labels(method, endpoint).observe(seconds)
+
+
+def render():
+    """
+    :return: (body, content_type)
+    """
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
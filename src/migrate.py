@@ -0,0 +1,183 @@
+"""
+集合迁移工具: 把已有集合改写为当前的存储格式, 不需要重新跑模型。
+
+    python migrate.py compact --collection default
+    python migrate.py partition-key --collection default
+    python migrate.py reindex --collection default --index-type HNSW --params '{"M": 32, "efConstruction": 300}'
+    python migrate.py storage --collection default --storage float16 --hash-bits 1024
+"""
+import argparse
+import json
+
+import numpy as np
+
+from config import DEFAULT_TABLE
+from logs import LOGGER
+from milvus_helpers import MilvusHelper
+from vector_storage import as_vector
+
+
+def iterate_rows(milvus_cli, collection_name, output_fields, batch_size=1000):
+    iterator = milvus_cli.client.query_iterator(collection_name=collection_name, filter="", batch_size=batch_size,
+                                                output_fields=output_fields)
+    while True:
+        tmp = iterator.next()
+        if not tmp:
+            iterator.close()
+            break
+        yield tmp
+
+
+def detect_dimension(milvus_cli, collection_name, batch_size=1000):
+    # 补零的维度全为 0, 取所有向量中最后一个非零分量的位置作为原生维度
+    dimension = 0
+    for batch in iterate_rows(milvus_cli, collection_name, ["id", "embedding"], batch_size):
+        matrix = np.stack([as_vector(row["embedding"]) for row in batch])
+        nonzero = np.flatnonzero(np.any(matrix != 0, axis=0))
+        if len(nonzero) > 0:
+            dimension = max(dimension, int(nonzero[-1]) + 1)
+    return dimension
+
+
+def rewrite_collection(milvus_cli, collection_name, transform, batch_size=1000, keep_old=False, **create_kwargs):
+    """
+    把集合逐批复制到一个新集合, 每一行经过 transform 改写, 完成后替换原集合。
+
+    新集合使用当前的集合结构 (包括 group partition key 字段), group 从 meta 中提取。
+    注意: 主键 id 是 auto_id, 迁移后会重新分配; uuid / md5 / meta 保持不变。
+    """
+    target = f"{collection_name}_migrating"
+    backup = f"{collection_name}_backup"
+    if milvus_cli.has_collection(backup):
+        raise RuntimeError(f"Collection {backup} already exists, drop it before migrating {collection_name}")
+    # 未指定时保持原集合的存储精度与哈希字段
+    storage, hash_bits = milvus_cli.collection_storage(collection_name)
+    create_kwargs.setdefault("storage", storage)
+    create_kwargs.setdefault("hash_bits", hash_bits)
+    if milvus_cli.has_collection(target):
+        milvus_cli.delete_collection(target)
+    milvus_cli.create_collection(target, **create_kwargs)
+    copied = 0
+    for batch in iterate_rows(milvus_cli, collection_name, ["uuid", "md5", "meta", "embedding"], batch_size):
+        rows = []
+        for row in batch:
+            row = transform(row)
+            # 主键由新集合重新分配
+            row.pop("id", None)
+            rows.append(row)
+        milvus_cli.client.insert(target, milvus_cli.prepare_rows(target, rows))
+        copied += len(rows)
+        LOGGER.info(f"Migrated {copied} rows from {collection_name}")
+    milvus_cli.client.flush(target)
+
+    # 原集合先改名为备份, 新集合改名就位并加载成功后才删除备份; 任一步失败都换回原集合
+    milvus_cli.client.rename_collection(collection_name, backup)
+    try:
+        milvus_cli.client.rename_collection(target, collection_name)
+        milvus_cli.client.load_collection(collection_name)
+    except Exception as e:
+        LOGGER.error(f"Failed to replace {collection_name}, restoring the old collection: {e}")
+        if milvus_cli.has_collection(collection_name):
+            milvus_cli.client.rename_collection(collection_name, target)
+        milvus_cli.client.rename_collection(backup, collection_name)
+        raise
+    finally:
+        milvus_cli.forget(target)
+        milvus_cli.forget(collection_name)
+        # 分组注册表在下次读取时重建
+        milvus_cli.groups.drop(collection_name)
+    if keep_old:
+        LOGGER.info(f"Kept old collection as {backup}")
+    else:
+        milvus_cli.client.drop_collection(backup)
+    return copied
+
+
+def compact(milvus_cli, collection_name, dimension=None, batch_size=1000, keep_old=False):
+    # 去掉补零: 原向量先归一化再补零, 截断后 L2 / IP 距离完全不变
+    current = milvus_cli.collection_dimension(collection_name)
+    if not dimension:
+        dimension = detect_dimension(milvus_cli, collection_name, batch_size)
+    if dimension <= 0 or dimension >= current:
+        LOGGER.info(f"Collection {collection_name} is already {current}-d, nothing to compact")
+        return 0
+
+    def transform(row):
+        row = dict(row)
+        row["embedding"] = as_vector(row["embedding"])[:dimension]
+        return row
+
+    LOGGER.info(f"Compacting {collection_name} from {current}-d to {dimension}-d")
+    return rewrite_collection(milvus_cli, collection_name, transform, batch_size, keep_old, dimension=dimension)
+
+
+def partition_key(milvus_cli, collection_name, batch_size=1000, keep_old=False):
+    # 把 meta["group"] 提升为 partition key 字段, 向量与维度保持不变
+    if milvus_cli.has_group_field(collection_name):
+        LOGGER.info(f"Collection {collection_name} already has a group partition key")
+        return 0
+    dimension = milvus_cli.collection_dimension(collection_name)
+    LOGGER.info(f"Moving groups of {collection_name} into a partition key field")
+    return rewrite_collection(milvus_cli, collection_name, dict, batch_size, keep_old, dimension=dimension)
+
+
+def storage(milvus_cli, collection_name, storage=None, hash_bits=None, batch_size=1000, keep_old=False):
+    # 改变向量存储精度或增删二值哈希字段, 哈希由原始向量重新计算
+    current = milvus_cli.collection_storage(collection_name)
+    target = (storage or current[0], current[1] if hash_bits is None else hash_bits)
+    if target == current:
+        LOGGER.info(f"Collection {collection_name} already stores {current[0]} with {current[1]} hash bits")
+        return 0
+    dimension = milvus_cli.collection_dimension(collection_name)
+    LOGGER.info(f"Rewriting {collection_name} as {target[0]} with {target[1]} hash bits")
+    return rewrite_collection(milvus_cli, collection_name, dict, batch_size, keep_old, dimension=dimension,
+                              storage=target[0], hash_bits=target[1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Milvus collection migrations")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    compact_parser = sub.add_parser("compact", help="rewrite a zero-padded collection to native dimension")
+    compact_parser.add_argument("--collection", default=DEFAULT_TABLE)
+    compact_parser.add_argument("--dimension", type=int, default=None,
+                                help="native dimension, detected from the stored vectors if omitted")
+    compact_parser.add_argument("--batch-size", type=int, default=1000)
+    compact_parser.add_argument("--keep-old", action="store_true", help="keep the old collection as <name>_backup")
+
+    partition_parser = sub.add_parser("partition-key", help="promote meta group to a partition key field")
+    partition_parser.add_argument("--collection", default=DEFAULT_TABLE)
+    partition_parser.add_argument("--batch-size", type=int, default=1000)
+    partition_parser.add_argument("--keep-old", action="store_true", help="keep the old collection as <name>_backup")
+
+    reindex_parser = sub.add_parser("reindex", help="rebuild the vector index with another type or build params")
+    reindex_parser.add_argument("--collection", default=DEFAULT_TABLE)
+    reindex_parser.add_argument("--index-type", default=None, help="HNSW, IVF_FLAT, IVF_PQ, IVF_SQ8 or FLAT")
+    reindex_parser.add_argument("--params", default=None, help="JSON build params")
+
+    storage_parser = sub.add_parser("storage", help="change vector precision or add/remove the binary hash field")
+    storage_parser.add_argument("--collection", default=DEFAULT_TABLE)
+    storage_parser.add_argument("--storage", default=None, help="float32 or float16")
+    storage_parser.add_argument("--hash-bits", type=int, default=None, help="binary sign hash bits, 0 removes it")
+    storage_parser.add_argument("--batch-size", type=int, default=1000)
+    storage_parser.add_argument("--keep-old", action="store_true", help="keep the old collection as <name>_backup")
+
+    args = parser.parse_args()
+    milvus_cli = MilvusHelper()
+    if args.command == "compact":
+        copied = compact(milvus_cli, args.collection, args.dimension, args.batch_size, args.keep_old)
+        print(f"compacted {copied} rows")
+    elif args.command == "partition-key":
+        copied = partition_key(milvus_cli, args.collection, args.batch_size, args.keep_old)
+        print(f"migrated {copied} rows")
+    elif args.command == "reindex":
+        params = json.loads(args.params) if args.params else None
+        milvus_cli.rebuild_index(args.collection, args.index_type, params)
+        print(f"rebuilt {milvus_cli.index_type(args.collection)} index on {args.collection}")
+    elif args.command == "storage":
+        copied = storage(milvus_cli, args.collection, args.storage, args.hash_bits, args.batch_size, args.keep_old)
+        print(f"migrated {copied} rows")
+
+
+if __name__ == "__main__":
+    main()
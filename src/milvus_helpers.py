@@ -1,14 +1,31 @@
 import json
 import os
-import sys
+import time
 
-from config import VECTOR_DIMENSION, METRIC_TYPE, DEFAULT_TABLE
+import numpy as np
+from config import VECTOR_DIMENSION, METRIC_TYPE, DEFAULT_TABLE, MILVUS_URI, DATA_PATH, GROUP_PARTITIONS, \
+    SCALAR_INDEX_TYPE, DOWNLOAD_CACHE_MB, DOWNLOAD_CACHE_TTL, EXPORT_BATCH_SIZE, HASH_SEED, HASH_RERANK, \
+    HASH_INDEX_TYPE, DELETE_BATCH, COMPACT_TIMEOUT_S, PHASH
 from pymilvus import DataType, MilvusClient
+from blob_store import row_location
+from group_registry import GroupRegistry
+from index_config import index_settings, search_settings, storage_settings
 from logs import LOGGER
+from metrics import span
+from md5_index import Md5Index
+from phash import PhashIndexes
 from operators import generate_uuids, get_file_md5
+from query_cache import LRUCache
+from vector_storage import as_vector, get_hasher, rerank, to_storage
+from vector_store import VectorStore
 
+# 下载缓存中每条 uuid -> (ext, path, thumbnail_path) 的估算内存占用
+LOCATION_BYTES = 384
+# Milvus 单次搜索的 limit 上限
+MAX_SEARCH_LIMIT = 16384
 
-class MilvusHelper:
+
+class MilvusHelper(VectorStore):
     """
     MilvusHelper class to manager the Milvus Collection.
 
@@ -20,31 +37,157 @@ class MilvusHelper:
         ...
     """
 
-    def __init__(self):
+    def __init__(self, uri=MILVUS_URI, dimension=VECTOR_DIMENSION):
+        super().__init__()
         try:
             self.collection = None
-            # 判断目录是否存在
-            if not os.path.exists("./data"):
+            self.uri = uri
+            # 新建集合使用的向量维度, 应为模型的原生输出维度
+            self.dimension = dimension
+            # 已有集合的字段定义缓存, 兼容旧的 8192 补零集合与没有 group 字段的集合
+            self.fields = {}
+            # 每个集合一个 MD5 去重索引, 首次使用时加载
+            self.md5_indexes = {}
+            # 集合向量索引类型缓存, 决定搜索时使用 ef 还是 nprobe
+            self.index_types = {}
+            # 上次压缩以来各集合删除的行数, 用于判断是否需要压缩 (进程重启后从 0 开始)
+            self.deleted = {}
+            # 下载接口的 uuid -> (ext, path, thumbnail_path) 缓存, 删除时失效
+            self.locations = LRUCache(int(DOWNLOAD_CACHE_MB * 2 ** 20), DOWNLOAD_CACHE_TTL)
+            self.add_listener(self._forget_locations)
+            # 判断目录是否存在 (Milvus Lite 本地文件), 服务端 uri 的辅助数据放在 DATA_PATH
+            data_dir = os.path.dirname(uri) if "://" not in uri else DATA_PATH
+            if data_dir and not os.path.exists(data_dir):
                 # 如果不存在则创建
-                os.makedirs("./data")
-            self.client = MilvusClient("./data/milvus_data.db")
+                os.makedirs(data_dir)
+            self.client = MilvusClient(uri)
+            # 分组注册表, 随写入/删除更新
+            self.groups = GroupRegistry(os.path.join(data_dir or ".", "groups"))
+            self.add_listener(self.groups.on_change)
+            # 感知哈希近似去重索引, 首次查询时加载
+            self.phash_indexes = PhashIndexes(self)
+            self.add_listener(self.phash_indexes.on_change)
             # connections.connect(host=host, port=port)
             # LOGGER.debug(f"Successfully connect to Milvus with IP:{MILVUS_HOST} and PORT:{MILVUS_PORT}")
         except Exception as e:
             LOGGER.error(f"Failed: {e}")
-            sys.exit(1)
+            raise
 
     def init_default(self):
         if not self.has_collection(collection_name=DEFAULT_TABLE):
             self.create_collection(collection_name=DEFAULT_TABLE)
+        # 旧集合补建 uuid / md5 标量索引, 需在加载前完成
+        self.create_scalar_indexes(DEFAULT_TABLE)
         self.client.load_collection(collection_name=DEFAULT_TABLE)
+        self.md5_index(DEFAULT_TABLE)
+        self.group_counts(DEFAULT_TABLE)
+        if PHASH:
+            # 感知哈希索引在启动时构建, 不在第一次上传的请求中遍历集合
+            self.phash_indexes.index(DEFAULT_TABLE)
+
+    def md5_index(self, collection_name):
+        # 启动时加载一次, 之后由 insert / drop_uuid 保持同步
+        index = self.md5_indexes.get(collection_name)
+        if index is None:
+            index = Md5Index()
+            if self.client.has_collection(collection_name):
+                index.load(self.client, collection_name)
+            self.md5_indexes[collection_name] = index
+        return index
+
+    def group_counts(self, collection_name, rebuild=False):
+        # 分组 -> 图片数, 注册表缺失或过期时扫描一次集合重建
+        if rebuild or self.groups.needs_rebuild(collection_name):
+            self.groups.rebuild(self.client, collection_name)
+        return self.groups.group_counts(collection_name)
+
+    def get_by_uuids(self, collection_name, uuids, output_fields=("id", "uuid", "md5", "meta"), chunk_size=1000):
+        """
+        一次 `uuid in [...]` 查询批量获取, 结果按输入顺序排列, 每个 uuid 取第一行, 不存在的 uuid 被跳过
+        """
+        found = {}
+        uuids = list(dict.fromkeys(uuids))
+        for start in range(0, len(uuids), chunk_size):
+            chunk = uuids[start:start + chunk_size]
+            with span("milvus_query"):
+                resList = self.client.query(collection_name=collection_name, filter=in_filter("uuid", chunk),
+                                            output_fields=list(output_fields))
+            for item in resList:
+                found.setdefault(item["uuid"], item)
+        return [found[uuid] for uuid in uuids if uuid in found]
+
+    def get(self, collection_name, ids, output_fields=("id", "uuid", "md5", "meta")):
+        # 按主键批量获取
+        with span("milvus_query"):
+            return self.client.get(collection_name=collection_name, ids=list(ids), output_fields=list(output_fields))
+
+    def load(self, collection_name):
+        with span("load_collection"):
+            self.client.load_collection(collection_name)
+
+    def image_location(self, collection_name, uuid):
+        """
+        uuid -> (ext, path, thumbnail_path), 命中缓存时不访问 Milvus
+        :return: 图片不存在或没有扩展名时返回 None
+        """
+        location = self.locations.get((collection_name, uuid))
+        if location is None:
+            with span("milvus_query"):
+                resList = self.client.query(collection_name=collection_name, filter=f"uuid == {json.dumps(uuid)}",
+                                            output_fields=["uuid", "md5", "meta"], limit=1)
+            if len(resList) == 0 or "ext" not in resList[0]["meta"]:
+                return None
+            location = row_location(uuid, resList[0].get("md5"), resList[0]["meta"])
+            self.locations.put((collection_name, uuid), location, LOCATION_BYTES)
+        return location
+
+    def _forget_locations(self, collection_name, added, removed):
+        if removed is None:
+            self.locations.invalidate(lambda key: key[0] == collection_name)
+            return
+        uuids = {row["uuid"] for row in removed}
+        if uuids:
+            self.locations.invalidate(lambda key: key[0] == collection_name and key[1] in uuids)
+
+    def find_md5(self, collection_name, md5, group=None):
+        # O(1) 去重判断, 不访问 Milvus
+        return self.md5_index(collection_name).lookup(md5, group)
+
+    def list_collections(self):
+        return self.client.list_collections()
+
+    def referenced_md5s(self, md5s, chunk_size=1000):
+        """
+        仍被任一集合引用的 md5: 已加载 MD5 索引的集合查内存索引, 其余集合以强一致性查询;
+        无法确认时视为全部仍被引用
+        """
+        md5s = list({md5 for md5 in md5s if md5})
+        found = set()
+        for collection_name in self.list_collections():
+            index = self.md5_indexes.get(collection_name)
+            if index is not None:
+                found.update(md5 for md5 in md5s if index.contains(md5))
+                continue
+            try:
+                if "md5" not in self.collection_fields(collection_name):
+                    continue
+                for start in range(0, len(md5s), chunk_size):
+                    with span("milvus_query"):
+                        resList = self.client.query(collection_name=collection_name,
+                                                    filter=in_filter("md5", md5s[start:start + chunk_size]),
+                                                    output_fields=["md5"], consistency_level="Strong")
+                    found.update(item["md5"] for item in resList)
+            except Exception as e:
+                LOGGER.warning(f"Failed to check md5 references in {collection_name}: {e}")
+                return set(md5s)
+        return found
 
     def set_collection(self, collection_name):
         try:
-            self.client.create_collection(collection_name, dimension=VECTOR_DIMENSION)
+            self.client.create_collection(collection_name, dimension=self.dimension)
         except Exception as e:
             LOGGER.error(f"Failed to load data to Milvus: {e}")
-            sys.exit(1)
+            raise
 
     def has_collection(self, collection_name):
         # Return if Milvus has the collection
@@ -53,10 +196,84 @@ class MilvusHelper:
             # return utility.has_collection(collection_name)
         except Exception as e:
             LOGGER.error(f"Failed to load data to Milvus: {e}")
-            sys.exit(1)
+            raise
+
+    def collection_fields(self, collection_name):
+        # 读取集合字段定义: 字段名 -> 字段描述
+        if collection_name not in self.fields:
+            desc = self.client.describe_collection(collection_name)
+            self.fields[collection_name] = {field["name"]: field for field in desc["fields"]}
+        return self.fields[collection_name]
 
-    def create_collection(self, collection_name):
+    def forget(self, collection_name):
+        # 集合被删除/重命名后清空与之相关的缓存
+        self.fields.pop(collection_name, None)
+        self.md5_indexes.pop(collection_name, None)
+        self.index_types.pop(collection_name, None)
+        self.deleted.pop(collection_name, None)
+
+    def collection_dimension(self, collection_name):
+        # 读取集合 embedding 字段的维度
+        field = self.collection_fields(collection_name).get("embedding")
+        if field is None:
+            return self.dimension
+        return int(field["params"]["dim"])
+
+    def collection_storage(self, collection_name):
+        # 集合的向量存储精度与哈希位数 (没有 hash 字段时为 0)
+        fields = self.collection_fields(collection_name)
+        field = fields.get("embedding")
+        storage = "float16" if field is not None and field["type"] == DataType.FLOAT16_VECTOR else "float32"
+        hash_bits = int(fields["hash"]["params"]["dim"]) if "hash" in fields else 0
+        return storage, hash_bits
+
+    def hasher(self, collection_name):
+        _, hash_bits = self.collection_storage(collection_name)
+        if hash_bits <= 0:
+            return None
+        return get_hasher(self.collection_dimension(collection_name), hash_bits, HASH_SEED)
+
+    def has_group_field(self, collection_name):
+        # 新集合的分组是 partition key 标量字段, 旧集合只在 meta JSON 中
+        return "group" in self.collection_fields(collection_name)
+
+    def group_filter(self, collection_name, group):
+        # 分组过滤表达式: partition key 字段只访问该分组所在的分区, 旧集合退回 JSON 路径过滤
+        if self.has_group_field(collection_name):
+            return f'group == {json.dumps(group)}'
+        return f'meta["group"] == {json.dumps(group)}'
+
+    def prepare_rows(self, collection_name, rows):
+        # 写入前按集合结构调整: 向量维度与存储精度, 二值哈希, 以及从 meta 提取 group 字段
+        dimension = self.collection_dimension(collection_name)
+        storage, _ = self.collection_storage(collection_name)
+        hasher = self.hasher(collection_name)
+        has_group = self.has_group_field(collection_name)
+        for row in rows:
+            vector = fit_dimension(row["embedding"], dimension)
+            row["embedding"] = to_storage(vector, storage)
+            if hasher is not None:
+                row["hash"] = hasher.hash(vector)
+            else:
+                row.pop("hash", None)
+            if has_group:
+                row["group"] = row["meta"].get("group") or ""
+            else:
+                row.pop("group", None)
+        return rows
+
+    def fit_vectors(self, collection_name, vectors):
+        # 向量维度与集合不一致时补零或截断 (仅用于尚未迁移的旧集合), 并转换为集合的存储精度
+        dimension = self.collection_dimension(collection_name)
+        storage, _ = self.collection_storage(collection_name)
+        return [to_storage(fit_dimension(vector, dimension), storage) for vector in vectors]
+
+    def create_collection(self, collection_name, dimension=None, index_type=None, index_params=None, group_field=True,
+                          storage=None, hash_bits=None):
         try:
+            if dimension is None:
+                dimension = self.dimension
+            storage, hash_bits = storage_settings(collection_name, storage, hash_bits)
             if not self.client.has_collection(collection_name):
                 # 定义字段
                 schema = MilvusClient.create_schema()
@@ -82,98 +299,171 @@ class MilvusHelper:
                 )
                 schema.add_field(
                     field_name='embedding',
-                    datatype=int(DataType.FLOAT_VECTOR),
+                    datatype=DataType.FLOAT16_VECTOR if storage == "float16" else DataType.FLOAT_VECTOR,
                     description='Image embedding vectors',
-                    dim=VECTOR_DIMENSION  # 确保与实际数据维度一致
+                    dim=dimension  # 确保与实际数据维度一致
                 )
+                if hash_bits > 0:
+                    # 二值签名哈希, 搜索时先按汉明距离粗筛
+                    schema.add_field(
+                        field_name='hash',
+                        datatype=DataType.BINARY_VECTOR,
+                        description='Image sign hash',
+                        dim=hash_bits
+                    )
                 schema.add_field(
                     field_name='meta',
                     datatype=DataType.JSON,
                     description='Image Meta JSON'
                 )
+                create_kwargs = {}
+                if group_field:
+                    # 分组作为 partition key, 分组搜索只访问对应分区
+                    schema.add_field(
+                        field_name='group',
+                        datatype=DataType.VARCHAR,
+                        description='Image group',
+                        max_length=256,
+                        is_partition_key=True
+                    )
+                    create_kwargs["num_partitions"] = GROUP_PARTITIONS
 
                 # 创建集合
-                self.client.create_collection(collection_name, schema=schema)
+                self.client.create_collection(collection_name, schema=schema, **create_kwargs)
                 LOGGER.debug(f"Created Milvus collection: {collection_name}")
-                self.create_index(collection_name)
+                self.create_index(collection_name, index_type, index_params)
             # else:
             #     self.set_collection(collection_name)
             return "OK"
         except Exception as e:
             LOGGER.error(f"Failed to load data to Milvus: {e}")
-            sys.exit(1)
+            raise
 
-    def insert(self, collection_name, path, vectors, group, extra):
+    def insert(self, collection_name, path, vectors, group, extra, md5s=None, uuids=None):
         # Batch insert vectors to milvus collection
         try:
-            uuids = generate_uuids(len(path))
+            if uuids is None:
+                uuids = generate_uuids(len(path))
+            vectors = self.fit_vectors(collection_name, vectors)
+            index = self.md5_index(collection_name)
             # 将 uuid 添加到 data
             rows = []
-            for index, tmpVector in enumerate(vectors):
-                # 计算md5
-                md5 = get_file_md5(path[index])
+            for i, tmpVector in enumerate(vectors):
+                # 调用方已计算过 md5 时直接复用
+                md5 = md5s[i] if md5s is not None else get_file_md5(path[i])
                 if md5 is None:
                     md5 = ""
                 alreadyExists = False
-                ext = path[index].split(".")[-1]
-                row = {
-                    "meta": {
-                        "path": path[index],
-                        "ext": ext
-                    },
-                    "embedding": tmpVector,
-                    "uuid": uuids[index],
-                    "md5": md5
-                }
-                if group is not None:
-                    row["meta"]["group"] = group
-                if extra is not None:
-                    extraJson = json.loads(extra)
-                    if extraJson:
-                        for key in extraJson:
-                            row["meta"][key] = extraJson[key]
+                row = make_row(path[i], tmpVector, uuids[i], md5, group, extra)
 
                 if md5 != "":
-                    targetRes = self.client.query(filter=f"md5 == \"{md5}\"", collection_name=collection_name, limit=1)
+                    targetRes = index.lookup(md5)
                     if len(targetRes) > 0:
-                        print("文件已存在", path[index], md5)
+                        LOGGER.debug(f"File already exists: {path[i]} {md5}")
                         row["uuid"] = targetRes[0]["uuid"]
                         row["meta"] = targetRes[0]["meta"]
                         alreadyExists = True
 
-                print("row", row)
                 if not alreadyExists:
-                    self.client.insert(collection_name, row)
+                    with span("milvus_insert"):
+                        res = self.client.insert(collection_name, self.prepare_rows(collection_name, [row]))
+                    index.add({**row, "id": res["ids"][0]})
                 rows.append(row)
-            self.client.load_collection(collection_name)
+                if not alreadyExists:
+                    self.notify(collection_name, added=[row])
+            with span("load_collection"):
+                self.client.load_collection(collection_name)
             LOGGER.debug(
                 f"Insert vectors to Milvus in collection: {collection_name} with {len(vectors)} rows")
             return rows
         except Exception as e:
             LOGGER.error(f"Failed to load data to Milvus: {e}")
-            sys.exit(1)
+            raise
+
+    def insert_rows(self, collection_name, rows):
+        # 批量写入已构造好的行, 一次 insert 调用; 不调用 load_collection, 由调用方在最后统一加载
+        if len(rows) == 0:
+            return 0
+        with span("milvus_insert"):
+            res = self.client.insert(collection_name, self.prepare_rows(collection_name, rows))
+        index = self.md5_index(collection_name)
+        for row, id in zip(rows, res["ids"]):
+            index.add({**row, "id": id})
+        self.notify(collection_name, added=rows)
+        LOGGER.debug(f"Bulk insert {len(rows)} rows to Milvus collection: {collection_name}")
+        return res["insert_count"]
+
+    def existing_md5s(self, collection_name, md5s):
+        # 批量判断哪些 md5 已存在, 走内存索引
+        index = self.md5_index(collection_name)
+        return {md5 for md5 in set(md5s) if md5 and index.contains(md5)}
 
-    def create_index(self, collection_name):
+    def create_index(self, collection_name, index_type=None, params=None):
         try:
+            index_type, params = index_settings(collection_name, index_type, params)
             index_params = MilvusClient.prepare_index_params()
-            index_params.add_index(field_name="embedding", index_type="HNSW", index_name="embedding_index",
-                                   metric_type=METRIC_TYPE, params={"nlist": 16384})
+            index_params.add_index(field_name="embedding", index_type=index_type, index_name="embedding_index",
+                                   metric_type=METRIC_TYPE, params=params)
+            if "hash" in self.collection_fields(collection_name) and \
+                    "hash_index" not in self.client.list_indexes(collection_name):
+                hash_params = {} if HASH_INDEX_TYPE == "BIN_FLAT" else {"nlist": 1024}
+                index_params.add_index(field_name="hash", index_type=HASH_INDEX_TYPE, index_name="hash_index",
+                                       metric_type="HAMMING", params=hash_params)
             self.client.create_index(collection_name, index_params=index_params)
+            self.index_types[collection_name] = index_type
+            LOGGER.debug(f"Created {index_type} index on {collection_name} with params {params}")
         except Exception as e:
             LOGGER.error(f"Failed to create index: {e}")
-            sys.exit(1)
+            raise
+        self.create_scalar_indexes(collection_name)
+
+    def create_scalar_indexes(self, collection_name):
+        # uuid / md5 标量索引, 点查与 `in [...]` 批量查询不再全表扫描; 已存在的索引跳过
+        try:
+            existing = set(self.client.list_indexes(collection_name))
+            index_params = MilvusClient.prepare_index_params()
+            missing = [field for field in ("uuid", "md5") if f"{field}_index" not in existing]
+            for field in missing:
+                index_params.add_index(field_name=field, index_type=SCALAR_INDEX_TYPE, index_name=f"{field}_index")
+            if missing:
+                self.client.create_index(collection_name, index_params=index_params)
+                LOGGER.debug(f"Created {SCALAR_INDEX_TYPE} indexes on {missing} of {collection_name}")
+        except Exception as e:
+            # 标量索引只影响查询速度, 不支持时 (如 Milvus Lite) 继续运行
+            LOGGER.warning(f"Failed to create scalar indexes on {collection_name}: {e}")
+
+    def index_type(self, collection_name):
+        # 读取集合实际使用的索引类型
+        if collection_name not in self.index_types:
+            try:
+                desc = self.client.describe_index(collection_name, "embedding_index")
+                self.index_types[collection_name] = desc.get("index_type", "FLAT").upper()
+            except Exception as e:
+                LOGGER.error(f"Failed to describe index of {collection_name}: {e}")
+                return "FLAT"
+        return self.index_types[collection_name]
+
+    def rebuild_index(self, collection_name, index_type=None, params=None):
+        # 更换索引类型或构建参数: 释放集合, 删除旧索引, 重建后重新加载
+        self.client.release_collection(collection_name)
+        self.client.drop_index(collection_name, "embedding_index")
+        self.index_types.pop(collection_name, None)
+        self.create_index(collection_name, index_type, params)
+        self.client.load_collection(collection_name)
 
     def delete_collection(self, collection_name):
         try:
             self.client.drop_collection(collection_name)
+            self.forget(collection_name)
+            self.groups.drop(collection_name)
             LOGGER.debug("Successfully drop collection!")
             return "ok"
         except Exception as e:
             LOGGER.error(f"Failed to drop collection: {e}")
-            sys.exit(1)
+            raise
 
-    def search_vectors(self, collection_name, vectors, top_k, group):
-        LOGGER.debug(f"Vectors for search: {vectors}")
+    def search_vectors(self, collection_name, vectors, top_k, group, search_params=None):
+        LOGGER.debug(f"Search {len(vectors)} vectors in collection: {collection_name}")
         # if exclude_ids is None:
         #     exclude_ids = []
         # else:
@@ -189,7 +479,7 @@ class MilvusHelper:
             tmpExprList = []
             filter_params = {}
             if group is not None and group != "":
-                tmpExprList.append(f'meta["group"] == "{group}"')
+                tmpExprList.append(self.group_filter(collection_name, group))
             # if len(exclude_ids) > 0:
             #     top_k += len(exclude_ids)
             #     tmpExprList.append("id NOT IN {ids}")
@@ -201,31 +491,213 @@ class MilvusHelper:
                     filter = tmpExprList[0]
                 if len(tmpExprList) >= 2:
                     filter = ' AND '.join(tmpExprList)
-            print(f'filter: {filter}')
-            search_params = {"metric_type": METRIC_TYPE, "params": {"nprobe": 16}}
-            res = self.client.search(collection_name, data=vectors, anns_field="embedding", search_params=search_params
-                                     , limit=top_k, output_fields=["uuid"], filter=filter, filter_params=filter_params)
+            LOGGER.debug(f"Search filter: {filter}")
+            if self.hasher(collection_name) is not None:
+                return self.search_hash_rerank(collection_name, vectors, top_k, filter, filter_params)
+            vectors = self.fit_vectors(collection_name, vectors)
+            # search_params 为请求级的 ef / nprobe 覆盖
+            params = search_settings(collection_name, self.index_type(collection_name), top_k, search_params)
+            search_params = {"metric_type": METRIC_TYPE, "params": params}
+            with span("milvus_search"):
+                res = self.client.search(collection_name, data=vectors, anns_field="embedding",
+                                         search_params=search_params, limit=top_k, output_fields=["uuid"],
+                                         filter=filter, filter_params=filter_params)
 
-            LOGGER.debug(f"Successfully search in collection: {res}")
+            LOGGER.debug(f"Successfully search in collection: {collection_name}")
             return res
         except Exception as e:
             LOGGER.error(f"Failed to search vectors in Milvus: {e}")
-            sys.exit(1)
+            raise
+
+    def search_hash_rerank(self, collection_name, vectors, top_k, filter="", filter_params=None):
+        """
+        两阶段搜索: 按二值哈希的汉明距离取 top_k * HASH_RERANK 个候选, 再用原始向量精确重排
+        """
+        dimension = self.collection_dimension(collection_name)
+        vectors = [fit_dimension(vector, dimension) for vector in vectors]
+        limit = min(max(top_k * HASH_RERANK, top_k), MAX_SEARCH_LIMIT)
+        with span("milvus_search"):
+            res = self.client.search(collection_name, data=self.hasher(collection_name).hash_batch(vectors),
+                                     anns_field="hash", search_params={"metric_type": "HAMMING", "params": {}},
+                                     limit=limit, output_fields=["uuid", "embedding"], filter=filter,
+                                     filter_params=filter_params or {})
+        with span("rerank"):
+            return [rerank(vector, hits, METRIC_TYPE, top_k) for vector, hits in zip(vectors, res)]
 
     def drop_uuid(self, collection_name, uuid, group):
-        print(f"Dropping Image UUID : {uuid} , Group {group}")
-        if group is None or group == "":
-            self.client.delete(collection_name=collection_name,
-                               filter=f"uuid == \"{uuid}\"")
-        else:
-            self.client.delete(collection_name=collection_name,
-                               filter=f"uuid == \"{uuid}\" and meta[\"group\"] == \"{group}\"")
+        LOGGER.info(f"Dropping Image UUID : {uuid} , Group {group}")
+        with span("milvus_delete"):
+            if group is None or group == "":
+                self.client.delete(collection_name=collection_name,
+                                   filter=f"uuid == \"{uuid}\"")
+            else:
+                self.client.delete(collection_name=collection_name,
+                                   filter=f"uuid == \"{uuid}\" and {self.group_filter(collection_name, group)}")
+        removed = self.md5_index(collection_name).remove_uuid(uuid, group)
+        self.deleted[collection_name] = self.deleted.get(collection_name, 0) + max(len(removed), 1)
+        self.notify(collection_name, removed=removed or None)
+
+    def drop_uuids(self, collection_name, uuids, group=None, chunk_size=DELETE_BATCH):
+        """
+        批量删除: 每批先查出将被删除的行 (用于索引同步与文件清理), 再用一次 `uuid in [...]` 删除
+        :return: 被删除的行
+        """
+        uuids = list(dict.fromkeys(uuids))
+        removed = []
+        for start in range(0, len(uuids), chunk_size):
+            filter = in_filter("uuid", uuids[start:start + chunk_size])
+            if group:
+                filter = f"{filter} and {self.group_filter(collection_name, group)}"
+            rows = self._query_all(collection_name, filter)
+            if rows:
+                with span("milvus_delete"):
+                    self.client.delete(collection_name=collection_name, filter=filter)
+                removed.extend(rows)
+        self._forget_rows(collection_name, removed)
+        return removed
+
+    def drop_group(self, collection_name, group, chunk_size=DELETE_BATCH):
+        """
+        删除整个分组, 按查出的主键删除, 删除期间写入该分组的新行不受影响
+        :return: 被删除的行
+        """
+        removed = self._query_all(collection_name, self.group_filter(collection_name, group))
+        for start in range(0, len(removed), chunk_size):
+            with span("milvus_delete"):
+                self.client.delete(collection_name=collection_name,
+                                   ids=[row["id"] for row in removed[start:start + chunk_size]])
+        self._forget_rows(collection_name, removed)
+        return removed
+
+    def _query_all(self, collection_name, filter):
+        rows = []
+        with span("milvus_query"):
+            iterator = self.client.query_iterator(collection_name=collection_name, filter=filter,
+                                                  batch_size=EXPORT_BATCH_SIZE,
+                                                  output_fields=["id", "uuid", "md5", "meta"])
+            try:
+                while True:
+                    tmp = iterator.next()
+                    if not tmp:
+                        break
+                    rows.extend(tmp)
+            finally:
+                iterator.close()
+        return rows
+
+    def _forget_rows(self, collection_name, removed):
+        index = self.md5_index(collection_name)
+        for uuid, group in {(row["uuid"], row["meta"].get("group")) for row in removed}:
+            index.remove_uuid(uuid, group)
+        self.deleted[collection_name] = self.deleted.get(collection_name, 0) + len(removed)
+        LOGGER.info(f"Dropped {len(removed)} rows from {collection_name}")
+        self.notify(collection_name, removed=removed)
+
+    def deleted_rows(self, collection_name):
+        return self.deleted.get(collection_name, 0)
+
+    def compact(self, collection_name, timeout=COMPACT_TIMEOUT_S):
+        """
+        触发压缩并等待完成, 清除已删除行所在的段
+        :return: {"reclaimed_bytes"}, 服务端部署无法统计磁盘占用时为 None
+        """
+        before = self.disk_bytes()
+        deadline = time.monotonic() + timeout
+        with span("milvus_compact"):
+            job_id = self.client.compact(collection_name)
+            while self.client.get_compaction_state(job_id) == "Executing":
+                if time.monotonic() > deadline:
+                    raise TimeoutError(f"Compaction of {collection_name} did not finish in {timeout}s")
+                time.sleep(1)
+        self.deleted.pop(collection_name, None)
+        after = self.disk_bytes()
+        return {"reclaimed_bytes": before - after if before is not None else None}
+
+    def disk_bytes(self):
+        # Milvus Lite 本地数据的磁盘占用
+        if "://" in self.uri:
+            return None
+        return disk_usage(self.uri)
+
+    def iterate(self, collection_name, output_fields, group=None, after_id=None, limit=None,
+                batch_size=EXPORT_BATCH_SIZE):
+        """
+        按主键升序分批遍历集合, 以 after_id 作为游标可从任意位置继续
+        :param limit: 最多返回的行数, None 表示不限
+        :return: 每次产出一批行
+        """
+        exprList = []
+        if group is not None and group != "":
+            exprList.append(self.group_filter(collection_name, group))
+        if after_id is not None:
+            exprList.append(f"id > {int(after_id)}")
+        kwargs = {"limit": limit} if limit is not None else {}
+        iterator = self.client.query_iterator(collection_name=collection_name, filter=" and ".join(exprList),
+                                              batch_size=batch_size, output_fields=list(output_fields), **kwargs)
+        try:
+            while True:
+                tmp = iterator.next()
+                if not tmp:
+                    break
+                yield tmp
+        finally:
+            iterator.close()
 
     def count(self, collection_name):
         try:
-            num = len(self.client.get_collection_stats(collection_name))
+            # get_collection_stats 的 row_count 在压缩前仍包含已删除的行
+            with span("milvus_query"):
+                num = self.client.query(collection_name, filter="", output_fields=["count(*)"])[0]["count(*)"]
             LOGGER.debug(f"Successfully get the num:{num} of the collection:{collection_name}")
             return num
         except Exception as e:
             LOGGER.error(f"Failed to count vectors in Milvus: {e}")
-            sys.exit(1)
+            raise
+
+
+def fit_dimension(vector, dimension):
+    """将向量补零或截断到指定维度"""
+    vector = as_vector(vector)
+    if len(vector) < dimension:
+        return np.pad(vector, (0, dimension - len(vector)), 'constant')
+    return vector[:dimension]
+
+
+def disk_usage(path):
+    """文件或目录 (递归) 的字节数, 不存在时为 0"""
+    if os.path.isfile(path):
+        return os.path.getsize(path)
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except FileNotFoundError:
+                pass
+    return total
+
+
+def in_filter(field, values):
+    """构造 `field in [...]` 过滤表达式"""
+    return f"{field} in {json.dumps(list(values))}"
+
+
+def make_row(path, vector, uuid, md5, group, extra):
+    """构造一行待写入 Milvus 的数据"""
+    row = {
+        "meta": {
+            "path": path,
+            "ext": path.split(".")[-1]
+        },
+        "embedding": vector,
+        "uuid": uuid,
+        "md5": md5
+    }
+    if group is not None:
+        row["meta"]["group"] = group
+    if extra is not None:
+        extraJson = json.loads(extra) if isinstance(extra, str) else extra
+        if extraJson:
+            for key in extraJson:
+                row["meta"][key] = extraJson[key]
+    return row
@@ -0,0 +1,595 @@
+"""
+内存映射 NumPy 向量存储: 每个集合一个连续的 float32/float16 矩阵, 分块矩阵乘 + argpartition 做精确 top-k。
+
+    <NUMPY_STORE_PATH>/<collection>/
+        meta.json     维度、存储精度与当前文件代数
+        vectors.npy   (容量, 维度) 向量矩阵, open_memmap 打开, 启动时不读入内存
+        norms.npy     每行的平方范数, L2 搜索不必重新计算
+        rows.jsonl    追加日志: {"op": "add", "id", "uuid", "md5", "meta"} / {"op": "del", "id"}
+
+主键 id 单调递增, 删除只在日志中标记; 向量先写入并 flush, 再追加日志, 异常退出时未记入日志的行被忽略。
+compact() 把有效行写入下一代文件 (vectors.<n>.npy 等) 并切换 meta.json, 回收已删除行的空间, id 不变。
+召回率测试的真值也由 exact_search 计算。
+"""
+import json
+import os
+import shutil
+import threading
+
+import numpy as np
+
+from config import NUMPY_STORE_PATH, VECTOR_DIMENSION, DEFAULT_TABLE, METRIC_TYPE, EXACT_SEARCH_BLOCK, \
+    EXPORT_BATCH_SIZE, PHASH
+from blob_store import row_location
+from index_config import storage_settings
+from logs import LOGGER
+from md5_index import Md5Index
+from metrics import span
+from milvus_helpers import fit_dimension, make_row
+from operators import generate_uuids, get_file_md5
+from phash import PhashIndexes
+from vector_storage import STORAGE_DTYPES
+from vector_store import VectorStore
+
+# 新集合的初始容量, 写满后按两倍扩容
+INITIAL_CAPACITY = 1024
+
+
+def exact_search(matrix, queries, top_k, metric_type="L2", positions=None, alive=None, norms=None,
+                 block=EXACT_SEARCH_BLOCK):
+    """
+    分块精确搜索, 每块一次矩阵乘, 用 argpartition 合并各块的 top-k
+    :param matrix: (n, d) 向量矩阵, 可以是内存映射
+    :param positions: 只在这些行中搜索 (如某个分组), None 表示全部行
+    :param alive: 行有效掩码, 已删除的行不会出现在结果中
+    :param norms: 每行的平方范数, L2 / COSINE 使用, 为 None 时按块计算
+    :return: (ids, distances), 形状为 (查询数, k), 按相似度排序; 不足 k 个时 id 为 -1
+    """
+    metric_type = metric_type.upper()
+    queries = np.atleast_2d(np.asarray(queries, dtype=np.float32))
+    total = len(matrix) if positions is None else len(positions)
+    k = min(top_k, total)
+    best_scores = np.full((len(queries), k), -np.inf, dtype=np.float32)
+    best_ids = np.full((len(queries), k), -1, dtype=np.int64)
+    if k == 0:
+        return best_ids, best_scores
+    for start in range(0, total, block):
+        if positions is None:
+            ids = np.arange(start, min(start + block, total))
+            vectors = np.asarray(matrix[start:start + block], dtype=np.float32)
+        else:
+            ids = np.asarray(positions[start:start + block])
+            vectors = np.asarray(matrix[ids], dtype=np.float32)
+        # 统一为 "越大越相似" 的分数
+        scores = queries @ vectors.T
+        if metric_type in ("L2", "COSINE"):
+            squared = norms[ids] if norms is not None else np.einsum("ij,ij->i", vectors, vectors)
+            if metric_type == "L2":
+                scores = 2 * scores - squared
+            else:
+                scores = scores / np.sqrt(np.maximum(squared, 1e-12))
+        if alive is not None:
+            scores[:, ~alive[ids]] = -np.inf
+        merged_scores = np.concatenate([best_scores, scores], axis=1)
+        merged_ids = np.concatenate([best_ids, np.broadcast_to(ids, scores.shape)], axis=1)
+        top = np.argpartition(-merged_scores, k - 1, axis=1)[:, :k]
+        best_scores = np.take_along_axis(merged_scores, top, axis=1)
+        best_ids = np.take_along_axis(merged_ids, top, axis=1)
+    order = np.argsort(-best_scores, axis=1)
+    best_scores = np.take_along_axis(best_scores, order, axis=1)
+    best_ids = np.take_along_axis(best_ids, order, axis=1)
+    best_ids[~np.isfinite(best_scores)] = -1
+    # 转回各度量的距离: L2 为平方距离 (与 Milvus 一致), IP 为内积, COSINE 为余弦相似度
+    if metric_type == "L2":
+        distances = np.sum(queries ** 2, axis=1, keepdims=True) - best_scores
+    elif metric_type == "COSINE":
+        distances = best_scores / np.maximum(np.linalg.norm(queries, axis=1, keepdims=True), 1e-12)
+    else:
+        distances = best_scores
+    return best_ids, distances
+
+
+def project_row(row, vectors, position, output_fields):
+    item = {}
+    for field in output_fields:
+        if field == "embedding":
+            item[field] = np.asarray(vectors[position], dtype=np.float32)
+        elif field == "group":
+            item[field] = row["meta"].get("group") or ""
+        elif field in row:
+            item[field] = row[field]
+    return item
+
+
+class NumpyCollection:
+    """
+    一个集合的向量矩阵与行元数据, 写入在锁内进行, 搜索只在锁内读取当前行数与分组位置。
+    行号 (position) 是行在矩阵中的位置, 主键 id 单调递增; 压缩后行号重新连续, id 不变。
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, "meta.json")) as f:
+            info = json.load(f)
+        self.dimension = int(info["dimension"])
+        self.storage = info["storage"]
+        self.generation = int(info.get("generation", 0))
+        self.dtype = STORAGE_DTYPES[self.storage]
+        self.lock = threading.RLock()
+        self.vectors = np.lib.format.open_memmap(self._file("vectors.npy"), mode="r+")
+        self.norms = np.lib.format.open_memmap(self._file("norms.npy"), mode="r+")
+        self._reset(len(self.vectors))
+        # 压缩时删除了末尾的行, 新行的 id 仍从压缩前的最大值之后分配
+        self.next_id = int(info.get("next_id", 0))
+        self._replay()
+        self.log = open(self._file("rows.jsonl"), "a", encoding="utf-8")
+
+    @classmethod
+    def create(cls, path, dimension, storage, capacity=INITIAL_CAPACITY):
+        os.makedirs(path, exist_ok=True)
+        np.lib.format.open_memmap(os.path.join(path, "vectors.npy"), mode="w+", dtype=STORAGE_DTYPES[storage],
+                                  shape=(capacity, dimension)).flush()
+        np.lib.format.open_memmap(os.path.join(path, "norms.npy"), mode="w+", dtype=np.float32,
+                                  shape=(capacity,)).flush()
+        with open(os.path.join(path, "meta.json"), "w") as f:
+            json.dump({"dimension": dimension, "storage": storage}, f)
+        return cls(path)
+
+    @property
+    def count(self):
+        return len(self.rows)
+
+    @property
+    def deleted(self):
+        # 已删除但仍占用矩阵空间的行数
+        return self.count - int(np.count_nonzero(self.alive[:self.count]))
+
+    def _file(self, name, generation=None):
+        # 第 0 代沿用不带序号的文件名, 兼容已有数据
+        generation = self.generation if generation is None else generation
+        if generation:
+            stem, ext = os.path.splitext(name)
+            name = f"{stem}.{generation}{ext}"
+        return os.path.join(self.path, name)
+
+    def _reset(self, capacity):
+        # 搜索持有旧的 rows / alive / ids 引用, 这里总是创建新对象而不是原地清空
+        self.alive = np.zeros(capacity, dtype=bool)
+        self.ids = np.zeros(capacity, dtype=np.int64)
+        self.rows = []
+        self.position_of = {}
+        self.next_id = 0
+        self.by_uuid = {}
+        # 分组 -> {行号: None}, 保持插入 (行号升序) 顺序且可 O(1) 删除
+        self.groups = {}
+        self.group_arrays = {}
+
+    def _replay(self):
+        log_path = self._file("rows.jsonl")
+        if not os.path.exists(log_path):
+            return
+        with open(log_path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # 异常退出时最后一行可能不完整
+                    LOGGER.warning(f"Skipping a truncated record in {log_path}")
+                    continue
+                if record["op"] == "add":
+                    self._index({key: record[key] for key in ("id", "uuid", "md5", "meta")})
+                else:
+                    self._unindex(self.rows[self.position_of[record["id"]]])
+        LOGGER.info(f"Opened {self.path} with {self.count} rows")
+
+    def _index(self, row):
+        # 新行总是追加在末尾
+        position = len(self.rows)
+        self.rows.append(row)
+        self.position_of[row["id"]] = position
+        self.next_id = max(self.next_id, row["id"] + 1)
+        self.alive[position] = True
+        self.ids[position] = row["id"]
+        self.by_uuid.setdefault(row["uuid"], []).append(position)
+        group = row["meta"].get("group")
+        self.groups.setdefault(group, {})[position] = None
+        self.group_arrays.pop(group, None)
+
+    def _unindex(self, row):
+        position = self.position_of[row["id"]]
+        self.alive[position] = False
+        positions = self.by_uuid.get(row["uuid"], [])
+        if position in positions:
+            positions.remove(position)
+        if not positions:
+            self.by_uuid.pop(row["uuid"], None)
+        group = row["meta"].get("group")
+        members = self.groups.get(group)
+        if members is not None:
+            members.pop(position, None)
+            if not members:
+                self.groups.pop(group)
+        self.group_arrays.pop(group, None)
+
+    def _grow(self, needed):
+        # 扩容: 写入更大的新文件后原子替换, 正在进行的搜索仍持有旧的映射
+        capacity = max(needed, 2 * len(self.vectors))
+        for name, shape in (("vectors.npy", (capacity, self.dimension)), ("norms.npy", (capacity,))):
+            old = self.vectors if name == "vectors.npy" else self.norms
+            tmp = self._file(name) + ".tmp"
+            new = np.lib.format.open_memmap(tmp, mode="w+", dtype=old.dtype, shape=shape)
+            new[:self.count] = old[:self.count]
+            new.flush()
+            del new
+            os.replace(tmp, self._file(name))
+        self.vectors = np.lib.format.open_memmap(self._file("vectors.npy"), mode="r+")
+        self.norms = np.lib.format.open_memmap(self._file("norms.npy"), mode="r+")
+        self.alive = np.concatenate([self.alive, np.zeros(capacity - len(self.alive), dtype=bool)])
+        self.ids = np.concatenate([self.ids, np.zeros(capacity - len(self.ids), dtype=np.int64)])
+        LOGGER.info(f"Grew {self.path} to {capacity} rows")
+
+    def append(self, rows):
+        """
+        :param rows: 含 embedding 的行, 写入后补上 id
+        """
+        with self.lock:
+            start = self.count
+            if start + len(rows) > len(self.vectors):
+                self._grow(start + len(rows))
+            matrix = np.stack([fit_dimension(row["embedding"], self.dimension) for row in rows]).astype(self.dtype)
+            stored = matrix.astype(np.float32)
+            self.vectors[start:start + len(rows)] = matrix
+            self.norms[start:start + len(rows)] = np.einsum("ij,ij->i", stored, stored)
+            self.vectors.flush()
+            self.norms.flush()
+            for row in rows:
+                row["id"] = self.next_id
+                record = {"op": "add", "id": row["id"], "uuid": row["uuid"], "md5": row.get("md5", ""),
+                          "meta": row["meta"]}
+                self.log.write(json.dumps(record, ensure_ascii=False) + "\n")
+                self._index({key: record[key] for key in ("id", "uuid", "md5", "meta")})
+            self.log.flush()
+        return [row["id"] for row in rows]
+
+    def delete(self, uuid, group=None):
+        return self.delete_uuids([uuid], group)
+
+    def delete_uuids(self, uuids, group=None):
+        with self.lock:
+            positions = [position for uuid in dict.fromkeys(uuids) for position in self.by_uuid.get(uuid, [])]
+            return self._delete(positions, group)
+
+    def delete_group(self, group):
+        with self.lock:
+            return self._delete(list(self.groups.get(group, ())), group)
+
+    def _delete(self, positions, group):
+        removed = [self.rows[position] for position in positions
+                   if not group or self.rows[position]["meta"].get("group") == group]
+        for row in removed:
+            self.log.write(json.dumps({"op": "del", "id": row["id"]}) + "\n")
+            self._unindex(row)
+        self.log.flush()
+        return removed
+
+    def positions(self, group):
+        # 分组的行号数组, 变更后重新生成
+        with self.lock:
+            array = self.group_arrays.get(group)
+            if array is None:
+                array = np.fromiter(self.groups.get(group, ()), dtype=np.int64)
+                self.group_arrays[group] = array
+            return array
+
+    def search(self, queries, top_k, group=None, metric_type=METRIC_TYPE):
+        # 在锁内取同一代的矩阵、掩码与行号, 压缩不会影响进行中的搜索
+        with self.lock:
+            count = self.count
+            vectors, norms, alive, rows = self.vectors, self.norms, self.alive, self.rows
+            positions = self.positions(group) if group else None
+        # 与 MilvusHelper 相同, 查询向量补零或截断到集合维度
+        queries = np.stack([fit_dimension(query, self.dimension) for query in queries])
+        found, distances = exact_search(vectors[:count], queries, top_k, metric_type, positions, alive[:count],
+                                        norms[:count])
+        results = []
+        for row_positions, row_distances in zip(found, distances):
+            results.append([{"id": rows[position]["id"], "distance": float(distance),
+                             "entity": {"uuid": rows[position]["uuid"]}}
+                            for position, distance in zip(row_positions, row_distances) if position >= 0])
+        return results
+
+    def project(self, position, output_fields):
+        with self.lock:
+            return project_row(self.rows[position], self.vectors, position, output_fields)
+
+    def snapshot(self, group=None):
+        """
+        在锁内取同一代的有效行号、id、行与矩阵, 遍历期间的压缩或扩容不影响已取得的快照
+        :return: (positions, ids, rows, vectors)
+        """
+        with self.lock:
+            positions = self.positions(group) if group else np.flatnonzero(self.alive[:self.count])
+            return positions, self.ids, self.rows, self.vectors
+
+    def disk_bytes(self):
+        return sum(entry.stat().st_size for entry in os.scandir(self.path) if entry.is_file())
+
+    def compact(self):
+        """
+        只保留有效行写入新一代文件, 替换 meta.json 后生效并删除旧文件; 异常退出时仍使用旧一代。
+        :return: 回收的字节数
+        """
+        with self.lock:
+            before = self.disk_bytes()
+            live = np.flatnonzero(self.alive[:self.count])
+            generation = self.generation + 1
+            capacity = max(INITIAL_CAPACITY, len(live))
+            vectors = np.lib.format.open_memmap(self._file("vectors.npy", generation), mode="w+", dtype=self.dtype,
+                                                shape=(capacity, self.dimension))
+            norms = np.lib.format.open_memmap(self._file("norms.npy", generation), mode="w+", dtype=np.float32,
+                                              shape=(capacity,))
+            for start in range(0, len(live), EXACT_SEARCH_BLOCK):
+                chunk = live[start:start + EXACT_SEARCH_BLOCK]
+                vectors[start:start + len(chunk)] = self.vectors[chunk]
+                norms[start:start + len(chunk)] = self.norms[chunk]
+            vectors.flush()
+            norms.flush()
+            rows = [self.rows[position] for position in live]
+            with open(self._file("rows.jsonl", generation), "w", encoding="utf-8") as f:
+                for row in rows:
+                    f.write(json.dumps({"op": "add", **row}, ensure_ascii=False) + "\n")
+            tmp = os.path.join(self.path, "meta.json.tmp")
+            with open(tmp, "w") as f:
+                json.dump({"dimension": self.dimension, "storage": self.storage, "generation": generation,
+                           "next_id": self.next_id}, f)
+            os.replace(tmp, os.path.join(self.path, "meta.json"))
+
+            old = [self._file(name) for name in ("vectors.npy", "norms.npy", "rows.jsonl")]
+            self.log.close()
+            self.generation = generation
+            self.vectors, self.norms = vectors, norms
+            next_id = self.next_id
+            self._reset(capacity)
+            self.next_id = next_id
+            for row in rows:
+                self._index(row)
+            self.log = open(self._file("rows.jsonl"), "a", encoding="utf-8")
+            # 进行中的搜索仍持有旧文件的映射, 删除目录项不影响读取
+            for path in old:
+                os.remove(path)
+            after = self.disk_bytes()
+        LOGGER.info(f"Compacted {self.path} to {len(rows)} rows, reclaimed {before - after} bytes")
+        return before - after
+
+    def close(self):
+        with self.lock:
+            self.log.close()
+            self.vectors.flush()
+            self.norms.flush()
+
+
+class NumpyStore(VectorStore):
+    """
+    VectorStore 的内存映射 NumPy 实现, 精确搜索 (召回率 100%), 适合中小规模集合与分组;
+    启动时只映射向量文件并回放行日志。
+
+    Args:
+        path (`str`):
+            数据目录, 每个集合一个子目录。
+        dimension (`int`):
+            新集合使用的向量维度。
+    """
+
+    def __init__(self, path=NUMPY_STORE_PATH, dimension=VECTOR_DIMENSION):
+        self.path = path
+        super().__init__()
+        self.dimension = dimension
+        self.lock = threading.Lock()
+        self.collections = {}
+        self.md5_indexes = {}
+        self.phash_indexes = PhashIndexes(self)
+        self.add_listener(self.phash_indexes.on_change)
+        os.makedirs(path, exist_ok=True)
+
+    def _dir(self, collection_name):
+        return os.path.join(self.path, collection_name)
+
+    def collection(self, collection_name):
+        with self.lock:
+            collection = self.collections.get(collection_name)
+            if collection is None:
+                if not os.path.exists(os.path.join(self._dir(collection_name), "meta.json")):
+                    raise KeyError(f"Collection {collection_name} does not exist")
+                collection = NumpyCollection(self._dir(collection_name))
+                self.collections[collection_name] = collection
+            return collection
+
+    def md5_index(self, collection_name):
+        with self.lock:
+            index = self.md5_indexes.get(collection_name)
+        if index is None:
+            index = Md5Index()
+            collection = self.collection(collection_name)
+            with collection.lock:
+                for position in np.flatnonzero(collection.alive[:collection.count]):
+                    index.add(collection.rows[position])
+            with self.lock:
+                index = self.md5_indexes.setdefault(collection_name, index)
+        return index
+
+    def init_default(self):
+        if not self.has_collection(DEFAULT_TABLE):
+            self.create_collection(DEFAULT_TABLE)
+        self.md5_index(DEFAULT_TABLE)
+        if PHASH:
+            # 感知哈希索引在启动时构建, 不在第一次上传的请求中遍历集合
+            self.phash_indexes.index(DEFAULT_TABLE)
+
+    def has_collection(self, collection_name):
+        return os.path.exists(os.path.join(self._dir(collection_name), "meta.json"))
+
+    def create_collection(self, collection_name, dimension=None, storage=None, **kwargs):
+        # 索引与分区参数对精确搜索没有意义, 忽略
+        if self.has_collection(collection_name):
+            return "OK"
+        storage, _ = storage_settings(collection_name, storage, 0)
+        with self.lock:
+            self.collections[collection_name] = NumpyCollection.create(
+                self._dir(collection_name), dimension or self.dimension, storage)
+        LOGGER.debug(f"Created numpy collection: {collection_name}")
+        return "OK"
+
+    def delete_collection(self, collection_name):
+        with self.lock:
+            collection = self.collections.pop(collection_name, None)
+            self.md5_indexes.pop(collection_name, None)
+        if collection is not None:
+            collection.close()
+        shutil.rmtree(self._dir(collection_name), ignore_errors=True)
+        self.notify(collection_name, removed=None)
+        return "ok"
+
+    def load(self, collection_name):
+        # 写入即可搜索, 不需要加载
+        pass
+
+    def collection_dimension(self, collection_name):
+        return self.collection(collection_name).dimension
+
+    def has_group_field(self, collection_name):
+        # 分组只保存在 meta 中
+        return False
+
+    def index_type(self, collection_name):
+        return "FLAT"
+
+    def insert(self, collection_name, path, vectors, group, extra, md5s=None, uuids=None):
+        if uuids is None:
+            uuids = generate_uuids(len(path))
+        index = self.md5_index(collection_name)
+        rows = []
+        added = {}
+        for i, vector in enumerate(vectors):
+            md5 = md5s[i] if md5s is not None else get_file_md5(path[i])
+            row = make_row(path[i], vector, uuids[i], md5 or "", group, extra)
+            # 同一批中重复的文件也只写入一次
+            existing = (index.lookup(md5) or ([added[md5]] if md5 in added else [])) if md5 else []
+            if existing:
+                LOGGER.debug(f"File already exists: {path[i]} {md5}")
+                row["uuid"] = existing[0]["uuid"]
+                row["meta"] = existing[0]["meta"]
+            else:
+                added[md5 or row["uuid"]] = row
+            rows.append(row)
+        if added:
+            self.insert_rows(collection_name, list(added.values()))
+        return rows
+
+    def insert_rows(self, collection_name, rows):
+        if len(rows) == 0:
+            return 0
+        with span("store_insert"):
+            self.collection(collection_name).append(rows)
+        index = self.md5_index(collection_name)
+        for row in rows:
+            index.add(row)
+        self.notify(collection_name, added=rows)
+        return len(rows)
+
+    def search_vectors(self, collection_name, vectors, top_k, group, search_params=None):
+        with span("store_search"):
+            return self.collection(collection_name).search(vectors, top_k, group or None)
+
+    def get(self, collection_name, ids, output_fields=("id", "uuid", "md5", "meta")):
+        collection = self.collection(collection_name)
+        with collection.lock:
+            positions = [collection.position_of.get(int(id)) for id in ids]
+            return [collection.project(position, output_fields) for position in positions
+                    if position is not None and collection.alive[position]]
+
+    def get_by_uuids(self, collection_name, uuids, output_fields=("id", "uuid", "md5", "meta")):
+        collection = self.collection(collection_name)
+        results = []
+        with collection.lock:
+            for uuid in dict.fromkeys(uuids):
+                positions = collection.by_uuid.get(uuid)
+                if positions:
+                    results.append(collection.project(positions[0], output_fields))
+        return results
+
+    def image_location(self, collection_name, uuid):
+        found = self.get_by_uuids(collection_name, [uuid], ("uuid", "md5", "meta"))
+        if len(found) == 0 or "ext" not in found[0]["meta"]:
+            return None
+        return row_location(uuid, found[0]["md5"], found[0]["meta"])
+
+    def find_md5(self, collection_name, md5, group=None):
+        return self.md5_index(collection_name).lookup(md5, group)
+
+    def list_collections(self):
+        return [name for name in sorted(os.listdir(self.path)) if self.has_collection(name)]
+
+    def referenced_md5s(self, md5s):
+        md5s = {md5 for md5 in md5s if md5}
+        found = set()
+        for collection_name in self.list_collections():
+            index = self.md5_index(collection_name)
+            found.update(md5 for md5 in md5s if index.contains(md5))
+        return found
+
+    def existing_md5s(self, collection_name, md5s):
+        index = self.md5_index(collection_name)
+        return {md5 for md5 in set(md5s) if md5 and index.contains(md5)}
+
+    def drop_uuid(self, collection_name, uuid, group):
+        LOGGER.info(f"Dropping Image UUID : {uuid} , Group {group}")
+        removed = self.collection(collection_name).delete(uuid, group)
+        self.md5_index(collection_name).remove_uuid(uuid, group)
+        self.notify(collection_name, removed=removed)
+
+    def drop_uuids(self, collection_name, uuids, group=None):
+        with span("store_delete"):
+            removed = self.collection(collection_name).delete_uuids(uuids, group)
+        self._forget_rows(collection_name, removed)
+        return removed
+
+    def drop_group(self, collection_name, group):
+        with span("store_delete"):
+            removed = self.collection(collection_name).delete_group(group)
+        self._forget_rows(collection_name, removed)
+        return removed
+
+    def _forget_rows(self, collection_name, removed):
+        index = self.md5_index(collection_name)
+        for uuid, group in {(row["uuid"], row["meta"].get("group")) for row in removed}:
+            index.remove_uuid(uuid, group)
+        LOGGER.info(f"Dropped {len(removed)} rows from {collection_name}")
+        self.notify(collection_name, removed=removed)
+
+    def deleted_rows(self, collection_name):
+        return self.collection(collection_name).deleted
+
+    def compact(self, collection_name):
+        with span("store_compact"):
+            return {"reclaimed_bytes": self.collection(collection_name).compact()}
+
+    def iterate(self, collection_name, output_fields, group=None, after_id=None, limit=None,
+                batch_size=EXPORT_BATCH_SIZE):
+        positions, ids, rows, vectors = self.collection(collection_name).snapshot(group)
+        if after_id is not None:
+            # id 随行号单调递增
+            positions = positions[ids[positions] > int(after_id)]
+        if limit is not None:
+            positions = positions[:limit]
+        for start in range(0, len(positions), batch_size):
+            yield [project_row(rows[position], vectors, position, output_fields)
+                   for position in positions[start:start + batch_size].tolist()]
+
+    def group_counts(self, collection_name, rebuild=False):
+        collection = self.collection(collection_name)
+        with collection.lock:
+            return {group: len(positions) for group, positions in collection.groups.items() if group is not None}
+
+    def count(self, collection_name):
+        collection = self.collection(collection_name)
+        return int(np.count_nonzero(collection.alive[:collection.count]))
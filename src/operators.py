@@ -1,85 +1,153 @@
+import asyncio
 import hashlib
-import sys
+import json
+import os
 import uuid
-from glob import glob
-from diskcache import Cache
-from config import DEFAULT_TABLE
+from blob_store import BLOB_STORE, blob_key, thumbnail_key
+from concurrency import run_inference, run_milvus, run_io
+from config import DEFAULT_TABLE, UPLOAD_PATH, PHASH, PHASH_DISTANCE, THUMBNAIL_SIZE
 from logs import LOGGER
+from metrics import DUPLICATES, span
+from phash import content_hash, format_hash
+from preprocess import make_thumbnail
 
 
-def do_upload(table_name, img_path, model, milvus_client, group, extra):
+async def do_upload(table_name, content, ext, model, milvus_client, group, extra, md5=None, save=True):
+    """
+    直接对内存中的图片字节做去重、推理和写入, 新图片只写一次最终文件 <uuid>.<ext>
+    :param content: 图片文件内容
+    :param save: 为 False 时不保存图片文件
+    """
+    # 推理与 Milvus 调用分别在各自的线程池中执行, 不阻塞事件循环
     try:
         if not table_name:
             table_name = DEFAULT_TABLE
-        fileMd5 = get_file_md5(img_path)
-        if fileMd5 is not None:
-            # 文件存在
-            filter = f"md5 == \"{fileMd5}\""
-            if group is not None:
-                filter += f" and meta[\"group\"] == \"{group}\""
-            resList = milvus_client.client.query(filter=filter, collection_name=table_name,
-                                                 output_fields=["uuid", "meta", "md5"])
-            if len(resList) > 0:
-                print(f"MD5 {fileMd5}| 文件存在")
-                return resList
-
-        milvus_client.create_collection(table_name)
-        feat = model.image_extract_feat(img_path)
-        data = milvus_client.insert(table_name, [img_path], [feat], group, extra)
+        # md5 由调用方根据上传内容计算一次后传入
+        if md5 is None:
+            with span("md5"):
+                md5 = hashlib.md5(content).hexdigest()
+        fileMd5 = md5
+        # 多进程部署时 find_md5 / find_similar 是对索引进程的同步调用, 不能在事件循环中直接执行
+        resList = await run_milvus(milvus_client.find_md5, table_name, fileMd5, group)
+        if len(resList) > 0:
+            LOGGER.debug(f"MD5 {fileMd5}| 文件存在")
+            DUPLICATES.labels("md5").inc()
+            return resList
+        # 感知哈希: 重新编码/缩放的副本在推理前按汉明距离识别, 新图片的哈希随行保存
+        if PHASH:
+            with span("phash"):
+                imageHash = await run_inference(content_hash, content)
+            if PHASH_DISTANCE >= 0:
+                resList = await run_milvus(milvus_client.find_similar, table_name, imageHash, group)
+                if len(resList) > 0:
+                    LOGGER.debug(f"MD5 {fileMd5}| 近似重复 {resList[0]['uuid']} 距离 {resList[0]['distance']}")
+                    DUPLICATES.labels(PHASH).inc()
+                    return resList
+            extra = merge_extra(extra, {PHASH: format_hash(imageHash)})
+
+        imageUuid = generate_uuids(1)[0]
+        img_path = os.path.join(UPLOAD_PATH, f"{imageUuid}.{ext}")
+        if save:
+            # 按内容寻址保存, 相同内容只有一个文件
+            key = blob_key(fileMd5, ext)
+            img_path = BLOB_STORE.path(key)
+            extra = merge_extra(extra, {"blob": key})
+        await run_milvus(milvus_client.create_collection, table_name)
+        feat = await run_inference(model.image_extract_feat, content)
+        data = await run_milvus(milvus_client.insert, table_name, [img_path], [feat], group, extra, md5s=[fileMd5],
+                                uuids=[imageUuid])
+        # 其他分组中已有相同文件时不会新写入, 也就不需要保存
+        if save and data[0]["uuid"] == imageUuid:
+            await run_io(BLOB_STORE.put, key, content)
+            if THUMBNAIL_SIZE > 0:
+                await save_thumbnail(fileMd5, content)
         return data
     except Exception as e:
+        # 由调用方返回错误, 单张图片失败不应结束整个服务进程
         LOGGER.error(f"Error with upload : {e}")
-        sys.exit(1)
+        raise
 
 
-def extract_features(img_dir, model):
-    img_list = []
-    for path in ['/*.png', '/*.jpg', '/*.jpeg', '/*.PNG', '/*.JPG', '/*.JPEG']:
-        img_list.extend(glob(img_dir + path))
+async def save_thumbnail(md5, content):
+    # 缩略图失败不影响上传结果, 下载缩略图时会再生成
     try:
-        if len(img_list) == 0:
-            raise FileNotFoundError(
-                f"There is no image file in {img_dir} and endswith ['/*.png', '/*.jpg', '/*.jpeg', '/*.PNG', '/*.JPG', '/*.JPEG']")
-        cache = Cache('./tmp')
-        feats = []
-        names = []
-        total = len(img_list)
-        cache['total'] = total
-        for i, img_path in enumerate(img_list):
-            try:
-                norm_feat = model.image_extract_feat(img_path)
-                feats.append(norm_feat)
-                names.append(img_path)
-                cache['current'] = i + 1
-                print(f"Extracting feature from image No. {i + 1} , {total} images in total")
-            except Exception as e:
-                LOGGER.error(f"Error with extracting feature from image:{img_path}, error: {e}")
-                continue
-        return feats, names
+        if not BLOB_STORE.exists(thumbnail_key(md5)):
+            thumbnail = await run_inference(make_thumbnail, content)
+            await run_io(BLOB_STORE.put, thumbnail_key(md5), thumbnail)
     except Exception as e:
-        LOGGER.error(f"Error with extracting feature from image {e}")
-        sys.exit(1)
+        LOGGER.warning(f"Failed to generate thumbnail for {md5}: {e}")
+
 
+def merge_extra(extra, values):
+    """把附加字段合并到上传的 extra (JSON 字符串或 dict) 中, 由 make_row 写入 meta"""
+    extra = json.loads(extra) if isinstance(extra, str) and extra else dict(extra or {})
+    extra.update(values)
+    return extra
 
-def do_load(table_name, image_dir, model, milvus_client):
+
+def do_load(table_name, image_dir, model, milvus_client, group=None, extra=None, recursive=False):
+    # 流水线导入: 并行解码 + 批量推理 + 批量写入
+    from ingest import IngestPipeline
     if not table_name:
         table_name = DEFAULT_TABLE
-    milvus_client.create_collection(table_name)
-    vectors, paths = extract_features(image_dir, model)
-    data = milvus_client.insert(table_name, paths, vectors)
-    return data
+    pipeline = IngestPipeline(model, milvus_client, table_name, group, extra)
+    return pipeline.run(image_dir, recursive)
 
 
-def do_search(table_name, img_path, top_k, model, milvus_client, group):
+async def do_search(table_name, image, top_k, model, milvus_client, group, cache=None, search_params=None):
+    # image 可以是内存中的图片字节, 搜索全程不落盘
     try:
         if not table_name:
             table_name = DEFAULT_TABLE
-        feat = model.image_extract_feat(img_path)
-        searchData = milvus_client.search_vectors(table_name, [feat], top_k, group)
+        md5 = None
+        if cache is not None and isinstance(image, (bytes, bytearray)):
+            # 相同图片重复搜索时跳过推理, 短时间内直接复用结果
+            with span("md5"):
+                md5 = hashlib.md5(image).hexdigest()
+            # 请求级搜索参数不同会改变结果, 只有默认参数时使用结果缓存
+            searchData = cache.get_results(table_name, md5, group, top_k) if not search_params else None
+            if searchData is not None:
+                return searchData
+        feat = cache.get_embedding(md5) if md5 is not None else None
+        if feat is None:
+            feat = await run_inference(model.image_extract_feat, image)
+            if md5 is not None:
+                cache.put_embedding(md5, feat)
+        searchData = await run_milvus(milvus_client.search_vectors, table_name, [feat], top_k, group, search_params)
+        if md5 is not None and not search_params:
+            cache.put_results(table_name, md5, group, top_k, searchData)
         return searchData
     except Exception as e:
         LOGGER.error(f"Error with search : {e}")
-        sys.exit(1)
+        raise
+
+
+async def do_batch_search(table_name, images, top_k, model, milvus_client, group, cache=None, search_params=None):
+    """
+    多张图片一次搜索: 并行解码后由微批调度器合批推理, 再用一次 Milvus search 查询全部向量
+    :return: 与 images 顺序一致的列表, 元素为该图片的搜索结果或异常
+    """
+    if not table_name:
+        table_name = DEFAULT_TABLE
+
+    async def embed(image):
+        md5 = hashlib.md5(image).hexdigest() if cache is not None else None
+        feat = cache.get_embedding(md5) if md5 is not None else None
+        if feat is None:
+            feat = await run_inference(model.image_extract_feat, image)
+            if md5 is not None:
+                cache.put_embedding(md5, feat)
+        return feat
+
+    feats = await asyncio.gather(*(embed(image) for image in images), return_exceptions=True)
+    valid = [i for i, feat in enumerate(feats) if not isinstance(feat, BaseException)]
+    results = list(feats)
+    if valid:
+        searchData = await run_milvus(milvus_client.search_vectors, table_name, [feats[i] for i in valid], top_k,
+                                      group, search_params)
+        for i, hits in zip(valid, searchData):
+            results[i] = hits
+    return results
 
 
 def do_count(table_name, milvus_cli):
@@ -92,7 +160,7 @@ def do_count(table_name, milvus_cli):
         return num
     except Exception as e:
         LOGGER.error(f"Error with count table {e}")
-        sys.exit(1)
+        raise
 
 
 def do_drop(table_name, milvus_cli):
@@ -105,7 +173,7 @@ def do_drop(table_name, milvus_cli):
         return status
     except Exception as e:
         LOGGER.error(f"Error with drop table: {e}")
-        sys.exit(1)
+        raise
 
 
 def drop_image(table_name, uuid: str, milvus_cli, group):
@@ -114,6 +182,20 @@ def drop_image(table_name, uuid: str, milvus_cli, group):
     return milvus_cli.drop_uuid(collection_name=table_name, uuid=uuid, group=group)
 
 
+def drop_images(table_name, milvus_cli, uuids=None, group=None):
+    """
+    批量删除, 没有 uuids 时删除整个分组, 图片文件由后台清理
+    :return: 删除的行数
+    """
+    if not table_name:
+        table_name = DEFAULT_TABLE
+    if uuids:
+        removed = milvus_cli.drop_uuids(table_name, uuids, group)
+    else:
+        removed = milvus_cli.drop_group(table_name, group)
+    return len(removed)
+
+
 def generate_uuids(length):
     """生成指定长度的 UUID 数组"""
     return [str(uuid.uuid4()) for _ in range(length)]
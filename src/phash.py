@@ -0,0 +1,245 @@
+"""
+感知哈希近似去重: 缩小解码后计算 64 位 dHash / pHash, 保存在行的 meta 中,
+按汉明距离用 BK 树查找, 重新编码、缩放或去掉元数据的副本在推理前即可识别。
+"""
+import threading
+
+import cv2
+import numpy as np
+
+from config import PHASH, PHASH_DISTANCE
+from logs import LOGGER
+from preprocess import decode_image
+
+# 计算哈希只需要 32x32 的灰度图, JPEG 按 1/8 解码即可
+PHASH_DECODE_SIDE = 32
+
+
+def dhash(gray):
+    # 相邻像素的亮度梯度符号
+    small = cv2.resize(gray, (9, 8), interpolation=cv2.INTER_AREA).astype(np.int16)
+    return pack_bits(small[:, 1:] > small[:, :-1])
+
+
+def phash(gray):
+    # 32x32 DCT 的左上 8x8 低频系数与中位数比较, 对缩放和重新压缩更稳定
+    small = cv2.resize(gray, (32, 32), interpolation=cv2.INTER_AREA).astype(np.float32)
+    low = cv2.dct(small)[:8, :8].flatten()
+    return pack_bits(low > np.median(low[1:]))
+
+
+HASHES = {"dhash": dhash, "phash": phash}
+
+
+def pack_bits(bits):
+    return int.from_bytes(np.packbits(np.asarray(bits).flatten()).tobytes(), "big")
+
+
+def image_hash(image, algorithm=PHASH):
+    """
+    :param image: BGR 或灰度 ndarray
+    :return: 64 位整数
+    """
+    gray = image if image.ndim == 2 else cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    return HASHES[algorithm](gray)
+
+
+def content_hash(content, algorithm=PHASH):
+    """
+    图片字节 -> 64 位整数, 按最小分辨率灰度解码, 比完整解码快得多
+    """
+    return image_hash(decode_image(content, min_side=PHASH_DECODE_SIDE, grayscale=True), algorithm)
+
+
+def format_hash(value):
+    return f"{value:016x}"
+
+
+def row_hash(row, algorithm=PHASH):
+    # 行 meta 中保存的哈希, 没有时返回 None
+    value = row.get("meta", {}).get(algorithm)
+    return int(value, 16) if value else None
+
+
+class BKTree:
+    """
+    以汉明距离为度量的 BK 树, 节点为 [哈希, 条目列表, {距离: 子节点}]。
+    查询时按三角不等式剪枝, 只访问距离在 [d - r, d + r] 内的子树。
+    """
+
+    def __init__(self):
+        self.root = None
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def add(self, value, item):
+        self.size += 1
+        if self.root is None:
+            self.root = [value, [item], {}]
+            return
+        node = self.root
+        while True:
+            distance = (value ^ node[0]).bit_count()
+            if distance == 0:
+                node[1].append(item)
+                return
+            child = node[2].get(distance)
+            if child is None:
+                node[2][distance] = [value, [item], {}]
+                return
+            node = child
+
+    def search(self, value, max_distance):
+        """
+        :return: [(distance, item)], 按距离升序
+        """
+        results = []
+        stack = [self.root] if self.root is not None else []
+        while stack:
+            node = stack.pop()
+            distance = (value ^ node[0]).bit_count()
+            if distance <= max_distance:
+                results.extend((distance, item) for item in node[1])
+            for child_distance, child in node[2].items():
+                if distance - max_distance <= child_distance <= distance + max_distance:
+                    stack.append(child)
+        results.sort(key=lambda result: result[0])
+        return results
+
+    def remove(self, value, predicate):
+        # 删除哈希等于 value 且满足 predicate 的条目, 节点本身保留以维持树结构
+        node = self.root
+        while node is not None:
+            distance = (value ^ node[0]).bit_count()
+            if distance == 0:
+                kept = [item for item in node[1] if not predicate(item)]
+                self.size -= len(node[1]) - len(kept)
+                node[1] = kept
+                return
+            node = node[2].get(distance)
+
+
+class PhashIndex:
+    """
+    一个集合的感知哈希索引, 条目与 Md5Index 相同: (id, uuid, md5, meta)。
+    构建期间 (ready 未设置) 同步的删除会被记下, 遍历结束后再执行一次, 遍历读到的旧行不会残留。
+    """
+
+    def __init__(self, algorithm=PHASH):
+        self.algorithm = algorithm
+        self.lock = threading.Lock()
+        self.tree = BKTree()
+        # 已加入的行 id, 构建遍历与变更同步可能加入同一行
+        self.ids = set()
+        self.ready = threading.Event()
+        self.removed_while_loading = []
+
+    def __len__(self):
+        return len(self.tree)
+
+    def add(self, row):
+        value = row_hash(row, self.algorithm)
+        if value is None:
+            return
+        with self.lock:
+            if row.get("id") is not None:
+                if row["id"] in self.ids:
+                    return
+                self.ids.add(row["id"])
+            self.tree.add(value, (row.get("id"), row["uuid"], row.get("md5", ""), row["meta"]))
+
+    def remove(self, row):
+        value = row_hash(row, self.algorithm)
+        if value is None:
+            return
+        with self.lock:
+            if not self.ready.is_set():
+                self.removed_while_loading.append(row)
+            self._remove(value, row)
+
+    def _remove(self, value, row):
+        group = row["meta"].get("group")
+
+        def matches(entry):
+            if entry[1] == row["uuid"] and entry[3].get("group") == group:
+                self.ids.discard(entry[0])
+                return True
+            return False
+
+        self.tree.remove(value, matches)
+
+    def finish_loading(self):
+        with self.lock:
+            for row in self.removed_while_loading:
+                self._remove(row_hash(row, self.algorithm), row)
+            self.removed_while_loading = []
+            self.ready.set()
+
+    def lookup(self, value, group=None, max_distance=PHASH_DISTANCE):
+        """
+        :return: 与 Md5Index.lookup 结构一致的列表, 另含 distance, 按距离升序
+        """
+        with self.lock:
+            found = self.tree.search(value, max_distance)
+        return [{"id": id, "uuid": uuid, "md5": md5, "meta": meta, "distance": distance}
+                for distance, (id, uuid, md5, meta) in found if group is None or meta.get("group") == group]
+
+
+class PhashIndexes:
+    """
+    向量存储的各集合感知哈希索引: 首次查询时遍历集合构建, 之后由变更监听器同步。
+
+    Args:
+        store (`VectorStore`):
+            提供 iterate 的向量存储。
+    """
+
+    def __init__(self, store, algorithm=PHASH):
+        self.store = store
+        self.algorithm = algorithm
+        self.lock = threading.Lock()
+        self.indexes = {}
+
+    def index(self, collection_name):
+        # 先注册再遍历, 遍历期间的写入与删除由 on_change 同步; 其他调用方等待构建完成
+        with self.lock:
+            index = self.indexes.get(collection_name)
+            building = index is None
+            if building:
+                index = PhashIndex(self.algorithm)
+                self.indexes[collection_name] = index
+        if building:
+            try:
+                if self.store.has_collection(collection_name):
+                    for rows in self.store.iterate(collection_name, ["id", "uuid", "md5", "meta"]):
+                        for row in rows:
+                            index.add(row)
+                LOGGER.info(f"Loaded {self.algorithm} index of {collection_name} with {len(index)} rows")
+            except Exception:
+                with self.lock:
+                    if self.indexes.get(collection_name) is index:
+                        self.indexes.pop(collection_name)
+                raise
+            finally:
+                index.finish_loading()
+        index.ready.wait()
+        return index
+
+    def lookup(self, collection_name, value, group=None, max_distance=PHASH_DISTANCE):
+        return self.index(collection_name).lookup(value, group, max_distance)
+
+    def on_change(self, collection_name, added, removed):
+        with self.lock:
+            index = self.indexes.get(collection_name)
+            if index is not None and removed is None:
+                # 删除了哪些行未知, 下次查询时重建
+                self.indexes.pop(collection_name)
+                return
+        if index is None:
+            return
+        for row in removed:
+            index.remove(row)
+        for row in added:
+            index.add(row)
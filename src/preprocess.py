@@ -0,0 +1,117 @@
+import hashlib
+import io
+import os
+
+import cv2
+import numpy as np
+
+from config import DECODE_MIN_SIDE, MAX_IMAGE_BYTES, MAX_IMAGE_PIXELS, THUMBNAIL_SIZE
+
+# JPEG 在解码时做 DCT 缩放: 缩小倍数 -> imdecode 标志
+REDUCED_FLAGS = (
+    (8, cv2.IMREAD_REDUCED_COLOR_8),
+    (4, cv2.IMREAD_REDUCED_COLOR_4),
+    (2, cv2.IMREAD_REDUCED_COLOR_2),
+)
+# 灰度解码 (感知哈希) 使用的对应标志
+GRAYSCALE_FLAGS = {
+    8: cv2.IMREAD_REDUCED_GRAYSCALE_8,
+    4: cv2.IMREAD_REDUCED_GRAYSCALE_4,
+    2: cv2.IMREAD_REDUCED_GRAYSCALE_2,
+    1: cv2.IMREAD_GRAYSCALE,
+}
+
+
+def image_header(content):
+    """
+    只读取文件头得到格式与尺寸, 不解码像素
+    :return: (format, width, height), 无法识别时为 (None, 0, 0)
+    """
+    try:
+        from PIL import Image as PILImage
+    except ImportError:
+        return None, 0, 0
+    try:
+        with PILImage.open(io.BytesIO(content)) as img:
+            return img.format, img.width, img.height
+    except PILImage.DecompressionBombError as e:
+        # 超过 Pillow 自身像素上限两倍时 open 直接抛出, 视为超过上限
+        raise ValueError(f"image has too many pixels: {e}")
+    except Exception:
+        return None, 0, 0
+
+
+def reduce_factor(width, height, min_side=DECODE_MIN_SIDE):
+    # 缩小后短边仍不小于 min_side 的最大倍数, 模型输入约 260px, 再大的分辨率只会被 resize 掉
+    for factor, flag in REDUCED_FLAGS:
+        if min(width, height) // factor >= min_side:
+            return factor, flag
+    return 1, cv2.IMREAD_COLOR
+
+
+def decode_image(content, min_side=DECODE_MIN_SIDE, grayscale=False):
+    """
+    把内存中的图片字节解码为 BGR ndarray, 不经过磁盘。
+    远大于模型输入的 JPEG 按 1/2、1/4、1/8 分辨率解码; 超过字节数或像素数上限的图片直接拒绝。
+    :param content: 图片文件内容
+    :param min_side: 缩小解码后短边的下限, <= 0 时总是全分辨率解码
+    :param grayscale: 解码为单通道灰度图
+    :return: BGR (或灰度) ndarray
+    """
+    if len(content) > MAX_IMAGE_BYTES:
+        raise ValueError(f"image is larger than {MAX_IMAGE_BYTES} bytes")
+    fmt, width, height = image_header(content)
+    if width * height > MAX_IMAGE_PIXELS:
+        raise ValueError(f"image has {width}x{height} pixels, more than {MAX_IMAGE_PIXELS}")
+    factor, flag = 1, cv2.IMREAD_COLOR
+    if fmt == "JPEG" and min_side > 0:
+        factor, flag = reduce_factor(width, height, min_side)
+    if grayscale:
+        flag = GRAYSCALE_FLAGS[factor]
+    # 文件头无法识别时由 OPENCV_IO_MAX_IMAGE_PIXELS 限制解码, 解码后按实际尺寸再检查一次
+    image = cv2.imdecode(np.frombuffer(content, dtype=np.uint8), flag)
+    if image is None:
+        raise ValueError("unsupported or corrupt image")
+    height, width = image.shape[:2]
+    if width * height * factor * factor > MAX_IMAGE_PIXELS:
+        raise ValueError(f"image has {width * factor}x{height * factor} pixels, more than {MAX_IMAGE_PIXELS}")
+    return image
+
+
+def make_thumbnail(image, size=THUMBNAIL_SIZE, quality=85):
+    """
+    生成缩略图
+    :param image: BGR ndarray 或图片字节, 字节按缩小分辨率解码
+    :return: 长边不超过 size 的 JPEG 字节
+    """
+    if not isinstance(image, np.ndarray):
+        image = decode_image(image, min_side=size)
+    height, width = image.shape[:2]
+    scale = size / max(height, width)
+    if scale < 1:
+        image = cv2.resize(image, (max(1, round(width * scale)), max(1, round(height * scale))),
+                           interpolation=cv2.INTER_AREA)
+    ok, encoded = cv2.imencode(".jpg", image, [cv2.IMWRITE_JPEG_QUALITY, quality])
+    if not ok:
+        raise ValueError("failed to encode thumbnail")
+    return encoded.tobytes()
+
+
+def load_image(path):
+    """
+    读取文件, 计算 MD5 并解码为 BGR ndarray, 在导入进程池中执行
+    :param path: 图片路径
+    :return: (path, md5, image, error)
+    """
+    try:
+        if os.path.getsize(path) > MAX_IMAGE_BYTES:
+            return path, None, None, f"image is larger than {MAX_IMAGE_BYTES} bytes"
+        with open(path, "rb") as f:
+            content = f.read()
+        md5 = hashlib.md5(content).hexdigest()
+    except Exception as e:
+        return path, None, None, str(e)
+    try:
+        return path, md5, decode_image(content), None
+    except Exception as e:
+        return path, md5, None, str(e)
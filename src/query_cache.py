@@ -0,0 +1,141 @@
+import threading
+import time
+from collections import OrderedDict
+
+from config import EMBEDDING_CACHE_MB, EMBEDDING_CACHE_TTL, RESULT_CACHE_MB, RESULT_CACHE_TTL
+
+
+class LRUCache:
+    """
+    按内存大小限制的 LRU + TTL 缓存, 线程安全。
+
+    Args:
+        max_bytes (`int`):
+            缓存内容的估算总大小上限, 超出后淘汰最久未使用的条目。
+        ttl (`float`):
+            条目存活秒数, <= 0 表示禁用缓存。
+    """
+
+    def __init__(self, max_bytes, ttl):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.items = OrderedDict()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    @property
+    def enabled(self):
+        return self.ttl > 0 and self.max_bytes > 0
+
+    def get(self, key):
+        if not self.enabled:
+            return None
+        with self.lock:
+            item = self.items.get(key)
+            if item is None:
+                self.misses += 1
+                return None
+            value, size, expires = item
+            if expires < time.monotonic():
+                self._remove(key)
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self.items.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value, size):
+        if not self.enabled or size > self.max_bytes:
+            return
+        with self.lock:
+            if key in self.items:
+                self._remove(key)
+            self.items[key] = (value, size, time.monotonic() + self.ttl)
+            self.bytes += size
+            while self.bytes > self.max_bytes:
+                oldest = next(iter(self.items))
+                self._remove(oldest)
+                self.evictions += 1
+
+    def invalidate(self, predicate):
+        # 删除所有 key 满足 predicate 的条目
+        with self.lock:
+            keys = [key for key in self.items if predicate(key)]
+            for key in keys:
+                self._remove(key)
+            self.invalidations += len(keys)
+        return len(keys)
+
+    def _remove(self, key):
+        _, size, _ = self.items.pop(key)
+        self.bytes -= size
+
+    def stats(self):
+        with self.lock:
+            return {
+                "entries": len(self.items),
+                "bytes": self.bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "invalidations": self.invalidations,
+            }
+
+
+class QueryCache:
+    """
+    查询缓存: 上传内容的 MD5 -> 归一化向量, 以及 (集合, md5, 分组, topk) -> 搜索结果。
+    集合发生写入/删除时, 通过 MilvusHelper 的监听器失效受影响分组的搜索结果。
+    """
+
+    # 每条命中结果的估算内存占用
+    HIT_BYTES = 256
+
+    def __init__(self, embedding_mb=EMBEDDING_CACHE_MB, embedding_ttl=EMBEDDING_CACHE_TTL,
+                 result_mb=RESULT_CACHE_MB, result_ttl=RESULT_CACHE_TTL):
+        self.embeddings = LRUCache(int(embedding_mb * 2 ** 20), embedding_ttl)
+        self.results = LRUCache(int(result_mb * 2 ** 20), result_ttl)
+
+    def get_embedding(self, md5):
+        return self.embeddings.get(md5)
+
+    def put_embedding(self, md5, vector):
+        self.embeddings.put(md5, vector, getattr(vector, "nbytes", len(vector) * 4))
+
+    def get_results(self, collection_name, md5, group, top_k):
+        return self.results.get((collection_name, md5, group or "", top_k))
+
+    def put_results(self, collection_name, md5, group, top_k, results):
+        size = sum(len(hits) for hits in results) * self.HIT_BYTES + self.HIT_BYTES
+        self.results.put((collection_name, md5, group or "", top_k), results, size)
+
+    def invalidate(self, collection_name, groups=None):
+        """
+        集合变更后失效搜索结果
+        :param groups: 受影响的分组集合, None 表示未知, 失效该集合的全部结果
+        """
+        if groups is None:
+            return self.results.invalidate(lambda key: key[0] == collection_name)
+        # 不带分组的搜索覆盖所有分组, 任何变更都会影响它
+        affected = {group or "" for group in groups} | {""}
+        return self.results.invalidate(lambda key: key[0] == collection_name and key[2] in affected)
+
+    def on_change(self, collection_name, added, removed):
+        # MilvusHelper 监听器: 根据新增/删除行的分组失效搜索结果
+        if removed is None:
+            return self.invalidate(collection_name)
+        groups = {row["meta"].get("group") for row in list(added) + list(removed)}
+        if groups:
+            return self.invalidate(collection_name, groups)
+        return 0
+
+    def stats(self):
+        return {"embeddings": self.embeddings.stats(), "results": self.results.stats()}
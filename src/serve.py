@@ -0,0 +1,88 @@
+"""
+多进程部署: 一个索引进程独占向量存储 (Milvus Lite 数据库或 NumPy 文件), N 个 uvicorn worker 各自加载模型做推理,
+搜索与写入经本地 IPC 交给索引进程, 向量经共享内存传递。
+
+    python serve.py --workers 4 --port 5000
+"""
+import argparse
+import glob
+import os
+import secrets
+import socket
+import time
+from multiprocessing import get_context
+
+import uvicorn
+
+from config import DATA_PATH, SERVE_WORKERS, VECTOR_DIMENSION
+from logs import LOGGER
+
+
+def run_owner(address, authkey):
+    from encode import ImageModel
+    from index_owner import serve_index
+    from maintenance import Maintenance
+    from vector_store import open_store
+    milvus_cli = open_store(dimension=VECTOR_DIMENSION or ImageModel().dimension)
+    milvus_cli.init_default()
+    # 删除后的文件清理与自动压缩只在索引进程中运行
+    Maintenance(milvus_cli)
+    serve_index(milvus_cli, address, authkey)
+
+
+def wait_for_owner(address, owner, timeout):
+    # 索引进程加载集合与 MD5 索引后才开始监听
+    from index_owner import parse_address
+    target = parse_address(address)
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if not owner.is_alive():
+            raise SystemExit("index owner exited during startup")
+        family = socket.AF_INET if isinstance(target, tuple) else socket.AF_UNIX
+        with socket.socket(family) as sock:
+            try:
+                sock.connect(target)
+                return
+            except OSError:
+                time.sleep(0.2)
+    raise SystemExit(f"index owner did not start within {timeout}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="serve with N inference workers and one index owner")
+    parser.add_argument("--workers", type=int, default=SERVE_WORKERS)
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=5000)
+    parser.add_argument("--address", default=os.path.join(DATA_PATH, "index.sock"),
+                        help="index owner unix socket path or host:port")
+    parser.add_argument("--startup-timeout", type=float, default=600)
+    args = parser.parse_args()
+
+    os.makedirs(DATA_PATH, exist_ok=True)
+    if os.path.exists(args.address):
+        # 上次异常退出留下的 socket 文件
+        os.remove(args.address)
+    # 各进程的 Prometheus 指标写入同一目录, 由任一 worker 的 /metrics 汇总; 清掉上次运行留下的文件
+    metrics_dir = os.environ.setdefault("PROMETHEUS_MULTIPROC_DIR", os.path.join(DATA_PATH, "prometheus"))
+    os.makedirs(metrics_dir, exist_ok=True)
+    for path in glob.glob(os.path.join(metrics_dir, "*.db")):
+        os.remove(path)
+    authkey = os.getenv("INDEX_OWNER_AUTHKEY") or secrets.token_hex(16)
+    owner = get_context("spawn").Process(target=run_owner, args=(args.address, authkey.encode()),
+                                         name="index-owner", daemon=True)
+    owner.start()
+    try:
+        wait_for_owner(args.address, owner, args.startup_timeout)
+        # worker 进程通过环境变量连接索引进程; 推理线程按 worker 数均分 CPU
+        os.environ["INDEX_OWNER_ADDRESS"] = args.address
+        os.environ["INDEX_OWNER_AUTHKEY"] = authkey
+        os.environ.setdefault("INFERENCE_THREADS", str(max(1, (os.cpu_count() or 1) // args.workers)))
+        LOGGER.info(f"Starting {args.workers} workers against index owner {args.address}")
+        uvicorn.run("main:app", host=args.host, port=args.port, workers=args.workers)
+    finally:
+        owner.terminate()
+        owner.join()
+
+
+if __name__ == "__main__":
+    main()
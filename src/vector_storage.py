@@ -0,0 +1,99 @@
+import threading
+
+import numpy as np
+
+# 向量存储精度: float32 为 FLOAT_VECTOR, float16 为 FLOAT16_VECTOR (内存减半)
+STORAGE_DTYPES = {
+    "float32": np.float32,
+    "float16": np.float16,
+}
+
+
+def as_vector(value, dtype=np.float32):
+    """
+    把 Milvus 返回的向量转为 ndarray: FLOAT16_VECTOR 字段以 bytes (或只含一个 bytes 的列表) 返回
+    """
+    if isinstance(value, list) and len(value) == 1 and isinstance(value[0], (bytes, bytearray)):
+        value = value[0]
+    if isinstance(value, (bytes, bytearray)):
+        return np.frombuffer(value, dtype=np.float16).astype(dtype)
+    return np.asarray(value, dtype=dtype)
+
+
+def to_storage(vector, storage):
+    """按集合的存储精度转换向量, 写入与搜索时都需要与字段类型一致"""
+    return np.asarray(vector, dtype=STORAGE_DTYPES[storage])
+
+
+class SignHasher:
+    """
+    二值签名哈希 (SimHash): 固定种子的随机超平面投影后取符号, 打包为 BINARY_VECTOR。
+    模型输出经过 ReLU 后各分量非负, 直接取符号几乎全为 1, 因此先做随机投影;
+    汉明距离近似向量夹角, 用于第一阶段粗筛, 再按原始向量精确重排。
+
+    Args:
+        dimension (`int`):
+            输入向量维度。
+        bits (`int`):
+            哈希位数, 必须是 8 的倍数。
+        seed (`int`):
+            投影矩阵的随机种子, 同一集合的写入与搜索必须一致。
+    """
+
+    def __init__(self, dimension, bits, seed=0):
+        if bits <= 0 or bits % 8 != 0:
+            raise ValueError(f"hash bits must be a positive multiple of 8, got {bits}")
+        self.dimension = dimension
+        self.bits = bits
+        rng = np.random.default_rng(seed)
+        self.projection = rng.standard_normal((dimension, bits)).astype(np.float32)
+
+    def hash(self, vector):
+        return np.packbits(as_vector(vector)[:self.dimension] @ self.projection > 0).tobytes()
+
+    def hash_batch(self, vectors):
+        matrix = np.stack([as_vector(vector)[:self.dimension] for vector in vectors])
+        return [row.tobytes() for row in np.packbits(matrix @ self.projection > 0, axis=1)]
+
+
+_HASHERS = {}
+_HASHERS_LOCK = threading.Lock()
+
+
+def get_hasher(dimension, bits, seed=0):
+    # 投影矩阵较大 (维度 x 位数), 按参数复用
+    key = (dimension, bits, seed)
+    with _HASHERS_LOCK:
+        if key not in _HASHERS:
+            _HASHERS[key] = SignHasher(dimension, bits, seed)
+        return _HASHERS[key]
+
+
+def rerank(query, hits, metric_type, top_k):
+    """
+    用候选的原始向量精确计算距离并取前 top_k, 返回与 MilvusClient.search 相同的命中结构
+    :param hits: 第一阶段的命中, entity 中需包含 embedding
+    """
+    if len(hits) == 0:
+        return []
+    query = as_vector(query)
+    matrix = np.stack([as_vector(hit["entity"]["embedding"]) for hit in hits])
+    metric_type = metric_type.upper()
+    if metric_type == "L2":
+        # 与 Milvus 一致, L2 返回平方距离, 越小越相似
+        distances = np.sum((matrix - query) ** 2, axis=1)
+        order = np.argsort(distances)
+    elif metric_type == "IP":
+        distances = matrix @ query
+        order = np.argsort(-distances)
+    elif metric_type == "COSINE":
+        norms = np.linalg.norm(matrix, axis=1) * (np.linalg.norm(query) or 1.0)
+        distances = (matrix @ query) / np.where(norms > 0, norms, 1.0)
+        order = np.argsort(-distances)
+    else:
+        raise ValueError(f"Unsupported metric type for rerank: {metric_type}")
+    results = []
+    for i in order[:top_k]:
+        entity = {key: value for key, value in hits[i]["entity"].items() if key != "embedding"}
+        results.append({"id": hits[i]["id"], "distance": float(distances[i]), "entity": entity})
+    return results
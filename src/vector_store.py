@@ -0,0 +1,138 @@
+from config import VECTOR_STORE, VECTOR_DIMENSION, PHASH_DISTANCE
+from logs import LOGGER
+
+
+class VectorStore:
+    """
+    向量存储接口, operators.py / main.py / ingest.py 只依赖这些方法。
+
+    行的结构: {"id", "uuid", "md5", "meta", "embedding"}, 分组保存在 meta["group"];
+    搜索结果与 MilvusClient.search 相同: 每个查询向量一个命中列表, 命中为 {"id", "distance", "entity": {"uuid"}}。
+
+    实现: MilvusHelper (Milvus / Milvus Lite), NumpyStore (内存映射 .npy 精确搜索)。
+    """
+
+    # 文件清理与自动压缩 (maintenance.Maintenance), 只在持有存储的进程中启动
+    maintenance = None
+
+    def __init__(self):
+        # 集合变更监听器: listener(collection_name, added_rows, removed_rows)
+        self.listeners = []
+
+    def add_listener(self, listener):
+        self.listeners.append(listener)
+
+    def notify(self, collection_name, added=(), removed=()):
+        # removed 为 None 表示删除了哪些行未知
+        for listener in self.listeners:
+            try:
+                listener(collection_name, added, removed)
+            except Exception as e:
+                LOGGER.error(f"Collection listener failed: {e}")
+
+    def init_default(self):
+        raise NotImplementedError
+
+    def has_collection(self, collection_name):
+        raise NotImplementedError
+
+    def create_collection(self, collection_name, **kwargs):
+        raise NotImplementedError
+
+    def delete_collection(self, collection_name):
+        raise NotImplementedError
+
+    def load(self, collection_name):
+        # 写入后使新数据可搜索
+        raise NotImplementedError
+
+    def collection_dimension(self, collection_name):
+        raise NotImplementedError
+
+    def has_group_field(self, collection_name):
+        raise NotImplementedError
+
+    def insert(self, collection_name, path, vectors, group, extra, md5s=None, uuids=None):
+        raise NotImplementedError
+
+    def insert_rows(self, collection_name, rows):
+        raise NotImplementedError
+
+    def search_vectors(self, collection_name, vectors, top_k, group, search_params=None):
+        raise NotImplementedError
+
+    def get(self, collection_name, ids, output_fields=("id", "uuid", "md5", "meta")):
+        raise NotImplementedError
+
+    def get_by_uuids(self, collection_name, uuids, output_fields=("id", "uuid", "md5", "meta")):
+        raise NotImplementedError
+
+    def image_location(self, collection_name, uuid):
+        raise NotImplementedError
+
+    def find_md5(self, collection_name, md5, group=None):
+        raise NotImplementedError
+
+    def existing_md5s(self, collection_name, md5s):
+        raise NotImplementedError
+
+    def find_similar(self, collection_name, value, group=None, max_distance=PHASH_DISTANCE):
+        # 感知哈希的汉明距离不超过 max_distance 的行, 索引 (phash.PhashIndexes) 由实现在初始化时创建
+        return self.phash_indexes.lookup(collection_name, value, group, max_distance)
+
+    def list_collections(self):
+        raise NotImplementedError
+
+    def referenced_md5s(self, md5s):
+        # 仍被任一集合引用的 md5, 图片文件按内容在所有集合间共用
+        raise NotImplementedError
+
+    def drop_uuid(self, collection_name, uuid, group):
+        raise NotImplementedError
+
+    def drop_uuids(self, collection_name, uuids, group=None):
+        # 批量删除, 返回被删除的行
+        raise NotImplementedError
+
+    def drop_group(self, collection_name, group):
+        raise NotImplementedError
+
+    def deleted_rows(self, collection_name):
+        # 已删除但尚未压缩回收的行数
+        raise NotImplementedError
+
+    def compact(self, collection_name):
+        # 回收已删除行占用的空间, 返回 {"reclaimed_bytes"}
+        raise NotImplementedError
+
+    def maintenance_report(self):
+        return self.maintenance.report() if self.maintenance is not None else None
+
+    def schedule_compaction(self, collection_name):
+        # 不论删除比例, 尽快在后台压缩一次
+        if self.maintenance is None:
+            return False
+        self.maintenance.compactor.schedule(collection_name, force=True)
+        return True
+
+    def iterate(self, collection_name, output_fields, group=None, after_id=None, limit=None, batch_size=None):
+        raise NotImplementedError
+
+    def group_counts(self, collection_name, rebuild=False):
+        raise NotImplementedError
+
+    def count(self, collection_name):
+        raise NotImplementedError
+
+
+def open_store(backend=VECTOR_STORE, dimension=VECTOR_DIMENSION):
+    """
+    按 VECTOR_STORE 创建向量存储: milvus (默认) 或 numpy
+    """
+    if backend == "milvus":
+        from milvus_helpers import MilvusHelper
+        return MilvusHelper(dimension=dimension)
+    if backend == "numpy":
+        from numpy_store import NumpyStore
+        return NumpyStore(dimension=dimension)
+    raise ValueError(f"Unknown vector store: {backend}")